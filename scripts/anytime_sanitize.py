@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Deadline-aware (anytime) connected-component sanitize.
+
+Interactive sanitize has about one frame to answer, but
+algo_connected_components() with adaptive thresholding and a large dilation
+can take seconds on a big crop. Anytime mode works through stages of
+increasing cost and fidelity:
+
+  projection   column projection valleys on a small preview, as edge strips
+  downsampled  connected components on a reduced crop, mask scaled back up
+  full         connected components at full resolution (the real answer)
+
+sanitize_anytime() returns the best mask finished when the budget runs out,
+with the stage it came from. Stages run on the caller's thread, so a server's
+worker pool still bounds the CPU and memory they use. Python can't interrupt
+a running numpy call, so a per-stage cost model (seconds per megapixel,
+learned as results come in) skips stages that can't finish in the time left;
+a stage that overruns its prediction delays the answer by the overrun and
+corrects the model. With background=True the stages run on a thread of their
+own instead and keep going after the deadline, and the returned AnytimeRun
+delivers the refinements.
+
+Most of algo_connected_components()'s time on a large crop is the final
+binary_dilation with disk(r), which is O(pixels * r^2). The stages here run
+the component analysis undilated and dilate with a Euclidean distance
+transform instead (pixels within distance r of the mask, the same set disk(r)
+covers), so the full stage returns the same mask about 10x sooner.
+
+Run: python3 -u scripts/anytime_sanitize.py [crop.png ...] [--budget 16 50 200]
+With no crops given it runs on the public/sanitize-test screenshots.
+"""
+
+import argparse
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from sanitize_algorithms import algo_connected_components, algo_projection_profile, ndimage, strip_mask, warm_up
+
+STAGES = ("projection", "downsampled", "full")
+
+# Defaults mirror analyzeBoxForIntruders() in src/utils/sanitizeBox.js
+DEFAULT_OPTIONS = {
+    "dilation_percent": 2.5,
+    "min_area_ratio": 0.0005,
+    "sensitivity": "medium",
+    "adaptive_threshold": False,
+}
+
+# Longest side of the projection preview / downsampled crop
+PREVIEW_SIDE = 128
+DOWNSAMPLE_SIDE = 384
+
+# Starting cost estimates, seconds per megapixel of the stage's input. Kept
+# optimistic on purpose: an overrun is measured and corrects the rate, while a
+# stage that is always skipped would never be measured at all.
+DEFAULT_RATES = {
+    "projection": 0.005,
+    "downsampled": 0.2,
+    "full": 0.15,
+    "downsampled/adaptive": 0.25,
+    "full/adaptive": 0.25,
+}
+
+
+class StageCostModel:
+    """
+    Per-stage seconds-per-megapixel, an exponential moving average of
+    measured runs. Safe to share between threads.
+    """
+
+    def __init__(self, alpha=0.3, rates=None):
+        self.alpha = alpha
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(stage, options):
+        return f"{stage}/adaptive" if options.get("adaptive_threshold") and stage != "projection" else stage
+
+    def predict(self, stage, options, pixels):
+        with self._lock:
+            return self.rates[self.key(stage, options)] * pixels / 1e6
+
+    def update(self, stage, options, pixels, seconds):
+        if pixels <= 0:
+            return
+        key = self.key(stage, options)
+        with self._lock:
+            self.rates[key] += self.alpha * (seconds / (pixels / 1e6) - self.rates[key])
+
+
+def dilate_disk(mask, radius):
+    """Same pixels as morphology.binary_dilation(mask, morphology.disk(radius))"""
+    if radius <= 0 or not mask.any():
+        return mask
+    return ndimage.distance_transform_edt(~mask) <= radius
+
+
+def connected_components(img_array, dilation=0, dilation_percent=None, **options):
+    """algo_connected_components() with the final dilation done by dilate_disk()"""
+    mask, debug = algo_connected_components(img_array, dilation=0, dilation_percent=None, **options)
+    debug["settings"].update(dilation=dilation, dilation_percent=dilation_percent)
+    if mask is not None:
+        h, w = img_array.shape[:2]
+        # Same radius algo_connected_components() would use
+        radius = int(min(h, w) * dilation_percent / 100) if dilation_percent is not None else dilation
+        mask = dilate_disk(mask, radius)
+        debug["settings"]["actual_dilation_px"] = radius
+    return mask, debug
+
+
+def downsample(img_array, max_side):
+    """Box-reduce by an integer factor so the longest side is <= max_side"""
+    h, w = img_array.shape[:2]
+    factor = -(-max(h, w) // max_side)
+    if factor <= 1:
+        return img_array
+    return np.asarray(Image.fromarray(img_array).reduce(factor))
+
+
+def upscale_mask(mask, shape):
+    """Nearest-neighbour resize of a small mask back to the crop's shape"""
+    if mask is None or mask.shape == tuple(shape):
+        return mask
+    h, w = shape
+    sh, sw = mask.shape
+    return mask[np.ix_(np.arange(h) * sh // h, np.arange(w) * sw // w)]
+
+
+def plan_stages(img_array, options):
+    """
+    [(stage, input pixels, run)] in order; run() returns (mask or None,
+    intruder count) at full resolution. The downsampled stage is dropped when
+    the crop is already small enough that it would not be cheaper.
+    """
+    h, w = img_array.shape[:2]
+    plan = []
+
+    def projection():
+        preview = downsample(img_array, PREVIEW_SIDE)
+        left, right, _ = algo_projection_profile(preview)
+        strips = strip_mask(preview.shape[:2], left, right)
+        count = int(left is not None and left > 0) + int(right is not None and right < preview.shape[1])
+        return (upscale_mask(strips, (h, w)) if count else None), count
+
+    # Reducing the whole crop dominates the projection stage, so it's costed on h * w
+    plan.append(("projection", h * w, projection))
+
+    if max(h, w) > DOWNSAMPLE_SIDE * 1.5:
+        def downsampled():
+            small = downsample(img_array, DOWNSAMPLE_SIDE)
+            scaled = dict(options)
+            if scaled.get("dilation"):
+                # Fixed-pixel dilation shrinks with the crop; percent dilation already scales
+                scaled["dilation"] = max(1, round(scaled["dilation"] * small.shape[1] / w))
+            mask, debug = connected_components(small, **scaled)
+            return upscale_mask(mask, (h, w)), len(debug.get("intruder_components", []))
+
+        factor = -(-max(h, w) // DOWNSAMPLE_SIDE)
+        plan.append(("downsampled", -(-h // factor) * -(-w // factor), downsampled))
+
+    def full():
+        mask, debug = connected_components(img_array, **options)
+        return mask, len(debug.get("intruder_components", []))
+
+    plan.append(("full", h * w, full))
+    return plan
+
+
+class AnytimeRun:
+    """
+    Stages of one crop. With background=True they start on a thread of their
+    own right away; otherwise call run() on the thread that should do the
+    work.
+
+    `latest` is the most refined result so far: a dict with stage, mask,
+    intruders, elapsed (seconds since start) and complete (the full stage is
+    done).
+    """
+
+    def __init__(self, img_array, options, budget, background=False, cost_model=None, on_result=None):
+        self.options = options
+        self.budget = budget
+        self.background = background
+        self.cost_model = cost_model if cost_model is not None else StageCostModel()
+        self.on_result = on_result
+        self.started = time.perf_counter()
+        self.deadline = self.started + budget
+        self.latest = None
+        self.skipped = []
+        self.error = None
+        self._plan = plan_stages(img_array, options)
+        self._changed = threading.Condition()
+        self._cancel = threading.Event()
+        self._done = False
+        if background:
+            threading.Thread(target=self.run, name="anytime-sanitize", daemon=True).start()
+
+    def run(self):
+        """Run the stages on the current thread; errors are kept in `error`"""
+        try:
+            for stage, pixels, compute in self._plan:
+                if self._cancel.is_set():
+                    break
+                remaining = self.deadline - time.perf_counter()
+                # The full stage is always worth finishing in background mode
+                if not (self.background and stage == "full"):
+                    if self.cost_model.predict(stage, self.options, pixels) > remaining:
+                        self.skipped.append(stage)
+                        continue
+
+                stage_started = time.perf_counter()
+                mask, intruders = compute()
+                now = time.perf_counter()
+                self.cost_model.update(stage, self.options, pixels, now - stage_started)
+                if self._cancel.is_set():
+                    break
+
+                result = {
+                    "stage": stage,
+                    "mask": mask,
+                    "intruders": intruders,
+                    "elapsed": now - self.started,
+                    "complete": stage == "full",
+                }
+                with self._changed:
+                    self.latest = result
+                    self._changed.notify_all()
+                if self.on_result is not None:
+                    self.on_result(result)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    @property
+    def done(self):
+        return self._done
+
+    def wait(self, timeout=None):
+        """Block until every stage ran (or timeout); returns `latest`"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._done, timeout)
+        return self.latest
+
+    def wait_deadline(self):
+        """Block until the budget is spent or the full stage is done; returns `latest`"""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self._done or (self.latest is not None and self.latest["complete"]),
+                max(self.deadline - time.perf_counter(), 0),
+            )
+        return self.latest
+
+    def cancel(self):
+        """Stop a background run after the stage that is currently running"""
+        self._cancel.set()
+
+
+def sanitize_anytime(img_array, budget, options=None, background=False, cost_model=None, on_result=None):
+    """
+    Best sanitize mask available within `budget` seconds.
+
+    Returns (result, run). result is a dict with stage (None if not even the
+    projection stage finished in time), mask, intruders, elapsed, complete
+    and skipped. With background=False the stages run on this thread and
+    nothing is left running afterwards; otherwise run.wait() / on_result
+    deliver the refinements made after the deadline.
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    run = AnytimeRun(img_array, options, budget, background, cost_model, on_result)
+    if background:
+        latest = run.wait_deadline()
+    else:
+        run.run()
+        latest = run.latest
+    if run.error is not None:
+        raise run.error
+
+    result = dict(latest) if latest is not None else {
+        "stage": None, "mask": None, "intruders": 0, "complete": False,
+    }
+    result["elapsed"] = time.perf_counter() - run.started
+    result["skipped"] = list(run.skipped)
+    return result, run
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def _agreement(mask, reference, shape):
+    a = mask if mask is not None else np.zeros(shape, dtype=bool)
+    b = reference if reference is not None else np.zeros(shape, dtype=bool)
+    return 1 - np.count_nonzero(a ^ b) / a.size
+
+
+def main():
+    default_images = sorted((Path(__file__).resolve().parent.parent / "public/sanitize-test").glob("*.png"))
+    parser = argparse.ArgumentParser(description="Show what anytime sanitize returns within various budgets")
+    parser.add_argument("images", nargs="*", type=Path, default=default_images)
+    parser.add_argument("--budget", type=float, nargs="+", default=[16, 50, 200, 1000], help="budgets in ms")
+    parser.add_argument("--dilation-percent", type=float, default=2.5)
+    parser.add_argument("--adaptive", action="store_true")
+    args = parser.parse_args()
+
+    warm_up()
+    options = {**DEFAULT_OPTIONS, "dilation_percent": args.dilation_percent, "adaptive_threshold": args.adaptive}
+    cost_model = StageCostModel()
+
+    for path in args.images:
+        img = np.asarray(Image.open(path).convert("RGB"))
+        h, w = img.shape[:2]
+        started = time.perf_counter()
+        reference, _ = algo_connected_components(img, **options)
+        full_ms = (time.perf_counter() - started) * 1000
+        print(f"{path.name} {w}x{h}: full analysis {full_ms:.0f} ms")
+
+        for budget_ms in args.budget:
+            result, _ = sanitize_anytime(img, budget_ms / 1000, options, cost_model=cost_model)
+            print(f"  budget {budget_ms:>6.0f} ms -> {result['stage'] or 'nothing'} "
+                  f"in {result['elapsed'] * 1000:.0f} ms, "
+                  f"{_agreement(result['mask'], reference, (h, w)) * 100:.2f}% pixels agree with full"
+                  + (f" (skipped {', '.join(result['skipped'])})" if result["skipped"] else ""))
+
+
+if __name__ == "__main__":
+    main()
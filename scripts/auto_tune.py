@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Per-project auto-tuning of sanitize parameters, with cached optima.
+
+Today dilation_percent, sensitivity, min_area_ratio, valley_depth_ratio and
+smoothing are picked by eye from the fixed sweep in test_sanitize.py, and
+each sweep point re-runs the whole pipeline. This tuner samples a few boxes
+from a project and searches the parameter space cheaply:
+
+  search    successive halving: many random configurations on a couple of
+            boxes, keep the best third, triple the boxes, repeat; then a
+            golden-section pass over dilation_percent with the rest fixed
+  reuse     each box keeps one AnalysisContext (threshold, closing and labels
+            are computed once for all configurations). The undilated
+            connected-component mask depends only on (sensitivity,
+            min_area_ratio), so it is computed once per pair together with
+            its distance transform. Every dilation_percent is then a
+            threshold on that map, the same pixels disk(r) dilation covers
+            (see anytime_sanitize.dilate_disk)
+
+Each run uses one objective for all of its boxes, in [0, 1] per box:
+
+  - reference  every project in the run has eraseMasks on enough boxes;
+               they were reviewed by a person, so the score is IoU with them
+               (in box coordinates)
+  - proxy      otherwise, on every box: a weighted mean of
+      stability    IoU of the mask with the mask of the box shifted by 1 px
+      agreement    column Dice between the connected-component mask and the
+                   projection-profile strips (smoothing / valley_depth_ratio)
+      edge clear   share of ink in the box's border ring that is masked
+      core intact  share of ink in the box's central half left unmasked
+    Degenerate masks are not rewarded: an empty mask gets 0 for stability
+    (it is trivially stable, so any config that finds nothing would otherwise
+    score 1.0 on a clean box), and a mask covering more than
+    MAX_PROXY_COVERAGE of the box scores 0.
+
+valley_depth_ratio and smoothing only feed the agreement term, so they are
+searched (and cached) only under the proxy objective.
+
+Winners are cached in a JSON file keyed per project (name + image hash) or
+per --font when several projects share a typeface. sanitize_server.py
+--tuned-params serves them: a request with ?tuned=KEY runs with that entry's
+parameters.
+
+Run: python3 -u scripts/auto_tune.py projects/ [--font NAME] [--cache tuned_params.json]
+"""
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+from project_io import box_erase_mask, box_rect, content_hash, crop_box, decode_image, find_projects, load_project
+from sanitize_algorithms import AnalysisContext, algo_connected_components, algo_projection_profile, ndimage, warm_up
+
+TUNE_VERSION = 2
+
+SENSITIVITIES = ("low", "medium", "high")
+# min_area_ratio is searched on a log grid so the cached undilated masks get reused
+MIN_AREA_RATIOS = tuple(np.round(np.logspace(-4, -2, 9), 6).tolist())
+SMOOTHINGS = (1, 3, 5, 7, 9, 11)
+DILATION_RANGE = (0.0, 6.0)
+VALLEY_DEPTH_RANGE = (0.1, 0.6)
+
+# Defaults mirror analyzeBoxForIntruders() in src/utils/sanitizeBox.js and algo_projection_profile()
+DEFAULT_PARAMS = {
+    "dilation_percent": 2.5,
+    "sensitivity": "medium",
+    "min_area_ratio": 0.0005,
+    "valley_depth_ratio": 0.3,
+    "smoothing": 5,
+}
+
+# Parameters only algo_projection_profile() (the proxy's agreement term) reads
+PROJECTION_PARAMS = ("valley_depth_ratio", "smoothing")
+
+PROXY_WEIGHTS = {"stability": 0.25, "agreement": 0.25, "edge_clear": 0.2, "core_intact": 0.3}
+# Masks covering more of the box than this erase the letter itself
+MAX_PROXY_COVERAGE = 0.5
+
+# Boxes with eraseMasks needed before they replace the proxy as the objective
+MIN_REFERENCE_BOXES = 4
+
+
+def _iou(a, b):
+    union = np.count_nonzero(a | b)
+    return 1.0 if union == 0 else np.count_nonzero(a & b) / union
+
+
+def _dice(a, b):
+    total = np.count_nonzero(a) + np.count_nonzero(b)
+    return 1.0 if total == 0 else 2 * np.count_nonzero(a & b) / total
+
+
+class BoxEvaluator:
+    """Scores parameter sets on one box, caching everything parameter-independent"""
+
+    def __init__(self, image, box, reference=None):
+        x0, y0, x1, y1 = box_rect(box)
+        self.crop = crop_box(image, box)
+        # The same box one pixel down and right, for the stability term
+        self.shifted = crop_box(image, {"x": x0 + 1, "y": y0 + 1, "width": x1 - x0, "height": y1 - y0})
+        self.reference = reference
+        self.ctx = AnalysisContext(self.crop)
+        self.shifted_ctx = AnalysisContext(self.shifted)
+        self.pipeline_runs = 0  # connected-component and projection-profile runs
+        self._distances = {}
+        self._strips = {}
+
+        h, w = self.crop.shape[:2]
+        ink = self.ctx.binary
+        ring = max(2, round(min(h, w) * 0.02))
+        border = np.ones((h, w), dtype=bool)
+        border[ring:h - ring, ring:w - ring] = False
+        core = np.zeros((h, w), dtype=bool)
+        core[h // 4:h - h // 4, w // 4:w - w // 4] = True
+        self.border_ink = ink & border
+        self.core_ink = ink & core
+
+    def _distance(self, which, sensitivity, min_area_ratio):
+        """Distance to the undilated intruder mask (None when there are no intruders)"""
+        key = (which, sensitivity, min_area_ratio)
+        if key not in self._distances:
+            img, ctx = (self.crop, self.ctx) if which == "crop" else (self.shifted, self.shifted_ctx)
+            mask, _ = algo_connected_components(img, min_area_ratio=min_area_ratio, sensitivity=sensitivity, ctx=ctx)
+            self.pipeline_runs += 1
+            self._distances[key] = None if mask is None else ndimage.distance_transform_edt(~mask)
+        return self._distances[key]
+
+    def mask(self, params, which="crop"):
+        """The algo_connected_components() mask for params (all False when empty)"""
+        h, w = self.crop.shape[:2]
+        distance = self._distance(which, params["sensitivity"], params["min_area_ratio"])
+        if distance is None:
+            return np.zeros((h, w), dtype=bool)
+        # Same radius algo_connected_components() uses for dilation_percent
+        return distance <= int(min(h, w) * params["dilation_percent"] / 100)
+
+    def strips(self, params):
+        key = (params["smoothing"], params["valley_depth_ratio"])
+        if key not in self._strips:
+            w = self.crop.shape[1]
+            left, right, _ = algo_projection_profile(self.crop, smoothing=params["smoothing"],
+                                                     valley_depth_ratio=params["valley_depth_ratio"], ctx=self.ctx)
+            self.pipeline_runs += 1
+            columns = np.zeros(w, dtype=bool)
+            if left is not None and left > 0:
+                columns[:left] = True
+            if right is not None and right < w:
+                columns[right:] = True
+            self._strips[key] = columns
+        return self._strips[key]
+
+    def terms(self, params):
+        """Proxy terms for params, each in [0, 1]"""
+        mask = self.mask(params)
+        border_total = np.count_nonzero(self.border_ink)
+        core_total = np.count_nonzero(self.core_ink)
+        if np.count_nonzero(mask) > MAX_PROXY_COVERAGE * mask.size:
+            return dict.fromkeys(PROXY_WEIGHTS, 0.0)
+        shifted = self.mask(params, "shifted")
+        return {
+            # An empty mask is trivially stable
+            "stability": _iou(mask[1:, 1:], shifted[:-1, :-1]) if mask.any() else 0.0,
+            "agreement": _dice(mask.any(axis=0), self.strips(params)),
+            "edge_clear": np.count_nonzero(self.border_ink & mask) / border_total if border_total else 1.0,
+            "core_intact": 1 - np.count_nonzero(self.core_ink & mask) / core_total if core_total else 1.0,
+        }
+
+    def score(self, params):
+        if self.reference is not None:
+            return _iou(self.mask(params), self.reference)
+        terms = self.terms(params)
+        return sum(PROXY_WEIGHTS[name] * value for name, value in terms.items())
+
+
+# ============================================================================
+# Search
+# ============================================================================
+def searched(params, objective):
+    """params without the ones that cannot change the objective's score"""
+    if objective == "proxy":
+        return params
+    return {name: value for name, value in params.items() if name not in PROJECTION_PARAMS}
+
+
+def sample_params(rng, objective):
+    return searched({
+        "dilation_percent": round(float(rng.uniform(*DILATION_RANGE)), 2),
+        "sensitivity": str(rng.choice(SENSITIVITIES)),
+        "min_area_ratio": float(rng.choice(MIN_AREA_RATIOS)),
+        "valley_depth_ratio": round(float(rng.uniform(*VALLEY_DEPTH_RANGE)), 3),
+        "smoothing": int(rng.choice(SMOOTHINGS)),
+    }, objective)
+
+
+def mean_score(evaluators, params):
+    return float(np.mean([e.score(params) for e in evaluators]))
+
+
+def successive_halving(evaluators, configs, eta=3, min_boxes=2):
+    """Best config: every rung keeps the top 1/eta on eta times as many boxes"""
+    boxes = min_boxes
+    while len(configs) > 1:
+        subset = evaluators[:min(boxes, len(evaluators))]
+        scores = np.array([mean_score(subset, c) for c in configs])
+        if len(subset) == len(evaluators):
+            return configs[int(np.argmax(scores))]
+        # Stable sort so earlier configs (the defaults come first) win ties
+        keep = np.argsort(-scores, kind="stable")[:max(1, math.ceil(len(configs) / eta))]
+        configs = [configs[i] for i in keep]
+        boxes *= eta
+    return configs[0]
+
+
+def golden_section(func, low, high, tolerance=0.05):
+    """Maximize a unimodal function on [low, high]; returns (x, f(x))"""
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = low, high
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc, fd = func(c), func(d)
+    while b - a > tolerance:
+        if fc >= fd:
+            b, d, fd = d, c, fc
+            c = b - ratio * (b - a)
+            fc = func(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + ratio * (b - a)
+            fd = func(d)
+    return (c, fc) if fc >= fd else (d, fd)
+
+
+def tune(evaluators, objective, n_configs=27, seed=0):
+    """
+    Search the parameter space over the given BoxEvaluators, which must all
+    have been built for `objective` (see project_evaluators()).
+    Returns (params, score, stats).
+    """
+    rng = np.random.default_rng(seed)
+    defaults = searched(DEFAULT_PARAMS, objective)
+    configs = [dict(defaults)] + [sample_params(rng, objective) for _ in range(n_configs - 1)]
+    best = successive_halving(evaluators, configs)
+
+    # Scores on every box, by config; each is computed once
+    full_scores = {}
+
+    def full_score(params):
+        key = tuple(sorted(params.items()))
+        if key not in full_scores:
+            full_scores[key] = mean_score(evaluators, params)
+        return full_scores[key]
+
+    dilation, score = golden_section(lambda value: full_score({**best, "dilation_percent": value}),
+                                     *DILATION_RANGE)
+    # Golden section only sees a piecewise-constant function (radius is an integer), so keep the
+    # halving winner's dilation when it scores at least as well
+    if full_score(best) >= score:
+        score = full_score(best)
+    else:
+        best = {**best, "dilation_percent": round(dilation, 2)}
+    default_score = full_score(defaults)
+
+    # A full sweep runs the pipeline once per box and config: the connected components under the
+    # reference objective, plus the shifted crop and the projection profile under the proxy
+    configs_scored = len({tuple(sorted(c.items())) for c in configs} | set(full_scores))
+    stats = {
+        "objective": objective,
+        "boxes": len(evaluators),
+        "configs": configs_scored,
+        "pipeline_runs": sum(e.pipeline_runs for e in evaluators),
+        "naive_runs": configs_scored * len(evaluators) * (3 if objective == "proxy" else 1),
+        "default_score": default_score,
+    }
+    return best, score, stats
+
+
+def _usable_boxes(project):
+    return [b for b in project["annotations"].get("boxes") or [] if b["width"] >= 8 and b["height"] >= 8]
+
+
+def run_objective(projects):
+    """The objective for a run: reference when every project has eraseMasks on enough boxes, else proxy"""
+    enough = all(sum(1 for b in _usable_boxes(p) if b.get("eraseMask")) >= MIN_REFERENCE_BOXES for p in projects)
+    return "reference" if projects and enough else "proxy"
+
+
+def project_evaluators(project, n_boxes, rng, objective):
+    """BoxEvaluators for up to n_boxes sampled boxes, scored by `objective` (see run_objective())"""
+    boxes = _usable_boxes(project)
+    if not boxes or project["image_bytes"] is None:
+        return []
+    image = decode_image(project["image_bytes"])
+    use_references = objective == "reference"
+    pool = [b for b in boxes if b.get("eraseMask")] if use_references else boxes
+    picks = rng.choice(len(pool), min(n_boxes, len(pool)), replace=False)
+    return [BoxEvaluator(image, pool[i], box_erase_mask(pool[i]) if use_references else None) for i in picks]
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+def load_cache(path):
+    if path.exists():
+        cache = json.loads(path.read_text())
+        if cache.get("version") == TUNE_VERSION:
+            return cache
+    return {"version": TUNE_VERSION, "entries": {}}
+
+
+def cached_params(cache, key):
+    """Tuned parameters stored under key in a load_cache() result, or None"""
+    entry = cache["entries"].get(key)
+    return entry["params"] if entry else None
+
+
+def cache_key(project):
+    return f"{project['name']}:{content_hash(project['image_bytes'] or b'')[:12]}"
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Tune sanitize parameters per project (or font) and cache them")
+    parser.add_argument("projects", nargs="+", help="project ZIPs, project dirs, or dirs containing them")
+    parser.add_argument("--font", help="tune all projects together and cache under this font name")
+    parser.add_argument("--cache", type=Path, default=Path("tuned_params.json"))
+    parser.add_argument("--boxes", type=int, default=12, help="boxes sampled per tuning run")
+    parser.add_argument("--configs", type=int, default=27, help="random configurations entering successive halving")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="re-tune even when the cache has an entry")
+    args = parser.parse_args()
+
+    warm_up()
+    cache = load_cache(args.cache)
+    rng = np.random.default_rng(args.seed)
+    projects = [load_project(p) for p in find_projects(args.projects)]
+
+    if args.font:
+        groups = [(f"font:{args.font}", projects)]
+    else:
+        groups = [(cache_key(p), [p]) for p in projects]
+
+    for key, group in groups:
+        if cached_params(cache, key) is not None and not args.force:
+            print(f"{key}: cached {cached_params(cache, key)}")
+            continue
+
+        started = time.perf_counter()
+        objective = run_objective(group)
+        evaluators = []
+        per_project = max(1, args.boxes // len(group))
+        for project in group:
+            evaluators.extend(project_evaluators(project, per_project, rng, objective))
+        if not evaluators:
+            print(f"{key}: no usable boxes")
+            continue
+
+        params, score, stats = tune(evaluators, objective, n_configs=args.configs, seed=args.seed)
+        elapsed = time.perf_counter() - started
+        print(f"{key}: {params}\n"
+              f"    {stats['objective']} score {score:.3f} (defaults {stats['default_score']:.3f}), "
+              f"{stats['boxes']} boxes, {stats['pipeline_runs']} pipeline runs "
+              f"(a full sweep of {stats['configs']} configs would be {stats['naive_runs']}), {elapsed:.1f} s")
+
+        cache["entries"][key] = {"params": params, "score": score, **stats}
+        args.cache.write_text(json.dumps(cache, indent=2))
+
+
+if __name__ == "__main__":
+    main()
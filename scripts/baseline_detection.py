@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+OCR-free text line and baseline detection for a whole page.
+
+Baseline suggestions come from Tesseract today (processAutoSolveRegions in
+src/utils/autoSolve.js). That means an OCR round trip per region, followed
+by an O(n^2) 5px dedup scan in processSelectedLineGroups. This finds lines and
+baselines from the ink alone, in a few vectorized passes over the
+foreground pixels, using the same row-projection idea as
+algo_row_projection():
+
+  1. skew    rotate foreground coordinates by every candidate angle at once,
+             bincount them into row profiles and keep the angle with the
+             sharpest profile (largest sum of squares); coarse, then fine
+  2. lines   smooth the deskewed row profile and split it into runs of inked
+             rows, also cutting at deep valleys (signal.find_peaks, as in
+             algo_row_projection) so touching lines come apart
+  3. clean   drop lines whose pixels touch the top or bottom of the page
+             (frame edges and cut-off text, not lines), then merge lines
+             whose centres are closer than half the median line pitch
+             (one line split at a deep valley, e.g. x-height vs. caps)
+  4. fit     per line, the baseline is the row in the lower part of the band
+             where ink density drops most sharply (bottom of the x-height;
+             descenders are sparse), and the line extent comes from the min
+             and max x of its pixels
+
+Results use the suggestedBaselines shape from calculateSuggestedBaselines():
+{type: "horizontal", y} when |angle| < 2 degrees, otherwise {type: "angled",
+x0, y0, x1, y1, angle}, with source "projection" and a 0-100 confidence.
+Coordinates are in the image passed in. If the app has imageRotation set,
+pass the rotated page, as autoSolve does.
+
+--compare takes the same {page: suggestedBaselines} JSON --json writes, as
+produced by calculateSuggestedBaselines() from Tesseract, and reports which
+baselines agree; it exits non-zero if any are missed or extra.
+
+Run: python3 -u scripts/baseline_detection.py [page.png ...] [--json out.json] [--overlay out.png]
+                                             [--compare tesseract.json]
+"""
+
+import argparse
+import bisect
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from sanitize_algorithms import AnalysisContext, signal
+
+DEFAULT_PAGE = Path(__file__).resolve().parent.parent / "public/teenage.png"
+
+# Same cutoff calculateSuggestedBaselines() uses between horizontal and angled
+HORIZONTAL_DEGREES = 2.0
+DEDUP_TOLERANCE = 5
+# Lines whose centres are closer than this fraction of the median pitch merge
+MERGE_PITCH_RATIO = 0.5
+
+
+# ============================================================================
+# Skew
+# ============================================================================
+def row_profiles(ys, xs, angles, height_pad):
+    """
+    Row projection of the points at each angle, as an (angles, rows) array.
+    A point's row at angle a is y - x * tan(a), offset by height_pad so it
+    stays non-negative.
+    """
+    slopes = np.tan(np.radians(angles))
+    rows = np.rint(ys[None, :] - xs[None, :] * slopes[:, None]).astype(np.int64) + height_pad
+    n_rows = int(rows.max()) + 1
+    keys = rows + np.arange(len(angles))[:, None] * n_rows
+    return np.bincount(keys.ravel(), minlength=len(angles) * n_rows).reshape(len(angles), n_rows)
+
+
+def estimate_skew(binary, max_angle=5.0, coarse_step=0.5, fine_step=0.05, max_points=200_000, seed=0):
+    """Page skew in degrees (positive = lines fall to the right), and the score per tested angle"""
+    ys, xs = np.nonzero(binary)
+    if ys.size == 0:
+        return 0.0, {}
+    if ys.size > max_points:
+        pick = np.random.default_rng(seed).choice(ys.size, max_points, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    ys, xs = ys.astype(np.float64), xs.astype(np.float64)
+    pad = int(np.ceil(binary.shape[1] * np.tan(np.radians(max_angle + coarse_step)))) + 1
+
+    scores = {}
+    best = 0.0
+    for angles in (np.arange(-max_angle, max_angle + coarse_step / 2, coarse_step), None):
+        if angles is None:
+            angles = best + np.arange(-coarse_step, coarse_step + fine_step / 2, fine_step)
+        # Sharp profiles (ink packed into few rows) have the largest sum of squares
+        profiles = row_profiles(ys, xs, angles, pad).astype(np.float64)
+        sharpness = (profiles ** 2).sum(axis=1)
+        scores.update(zip(np.round(angles, 4).tolist(), sharpness.tolist()))
+        best = float(angles[np.argmax(sharpness)])
+    return best, scores
+
+
+# ============================================================================
+# Lines and baselines
+# ============================================================================
+def find_lines(profile, smoothing=5, ink_ratio=0.02, valley_depth_ratio=0.3, min_height=4):
+    """
+    (start, end) row ranges of text lines in a row profile: runs of rows with
+    ink, additionally split at deep valleys
+    """
+    if smoothing > 1:
+        kernel = np.ones(smoothing) / smoothing
+        smooth = np.convolve(profile, kernel, mode="same")
+    else:
+        smooth = profile.astype(float)
+    peak = smooth.max()
+    if peak == 0:
+        return np.empty((0, 2), dtype=np.int64), smooth
+
+    active = smooth > peak * ink_ratio
+    valleys, _ = signal.find_peaks(peak - smooth, prominence=peak * valley_depth_ratio, distance=min_height)
+    active[valleys] = False
+
+    edges = np.diff(np.concatenate([[False], active, [False]]).astype(np.int8))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    keep = ends - starts >= min_height
+    return np.stack([starts[keep], ends[keep]], axis=1), smooth
+
+
+def line_extents(lines, rows, ys, xs, w):
+    """Per line, (x_min, x_max, y_min, y_max) of the pixels whose deskewed row falls in it"""
+    n = len(lines)
+    x_min, x_max = np.full(n, w, dtype=np.int64), np.full(n, -1, dtype=np.int64)
+    y_min, y_max = np.full(n, np.iinfo(np.int64).max), np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return x_min, x_max, y_min, y_max
+    line_of = np.searchsorted(lines[:, 0], rows, side="right") - 1
+    in_line = (line_of >= 0) & (rows < lines[np.maximum(line_of, 0), 1])
+    np.minimum.at(x_min, line_of[in_line], xs[in_line])
+    np.maximum.at(x_max, line_of[in_line], xs[in_line])
+    np.minimum.at(y_min, line_of[in_line], ys[in_line])
+    np.maximum.at(y_max, line_of[in_line], ys[in_line])
+    return x_min, x_max, y_min, y_max
+
+
+def merge_close_lines(lines, pitch_ratio=MERGE_PITCH_RATIO):
+    """
+    Merge neighbouring lines whose centres are closer than pitch_ratio times
+    the median centre-to-centre pitch. Returns the merged (start, end) ranges
+    and, per merged line, the indices of the input lines it covers.
+    """
+    if len(lines) < 3:
+        return lines, [[i] for i in range(len(lines))]
+    centres = lines.mean(axis=1)
+    gaps = np.diff(centres)
+    close = gaps < np.median(gaps) * pitch_ratio
+
+    groups = [[0]]
+    for i, merge in enumerate(close, start=1):
+        if merge:
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    merged = np.array([[lines[g[0], 0], lines[g[-1], 1]] for g in groups], dtype=lines.dtype)
+    return merged, groups
+
+
+def fit_baselines(smooth, lines, lower_fraction=0.5):
+    """
+    Baseline row per line: where density falls most steeply in the lower part
+    of the band. Vectorized over lines by gathering every band into one
+    padded (lines, max height) array. Returns (rows, confidence 0-100).
+    """
+    if len(lines) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    starts, ends = lines[:, 0], lines[:, 1]
+    heights = ends - starts
+    offsets = np.arange(heights.max())
+    idx = starts[:, None] + offsets[None, :]
+    inside = offsets[None, :] < heights[:, None]
+    padded = np.where(inside, smooth[np.minimum(idx, len(smooth) - 1)], 0.0)
+
+    # drop[i, r] = density lost going from row r to row r + 1 of band i
+    drop = padded - np.concatenate([padded[:, 1:], np.zeros((len(lines), 1))], axis=1)
+    lower = offsets[None, :] >= (heights * (1 - lower_fraction))[:, None]
+    drop = np.where(inside & lower, drop, -np.inf)
+    rows = drop.argmax(axis=1)
+
+    band_peak = padded.max(axis=1)
+    confidence = np.clip(drop[np.arange(len(lines)), rows] / np.maximum(band_peak, 1e-9), 0, 1) * 100
+    return starts + rows, confidence
+
+
+def detect_baselines(img_array, max_angle=5.0, smoothing=5, valley_depth_ratio=0.3, ctx=None):
+    """
+    Lines and baselines of a page.
+
+    Returns (baselines, debug). baselines are suggestedBaselines-style dicts;
+    debug has the skew angle, line ranges (deskewed rows) and the profile.
+    """
+    ctx = ctx if ctx is not None else AnalysisContext(img_array)
+    binary = ctx.binary
+    h, w = binary.shape
+
+    angle, scores = estimate_skew(binary, max_angle=max_angle)
+    slope = np.tan(np.radians(angle))
+
+    # Deskewed row of every foreground pixel (the rows estimate_skew scored)
+    ys, xs = np.nonzero(binary)
+    pad = int(np.ceil(w * abs(slope))) + 1
+    rows = np.rint(ys - xs * slope).astype(np.int64) + pad
+    profile = np.bincount(rows, minlength=h + 2 * pad)
+
+    raw_lines, smooth = find_lines(profile, smoothing=smoothing, valley_depth_ratio=valley_depth_ratio)
+
+    # A band with pixels on the first or last row of the page is a frame edge
+    # or a cut-off line; its "baseline" would sit on the border
+    x_min, x_max, y_min, y_max = line_extents(raw_lines, rows, ys, xs, w)
+    inside = (y_min > 0) & (y_max < h - 1)
+    border_lines = raw_lines[~inside]
+    lines, groups = merge_close_lines(raw_lines[inside])
+    x_min = np.array([x_min[inside][g].min() for g in groups], dtype=np.int64)
+    x_max = np.array([x_max[inside][g].max() for g in groups], dtype=np.int64)
+
+    baseline_rows, confidence = fit_baselines(smooth, lines)
+
+    baselines = []
+    for i, (row, conf) in enumerate(zip(baseline_rows, confidence)):
+        if x_max[i] < x_min[i]:
+            continue
+        # Baseline row r in the deskewed frame is y = r - pad + x * slope in the image
+        x0, x1 = float(x_min[i]), float(x_max[i] + 1)
+        y0, y1 = row - pad + x0 * slope, row - pad + x1 * slope
+        if abs(angle) < HORIZONTAL_DEGREES:
+            baselines.append({"type": "horizontal", "y": float((y0 + y1) / 2),
+                              "source": "projection", "confidence": round(float(conf), 1)})
+        else:
+            baselines.append({"type": "angled", "x0": x0, "y0": float(y0), "x1": x1, "y1": float(y1),
+                              "angle": angle, "source": "projection", "confidence": round(float(conf), 1)})
+
+    return dedupe_baselines(baselines), {
+        "angle": angle,
+        "angle_scores": scores,
+        "lines": (lines - pad).tolist(),
+        "border_lines": (border_lines - pad).tolist(),
+        "merged_lines": sum(len(g) > 1 for g in groups),
+        "row_profile": profile,
+    }
+
+
+def baseline_y(baseline):
+    """Average y of a suggested baseline, the key processSelectedLineGroups dedups on"""
+    if baseline.get("type") == "horizontal" or "y0" not in baseline:
+        return baseline["y"]
+    return (baseline["y0"] + baseline["y1"]) / 2
+
+
+def dedupe_baselines(baselines, tolerance=DEDUP_TOLERANCE):
+    """
+    Drop baselines whose average y is within `tolerance` of one already kept.
+
+    Same rule as processSelectedLineGroups, but candidates are taken in
+    descending confidence (stable, so equal confidences keep input order, as
+    the JS does) and checked against the sorted kept y values with bisect:
+    O(n log n) instead of comparing against every kept baseline.
+    """
+    order = sorted(range(len(baselines)), key=lambda i: -baselines[i].get("confidence", 0))
+    kept_y, kept = [], []
+    for i in order:
+        y = baseline_y(baselines[i])
+        pos = bisect.bisect_left(kept_y, y)
+        if (pos < len(kept_y) and kept_y[pos] - y < tolerance) or (pos > 0 and y - kept_y[pos - 1] < tolerance):
+            continue
+        kept_y.insert(pos, y)
+        kept.append(i)
+    return [baselines[i] for i in sorted(kept)]
+
+
+def compare_baselines(found, reference, tolerance=2 * DEDUP_TOLERANCE):
+    """
+    Pair found baselines with reference (e.g. Tesseract) ones by average y,
+    nearest first, within `tolerance` px. Returns {"matched": [(found_y,
+    reference_y), ...], "missed": [reference_y, ...], "extra": [found_y, ...]}.
+    """
+    found_y = [baseline_y(b) for b in found]
+    reference_y = [baseline_y(b) for b in reference]
+    pairs = sorted((abs(f - r), i, j) for i, f in enumerate(found_y) for j, r in enumerate(reference_y))
+    used_found, used_reference, matched = set(), set(), []
+    for distance, i, j in pairs:
+        if distance > tolerance:
+            break
+        if i in used_found or j in used_reference:
+            continue
+        used_found.add(i)
+        used_reference.add(j)
+        matched.append((found_y[i], reference_y[j]))
+    return {
+        "matched": sorted(matched),
+        "missed": [y for j, y in enumerate(reference_y) if j not in used_reference],
+        "extra": [y for i, y in enumerate(found_y) if i not in used_found],
+    }
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def draw_overlay(img_array, baselines, path):
+    from PIL import ImageDraw
+
+    img = Image.fromarray(img_array).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for b in baselines:
+        if b["type"] == "horizontal":
+            draw.line([(0, b["y"]), (img.width, b["y"])], fill=(255, 40, 40), width=2)
+        else:
+            draw.line([(b["x0"], b["y0"]), (b["x1"], b["y1"])], fill=(255, 40, 40), width=2)
+    img.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect text lines and baselines without OCR")
+    parser.add_argument("pages", nargs="*", type=Path, default=[DEFAULT_PAGE])
+    parser.add_argument("--max-angle", type=float, default=5.0, help="largest skew searched (degrees)")
+    parser.add_argument("--json", type=Path, help="write {page: baselines} here")
+    parser.add_argument("--overlay", type=Path, help="draw baselines over the (first) page into this PNG")
+    parser.add_argument("--compare", type=Path,
+                        help="{page: suggestedBaselines} JSON from calculateSuggestedBaselines (Tesseract) to check against")
+    parser.add_argument("--tolerance", type=float, default=2 * DEDUP_TOLERANCE,
+                        help="max y difference (px) for a --compare match")
+    args = parser.parse_args()
+
+    reference = json.loads(args.compare.read_text()) if args.compare else None
+    failed = False
+
+    results = {}
+    for page in args.pages:
+        img = np.asarray(Image.open(page).convert("RGB"))
+        started = time.perf_counter()
+        baselines, debug = detect_baselines(img, max_angle=args.max_angle)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{page.name} {img.shape[1]}x{img.shape[0]}: skew {debug['angle']:+.2f} deg, "
+              f"{len(debug['lines'])} lines, {len(baselines)} baselines ({elapsed:.0f} ms)")
+        for b in baselines:
+            where = f"y={b['y']:.1f}" if b["type"] == "horizontal" else \
+                f"({b['x0']:.0f},{b['y0']:.1f})-({b['x1']:.0f},{b['y1']:.1f})"
+            print(f"  {b['type']:<10} {where}  confidence {b['confidence']:.0f}")
+        results[page.name] = baselines
+        if args.overlay and len(results) == 1:
+            draw_overlay(img, baselines, args.overlay)
+
+        if reference is not None:
+            if page.name not in reference:
+                print(f"  compare: {page.name} not in {args.compare}")
+                failed = True
+                continue
+            report = compare_baselines(baselines, reference[page.name], args.tolerance)
+            errors = [abs(f - r) for f, r in report["matched"]]
+            print(f"  compare: {len(report['matched'])}/{len(reference[page.name])} reference baselines matched"
+                  + (f", mean |dy| {np.mean(errors):.1f} px" if errors else "")
+                  + "".join(f", missed y={y:.1f}" for y in report["missed"])
+                  + "".join(f", extra y={y:.1f}" for y in report["extra"]))
+            failed |= bool(report["missed"] or report["extra"])
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the sanitize analysis code.
+
+Each measurement runs in a fresh interpreter so import caches don't leak
+between runs:
+
+  eager imports    - the module-level imports test_sanitize.py used to do
+  lazy import      - `import sanitize_algorithms` (numpy only)
+  cold first crop  - fresh process: import, decode and analyze one crop
+  worker ready     - sanitize_worker.py start-up until its "ready" line
+  worker per crop  - round-trip per request once the worker is warm
+
+Run: python3 -u scripts/bench_startup.py [--repeats 5] [--image path.png]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DEFAULT_IMAGE = SCRIPTS_DIR.parent / "public/sanitize-test/Screenshot 2025-11-26 at 19.23.20.png"
+
+EAGER_IMPORTS = """
+import numpy
+from scipy import ndimage
+from scipy.signal import find_peaks
+from skimage import filters, measure, morphology, segmentation
+from skimage.filters import threshold_local
+filters.threshold_otsu, morphology.disk, segmentation.flood
+"""
+
+LAZY_IMPORT = "import sanitize_algorithms"
+
+COLD_FIRST_CROP = """
+import sys
+import numpy as np
+from PIL import Image
+from sanitize_algorithms import algo_connected_components
+img = np.asarray(Image.open(sys.argv[1]).convert('RGB'))
+algo_connected_components(img, dilation_percent=2.5, min_area_ratio=0.0005)
+"""
+
+
+def time_python(code, *args):
+    """Wall-clock seconds for `python -c code` in a fresh interpreter"""
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=SCRIPTS_DIR,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def bench_worker(image, crops):
+    """Return (seconds until ready, [seconds per crop round-trip])"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, str(SCRIPTS_DIR / "sanitize_worker.py")],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        ready = json.loads(proc.stdout.readline())
+        if not ready.get("ready"):
+            raise RuntimeError(f"worker did not start: {ready}")
+        ready_time = time.perf_counter() - started
+
+        per_crop = []
+        for i in range(crops):
+            t0 = time.perf_counter()
+            proc.stdin.write(json.dumps({"id": i, "op": "sanitize", "path": str(image)}) + "\n")
+            proc.stdin.flush()
+            response = json.loads(proc.stdout.readline())
+            if not response.get("ok"):
+                raise RuntimeError(f"worker error: {response.get('error')}")
+            per_crop.append(time.perf_counter() - t0)
+
+        proc.stdin.write(json.dumps({"op": "shutdown"}) + "\n")
+        proc.stdin.flush()
+        proc.wait(timeout=10)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+    return ready_time, per_crop
+
+
+def report(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"  {label:<18} min {min(ms):8.1f} ms   median {statistics.median(ms):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sanitize start-up cost")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--image", type=Path, default=DEFAULT_IMAGE)
+    args = parser.parse_args()
+
+    image = args.image.resolve()
+
+    print("=" * 60)
+    print("SANITIZE STARTUP BENCHMARK")
+    print("=" * 60)
+    print(f"  Image: {image.name}, repeats: {args.repeats}\n")
+
+    report("eager imports", [time_python(EAGER_IMPORTS) for _ in range(args.repeats)])
+    report("lazy import", [time_python(LAZY_IMPORT) for _ in range(args.repeats)])
+    report("cold first crop", [time_python(COLD_FIRST_CROP, str(image)) for _ in range(args.repeats)])
+
+    ready_time, per_crop = bench_worker(image, args.repeats)
+    report("worker ready", [ready_time])
+    report("worker per crop", per_crop)
+
+
+if __name__ == "__main__":
+    main()
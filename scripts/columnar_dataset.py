@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Bulk columnar export of boxes, glyph crops and erase masks for training sets.
+
+Projects are streamed one at a time (ZIP exports or unpacked directories, see
+project_io.py) into a dataset directory:
+
+  <out>/boxes.npz         - box table, one array per column (see BOX_COLUMNS)
+  <out>/glyphs.u8         - (N, S, S) uint8 grayscale glyph tensor, raw bytes
+                            for np.memmap; each crop is fitted into S x S
+                            (aspect kept, centered, padded with 255)
+  <out>/masks.bits        - every eraseMask packed 8 pixels per byte
+                            (np.packbits, row-major), back to back
+  <out>/mask_offsets.npy  - (N + 1) byte offsets into masks.bits
+  <out>/char_index.npz    - rows grouped by character: order + offsets
+  <out>/meta.json         - glyph size, box count, chars, per-project rows
+                            (with the source path and its project_key(),
+                            since stems can repeat across folders)
+
+Masks are stored at their own extent (mask_x/mask_y/mask_w/mask_h), not
+clipped to the box, so ColumnarDataset.project_boxes() rebuilds the boxes
+exactly as annotations.json had them; erase masks come back in the
+maskUtils.js format (0 = keep, 255 = erase).
+
+Glyphs and masks are memory-mapped by the reader, so a dataloader touching a
+random row reads S * S bytes plus that row's packed mask and nothing else.
+
+Run: python3 -u scripts/columnar_dataset.py projects/ --out dataset/ [--glyph-size 64] [--verify]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from integral_histogram import to_gray_uint8
+from project_io import crop_box, decode_image, erase_mask_array, find_projects, load_project, project_key
+
+FORMAT_VERSION = 2
+
+# name -> dtype of each box table column
+BOX_COLUMNS = {
+    "project": np.int32,  # index into meta["projects"]
+    "char": np.int32,  # index into meta["chars"]
+    "x": np.float64,
+    "y": np.float64,
+    "width": np.float64,
+    "height": np.float64,
+    "has_mask": np.bool_,
+    "mask_x": np.int32,
+    "mask_y": np.int32,
+    "mask_w": np.int32,
+    "mask_h": np.int32,
+}
+
+
+def fit_glyph(gray, size):
+    """Fit a grayscale crop into a size x size tile, aspect kept, centered on white"""
+    tile = np.full((size, size), 255, dtype=np.uint8)
+    h, w = gray.shape
+    if h == 0 or w == 0:
+        return tile
+    scale = min(size / w, size / h)
+    nw, nh = max(1, min(size, round(w * scale))), max(1, min(size, round(h * scale)))
+    resized = np.asarray(Image.fromarray(gray).resize((nw, nh), Image.Resampling.BILINEAR))
+    y0, x0 = (size - nh) // 2, (size - nw) // 2
+    tile[y0:y0 + nh, x0:x0 + nw] = resized
+    return tile
+
+
+# ============================================================================
+# Export
+# ============================================================================
+class DatasetWriter:
+    """
+    Appends projects to a dataset directory. Only the current project's
+    glyphs and masks are held in memory; the box table (a few dozen bytes per
+    box) is written on close().
+    """
+
+    def __init__(self, root, glyph_size=64):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.glyph_size = glyph_size
+        self.columns = {name: [] for name in BOX_COLUMNS}
+        self.chars = {}
+        self.projects = []
+        self.mask_offsets = [0]
+        self._glyph_file = open(self.root / "glyphs.u8", "wb")
+        self._mask_file = open(self.root / "masks.bits", "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_project(self, project):
+        """
+        Append one load_project() result; returns its box count. Raises
+        ValueError if the same project (by project_key()) was already added.
+        """
+        if any(added["key"] == project["key"] for added in self.projects):
+            raise ValueError(f"{project['path']} is already in the dataset")
+        annotations = project["annotations"]
+        boxes = annotations.get("boxes") or []
+        size = self.glyph_size
+        image = None
+        if boxes and project["image_bytes"] is not None:
+            image = decode_image(project["image_bytes"])
+            gray = to_gray_uint8(image)
+
+        first = len(self.columns["project"])
+        glyphs = np.full((len(boxes), size, size), 255, dtype=np.uint8)
+        masks = []
+        for i, box in enumerate(boxes):
+            if image is not None:
+                glyphs[i] = fit_glyph(crop_box(gray, box), size)
+            char_id = self.chars.setdefault(box.get("char", ""), len(self.chars))
+
+            parsed = erase_mask_array(box.get("eraseMask"))
+            if parsed is not None:
+                mask, mx, my = parsed
+                packed = np.packbits(mask, axis=None)
+                masks.append(packed)
+                self.mask_offsets.append(self.mask_offsets[-1] + packed.size)
+                mh, mw = mask.shape
+            else:
+                mx = my = mw = mh = 0
+                self.mask_offsets.append(self.mask_offsets[-1])
+
+            row = {
+                "project": len(self.projects), "char": char_id,
+                "x": box["x"], "y": box["y"], "width": box["width"], "height": box["height"],
+                "has_mask": parsed is not None, "mask_x": mx, "mask_y": my, "mask_w": mw, "mask_h": mh,
+            }
+            for name, value in row.items():
+                self.columns[name].append(value)
+
+        self._glyph_file.write(glyphs.tobytes())
+        for packed in masks:
+            self._mask_file.write(packed.tobytes())
+
+        self.projects.append({
+            "name": project["name"],
+            "key": project["key"],
+            "path": str(project["path"]),
+            "image_name": project["image_name"],
+            "image_width": annotations.get("imageWidth"),
+            "image_height": annotations.get("imageHeight"),
+            "first": first,
+            "count": len(boxes),
+        })
+        return len(boxes)
+
+    def close(self):
+        if self._glyph_file.closed:
+            return
+        self._glyph_file.close()
+        self._mask_file.close()
+
+        table = {name: np.asarray(values, dtype=dtype) for (name, dtype), values
+                 in zip(BOX_COLUMNS.items(), self.columns.values())}
+        np.savez(self.root / "boxes.npz", **table)
+        np.save(self.root / "mask_offsets.npy", np.asarray(self.mask_offsets, dtype=np.int64))
+
+        # Stable sort keeps each character's rows in export order
+        order = np.argsort(table["char"], kind="stable").astype(np.int64)
+        counts = np.bincount(table["char"], minlength=len(self.chars))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        np.savez(self.root / "char_index.npz", order=order, offsets=offsets)
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "glyph_size": self.glyph_size,
+            "count": len(table["char"]),
+            "chars": list(self.chars),
+            "projects": self.projects,
+        }
+        (self.root / "meta.json").write_text(json.dumps(meta, indent=2))
+
+
+# ============================================================================
+# Import / random access
+# ============================================================================
+class ColumnarDataset:
+    """Read side of a dataset directory; glyphs and masks are memory-mapped"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.meta = json.loads((self.root / "meta.json").read_text())
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"dataset format {self.meta['version']}, expected {FORMAT_VERSION}")
+
+        with np.load(self.root / "boxes.npz") as npz:
+            self.boxes = {name: npz[name] for name in BOX_COLUMNS}
+        with np.load(self.root / "char_index.npz") as npz:
+            self._char_order, self._char_offsets = npz["order"], npz["offsets"]
+        self.mask_offsets = np.load(self.root / "mask_offsets.npy")
+
+        n, size = self.meta["count"], self.meta["glyph_size"]
+        # np.memmap refuses empty files, so an empty dataset gets plain arrays
+        self.glyphs = (np.memmap(self.root / "glyphs.u8", dtype=np.uint8, mode="r", shape=(n, size, size))
+                       if n else np.empty((0, size, size), dtype=np.uint8))
+        self._mask_bits = (np.memmap(self.root / "masks.bits", dtype=np.uint8, mode="r")
+                           if self.mask_offsets[-1] else np.empty(0, dtype=np.uint8))
+        self._char_ids = {char: i for i, char in enumerate(self.meta["chars"])}
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def char(self, i):
+        return self.meta["chars"][self.boxes["char"][i]]
+
+    def indices_for(self, char):
+        """Rows whose box is `char`, in export order"""
+        char_id = self._char_ids.get(char)
+        if char_id is None:
+            return np.empty(0, dtype=np.int64)
+        return self._char_order[self._char_offsets[char_id]:self._char_offsets[char_id + 1]]
+
+    def erase_mask(self, i):
+        """(bool array, offset_x, offset_y) like project_io.erase_mask_array, or None"""
+        if not self.boxes["has_mask"][i]:
+            return None
+        h, w = int(self.boxes["mask_h"][i]), int(self.boxes["mask_w"][i])
+        packed = self._mask_bits[self.mask_offsets[i]:self.mask_offsets[i + 1]]
+        mask = np.unpackbits(packed, count=h * w).reshape(h, w).astype(bool)
+        return mask, int(self.boxes["mask_x"][i]), int(self.boxes["mask_y"][i])
+
+    def box(self, i):
+        """Row i as an annotations.json box (eraseMask in the maskUtils.js format)"""
+        box = {"char": self.char(i)}
+        for name in ("x", "y", "width", "height"):
+            value = float(self.boxes[name][i])
+            box[name] = int(value) if value.is_integer() else value
+        parsed = self.erase_mask(i)
+        if parsed is None:
+            box["eraseMask"] = None
+        else:
+            mask, ox, oy = parsed
+            box["eraseMask"] = {
+                "pixels": np.where(mask, 255, 0).astype(np.uint8).ravel().tolist(),
+                "width": mask.shape[1],
+                "height": mask.shape[0],
+                "offsetX": ox,
+                "offsetY": oy,
+            }
+        return box
+
+    def project_boxes(self, k):
+        """All boxes of meta["projects"][k], in their original order"""
+        project = self.meta["projects"][k]
+        return [self.box(i) for i in range(project["first"], project["first"] + project["count"])]
+
+    def project_index(self, key):
+        """Index into meta["projects"] of the project with this project_io.project_key()"""
+        for k, project in enumerate(self.meta["projects"]):
+            if project["key"] == key:
+                return k
+        raise KeyError(key)
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def _same_box(source, rebuilt):
+    if any(source.get(k) != rebuilt[k] for k in ("char", "x", "y", "width", "height")):
+        return False
+    a, b = erase_mask_array(source.get("eraseMask")), erase_mask_array(rebuilt["eraseMask"])
+    if a is None or b is None:
+        return a is None and b is None
+    return a[1:] == b[1:] and np.array_equal(a[0], b[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export projects into a columnar training dataset")
+    parser.add_argument("projects", nargs="+", help="project ZIPs, project dirs, or dirs containing them")
+    parser.add_argument("--out", type=Path, default=Path("dataset"))
+    parser.add_argument("--glyph-size", type=int, default=64, help="side of each glyph tile (px)")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-read the dataset and compare every box with its source project")
+    args = parser.parse_args()
+
+    projects = find_projects(args.projects)
+    print(f"Exporting {len(projects)} project(s) into {args.out}")
+
+    started = time.perf_counter()
+    exported = set()
+    with DatasetWriter(args.out, glyph_size=args.glyph_size) as writer:
+        for project_path in projects:
+            key = project_key(project_path)
+            if key in exported:
+                print(f"  {project_path}: listed twice, skipped")
+                continue
+            exported.add(key)
+            project_started = time.perf_counter()
+            count = writer.add_project(load_project(project_path))
+            print(f"  {project_path}: {count} boxes ({(time.perf_counter() - project_started) * 1000:.0f} ms)")
+    elapsed = time.perf_counter() - started
+
+    dataset = ColumnarDataset(args.out)
+    print(f"{len(dataset)} boxes, {len(dataset.meta['chars'])} distinct chars in {elapsed:.2f} s; "
+          f"glyphs {dataset.glyphs.nbytes / 1e6:.1f} MB, masks {int(dataset.mask_offsets[-1]) / 1e6:.2f} MB packed")
+
+    if args.verify:
+        mismatched = 0
+        for project_path in projects:
+            project = load_project(project_path)
+            source = project["annotations"].get("boxes") or []
+            rebuilt = dataset.project_boxes(dataset.project_index(project["key"]))
+            mismatched += sum(not _same_box(s, r) for s, r in zip(source, rebuilt)) + abs(len(source) - len(rebuilt))
+        print("Verify: every box round-trips" if not mismatched else f"Verify: {mismatched} MISMATCHED boxes")
+        return 1 if mismatched else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
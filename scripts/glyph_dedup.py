@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate glyph index for reusing sanitize results.
+
+Projects annotated from related specimens crop the same character again and
+again with slightly different boxes, so exact-pixel caching never hits. Each
+crop is reduced to a perceptual hash instead: the Otsu binary from
+get_binary() (foreground = text, so polarity doesn't matter) is box-averaged
+to 32x32, DCT'd, and the 63 lowest AC coefficients are thresholded at their
+median into a 64-bit integer. Similar glyphs land within a few bits.
+
+Lookup is multi-index hashing: the hash is split into four 16-bit chunks,
+each with its own exact-match table. Two hashes within Hamming distance 3
+share at least one chunk, so candidates come from four dict lookups and are
+confirmed with a popcount. Larger radii fall back to a vectorized XOR scan.
+
+A hash hit is only a candidate. Before reusing a neighbour's intruder mask,
+both binaries are compared at 64x64 over small shifts, and the neighbour must
+have a similar aspect ratio and IoU >= --min-iou at the best shift. The mask
+is then warped (scaled to the new crop, shifted by the best offset) instead
+of re-running connected components.
+
+Run: python3 -u scripts/glyph_dedup.py projects/ [--index glyph_index.npz] [--verify]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from project_io import content_hash, crop_box, decode_image, find_projects, load_project
+from sanitize_algorithms import AnalysisContext, algo_connected_components, warm_up
+
+HASH_SIZE = 32  # binary is box-averaged to this before the DCT
+THUMB_SIZE = 64  # verification resolution
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+INDEX_VERSION = 1
+
+# Defaults mirror analyzeBoxForIntruders() in src/utils/sanitizeBox.js
+DEFAULT_OPTIONS = {
+    "dilation_percent": 2.5,
+    "min_area_ratio": 0.0005,
+    "sensitivity": "medium",
+    "adaptive_threshold": False,
+}
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so the 2-D transform is two matmuls"""
+    k = np.arange(n)[:, None]
+    basis = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    basis[0] /= np.sqrt(2)
+    return basis
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+
+
+def _resize_binary(binary, size):
+    """Box-average a bool image to size x size, as float in [0, 1]"""
+    img = Image.fromarray(binary.astype(np.uint8) * 255)
+    return np.asarray(img.resize((size, size), Image.Resampling.BOX), dtype=np.float64) / 255
+
+
+def phash(binary):
+    """64-bit DCT perceptual hash of a binary glyph image"""
+    coeffs = _DCT @ _resize_binary(binary, HASH_SIZE) @ _DCT.T
+    low = coeffs[:8, :8].ravel()[1:]  # drop DC: it only tracks ink coverage
+    bits = np.append(low > np.median(low), False)
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def thumbnail(binary):
+    """Verification thumbnail: binary resized to THUMB_SIZE square"""
+    return _resize_binary(binary, THUMB_SIZE) >= 0.5
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _iou(a, b):
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
+
+
+BORDER = THUMB_SIZE // 8
+_BORDER_RING = np.ones((THUMB_SIZE, THUMB_SIZE), dtype=bool)
+_BORDER_RING[BORDER:-BORDER, BORDER:-BORDER] = False
+
+
+def best_shift(thumb, other, max_shift=2):
+    """
+    (IoU, border IoU, dy, dx) of `other` shifted onto `thumb` at the offset
+    with the best IoU. Border IoU covers only the outer ring, where the
+    intruders are; the main glyph would otherwise dominate the score.
+    """
+    best = (-1.0, 0.0, 0, 0)
+    n = thumb.shape[0]
+    for dy in range(-max_shift, max_shift + 1):
+        for dx in range(-max_shift, max_shift + 1):
+            ys, xs = slice(max(dy, 0), n + min(dy, 0)), slice(max(dx, 0), n + min(dx, 0))
+            a = thumb[ys, xs]
+            b = other[max(-dy, 0):n + min(-dy, 0), max(-dx, 0):n + min(-dx, 0)]
+            iou = _iou(a, b)
+            if iou > best[0]:
+                ring = _BORDER_RING[ys, xs]
+                best = (iou, _iou(a & ring, b & ring), dy, dx)
+    return best
+
+
+def warp_mask(mask, shape, dy=0, dx=0):
+    """
+    Nearest-neighbour scale of a mask to `shape`, then shift by (dy, dx)
+    thumbnail pixels (converted to the target scale).
+    """
+    h, w = shape
+    mh, mw = mask.shape
+    sy, sx = round(dy * h / THUMB_SIZE), round(dx * w / THUMB_SIZE)
+    rows = np.floor((np.arange(h) - sy + 0.5) * mh / h).astype(int)
+    cols = np.floor((np.arange(w) - sx + 0.5) * mw / w).astype(int)
+    inside = ((rows >= 0) & (rows < mh))[:, None] & ((cols >= 0) & (cols < mw))[None, :]
+    out = mask[np.ix_(np.clip(rows, 0, mh - 1), np.clip(cols, 0, mw - 1))]
+    return out & inside
+
+
+# ============================================================================
+# Index
+# ============================================================================
+class GlyphIndex:
+    """
+    Sanitize results keyed by perceptual hash. Entries are only comparable
+    for the options they were computed with, which are stored alongside.
+    """
+
+    def __init__(self, options):
+        self.options = dict(options)
+        self.hashes = []
+        self.shapes = []
+        self.thumbs = []
+        self.masks = []  # bool array, or None when the crop had no intruders
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._hash_array = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @staticmethod
+    def _chunks(h):
+        return [(h >> (i * CHUNK_BITS)) & ((1 << CHUNK_BITS) - 1) for i in range(CHUNKS)]
+
+    def add(self, h, shape, thumb, mask):
+        entry = len(self.hashes)
+        self.hashes.append(h)
+        self.shapes.append(tuple(shape))
+        self.thumbs.append(thumb)
+        self.masks.append(mask)
+        for table, chunk in zip(self._tables, self._chunks(h)):
+            table.setdefault(chunk, []).append(entry)
+        self._hash_array = None
+        return entry
+
+    def query(self, h, radius):
+        """Entry ids within `radius` bits of h, nearest first"""
+        if radius < CHUNKS:
+            candidates = {e for table, chunk in zip(self._tables, self._chunks(h)) for e in table.get(chunk, ())}
+            hits = [(hamming(h, self.hashes[e]), e) for e in candidates]
+        else:
+            if self._hash_array is None:
+                self._hash_array = np.array(self.hashes, dtype=np.uint64)
+            dist = np.bitwise_count(self._hash_array ^ np.uint64(h))
+            hits = [(int(dist[e]), int(e)) for e in np.flatnonzero(dist <= radius)]
+        return [e for d, e in sorted(hits) if d <= radius]
+
+    # ------------------------------------------------------------------------
+    # Persistence: one npz, masks bit-packed into a flat array plus offsets
+    # ------------------------------------------------------------------------
+    def save(self, path):
+        """Write the index to exactly `path` (np.savez would append .npz to a bare name)"""
+        packed, offsets = [], [0]
+        for mask in self.masks:
+            bits = np.packbits(mask) if mask is not None else np.zeros(0, dtype=np.uint8)
+            packed.append(bits)
+            offsets.append(offsets[-1] + len(bits))
+        meta = json.dumps({"version": INDEX_VERSION, "options": self.options}).encode()
+        thumbs = np.array(self.thumbs, dtype=bool).reshape(len(self), THUMB_SIZE * THUMB_SIZE)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                meta=np.frombuffer(meta, np.uint8),
+                hashes=np.array(self.hashes, dtype=np.uint64),
+                shapes=np.array(self.shapes, dtype=np.int32).reshape(-1, 2),
+                has_mask=np.array([m is not None for m in self.masks], dtype=bool),
+                thumbs=np.packbits(thumbs, axis=1),
+                masks=np.concatenate(packed) if packed else np.zeros(0, dtype=np.uint8),
+                offsets=np.array(offsets, dtype=np.int64),
+            )
+
+    @classmethod
+    def load(cls, path, options):
+        """
+        Load an index. Raises ValueError if it was built by another
+        INDEX_VERSION or with other options, rather than handing back an empty
+        index whose save() would overwrite the file.
+        """
+        index = cls(options)
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes())
+            if meta.get("version") != INDEX_VERSION:
+                raise ValueError(f"{path} is index version {meta.get('version')}, expected {INDEX_VERSION}")
+            if meta.get("options") != index.options:
+                raise ValueError(f"{path} was built with options {meta.get('options')}, not {index.options}")
+            arrays = {key: data[key] for key in ("hashes", "shapes", "has_mask", "thumbs", "masks", "offsets")}
+
+        thumbs = np.unpackbits(arrays["thumbs"], axis=1, count=THUMB_SIZE * THUMB_SIZE).astype(bool)
+        offsets = arrays["offsets"]
+        for i, h in enumerate(arrays["hashes"].tolist()):
+            shape = tuple(arrays["shapes"][i].tolist())
+            mask = None
+            if arrays["has_mask"][i]:
+                bits = arrays["masks"][offsets[i]:offsets[i + 1]]
+                mask = np.unpackbits(bits, count=shape[0] * shape[1]).astype(bool).reshape(shape)
+            index.add(h, shape, thumbs[i].reshape(THUMB_SIZE, THUMB_SIZE), mask)
+        return index
+
+
+# ============================================================================
+# Sanitizer
+# ============================================================================
+class DedupSanitizer:
+    """
+    algo_connected_components() behind a near-duplicate cache. sanitize()
+    returns (mask or None, info) where info["source"] is "reused" or
+    "analyzed".
+    """
+
+    def __init__(self, index, radius=10, min_iou=0.9, max_aspect_change=0.15, max_candidates=4):
+        self.index = index
+        self.radius = radius
+        self.min_iou = min_iou
+        self.max_candidates = max_candidates
+        self.max_aspect_change = max_aspect_change
+        self.stats = {"reused": 0, "analyzed": 0, "rejected": 0}
+
+    def _verify(self, entry, shape, thumb):
+        eh, ew = self.index.shapes[entry]
+        aspect, other_aspect = shape[1] / shape[0], ew / eh
+        if abs(aspect - other_aspect) > self.max_aspect_change * max(aspect, other_aspect):
+            return None
+        iou, border_iou, dy, dx = best_shift(thumb, self.index.thumbs[entry])
+        return (iou, dy, dx) if min(iou, border_iou) >= self.min_iou else None
+
+    def sanitize(self, img_array):
+        ctx = AnalysisContext(img_array)
+        binary = ctx.binary
+        h = phash(binary)
+        thumb = thumbnail(binary)
+
+        for entry in self.index.query(h, self.radius)[:self.max_candidates]:
+            verified = self._verify(entry, binary.shape, thumb)
+            if verified is None:
+                self.stats["rejected"] += 1
+                continue
+            iou, dy, dx = verified
+            stored = self.index.masks[entry]
+            mask = warp_mask(stored, binary.shape, dy, dx) if stored is not None else None
+            self.stats["reused"] += 1
+            return mask, {"source": "reused", "entry": entry, "iou": iou, "shift": (dy, dx),
+                          "distance": hamming(h, self.index.hashes[entry])}
+
+        mask, _ = algo_connected_components(img_array, ctx=ctx, **self.index.options)
+        self.index.add(h, binary.shape, thumb, mask)
+        self.stats["analyzed"] += 1
+        return mask, {"source": "analyzed"}
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def mask_disagreement(a, b, shape):
+    """Fraction of crop pixels where two masks (None = empty) differ"""
+    a = a if a is not None else np.zeros(shape, dtype=bool)
+    b = b if b is not None else np.zeros(shape, dtype=bool)
+    return np.count_nonzero(a ^ b) / a.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sanitize project glyphs, reusing near-duplicate results")
+    parser.add_argument("projects", nargs="+", help="project ZIPs, project dirs, or dirs containing them")
+    parser.add_argument("--index", type=Path, help="npz index to load and update (kept across runs)")
+    parser.add_argument("--radius", type=int, default=10, help="max Hamming distance for candidates")
+    parser.add_argument("--min-iou", type=float, default=0.9, help="thumbnail IoU required to reuse")
+    parser.add_argument("--verify", action="store_true", help="also run full analysis on reused crops and compare")
+    args = parser.parse_args()
+
+    if args.index and args.index.suffix != ".npz":
+        # Same file whether or not the name was given with its suffix
+        args.index = args.index.with_name(args.index.name + ".npz")
+
+    options = dict(DEFAULT_OPTIONS)
+    index = GlyphIndex(options)
+    if args.index and args.index.exists():
+        try:
+            index = GlyphIndex.load(args.index, options)
+        except ValueError as e:
+            parser.error(f"{e}; pass another --index (or delete this one to rebuild it)")
+    print(f"Index: {len(index)} entries ({content_hash(options)[:8]})")
+    sanitizer = DedupSanitizer(index, radius=args.radius, min_iou=args.min_iou)
+    warm_up()  # keep lazy scipy/skimage imports out of the timings
+
+    started = time.perf_counter()
+    disagreement = []
+    reuse_time = full_time = 0.0
+    for project_path in find_projects(args.projects):
+        project = load_project(project_path)
+        boxes = project["annotations"].get("boxes") or []
+        if not boxes or project["image_bytes"] is None:
+            continue
+        image = decode_image(project["image_bytes"])
+        before = dict(sanitizer.stats)
+
+        for box in boxes:
+            crop = crop_box(image, box)
+            if crop.shape[0] < 2 or crop.shape[1] < 2:
+                continue
+            t0 = time.perf_counter()
+            mask, info = sanitizer.sanitize(crop)
+            if args.verify and info["source"] == "reused":
+                t1 = time.perf_counter()
+                reference, _ = algo_connected_components(crop, **options)
+                reuse_time += t1 - t0
+                full_time += time.perf_counter() - t1
+                disagreement.append(mask_disagreement(mask, reference, crop.shape[:2]))
+
+        done = {k: sanitizer.stats[k] - before[k] for k in before}
+        print(f"  {project_path.name}: {done['analyzed']} analyzed, {done['reused']} reused")
+
+    elapsed = time.perf_counter() - started
+    total = sanitizer.stats["analyzed"] + sanitizer.stats["reused"]
+    print(f"{total} crops in {elapsed - full_time:.2f}s: {sanitizer.stats['reused']} reused "
+          f"({sanitizer.stats['reused'] / max(total, 1) * 100:.0f}%), "
+          f"{sanitizer.stats['rejected']} candidates rejected by verification")
+    if disagreement:
+        print(f"Reused vs full analysis: {reuse_time * 1000:.0f} ms vs {full_time * 1000:.0f} ms; "
+              f"masks differ on {np.mean(disagreement) * 100:.2f}% of pixels on average, "
+              f"{np.max(disagreement) * 100:.2f}% at worst")
+
+    if args.index:
+        index.save(args.index)
+        print(f"Saved {len(index)} entries to {args.index}")
+
+
+if __name__ == "__main__":
+    main()
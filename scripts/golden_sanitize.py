@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Golden-output regression checks for the sanitize algorithms.
+
+Pins what every algorithm produces so performance work can't silently change
+masks. For each case (the checked-in screenshots in public/sanitize-test plus
+a deterministic synthetic corpus) and each algorithm configuration we store:
+
+  - pixel masks (shape masks, flood-fill intruder masks), bit-packed
+  - key debug scalars: component counts, main/intruder scores, valley and
+    peak indices, mask boundaries
+  - the best-of-N run time
+
+Some configurations pin faster variants of the same computation:
+cc_lean / cc_lean_adaptive (lean_sanitize.py) and cc_anytime (the full stage
+of anytime_sanitize.py) must record exactly what cc_app / cc_adaptive do.
+cc_tuned runs auto_tune.py's search on each case and records the parameters
+it picks along with the mask they give.
+
+`check` reruns everything and diffs against the goldens: masks pixel-wise
+(mismatch fraction must be <= --pixel-tolerance), floats with a relative
+tolerance, indices within --index-tolerance pixels. Speed deltas are reported
+next to accuracy so a speedup and its cost show up together.
+
+Run:
+  python3 -u scripts/golden_sanitize.py record                        # (re)write goldens
+  python3 -u scripts/golden_sanitize.py record --algorithms cc_lean   # only these
+  python3 -u scripts/golden_sanitize.py check                         # compare against goldens
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from anytime_sanitize import connected_components as anytime_connected_components
+from auto_tune import BoxEvaluator, tune
+from lean_sanitize import lean_connected_components
+from sanitize_algorithms import (
+    algo_column_density,
+    algo_connected_components,
+    algo_projection_profile,
+    algo_flood_fill_corners,
+    algo_row_projection,
+    algo_combined_projection,
+    algo_gradient_edges,
+    algo_ensemble,
+    warm_up,
+)
+
+warnings.filterwarnings('ignore')
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCREENSHOT_DIR = REPO_ROOT / "public/sanitize-test"
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+MANIFEST_PATH = GOLDEN_DIR / "manifest.json"
+MASKS_PATH = GOLDEN_DIR / "masks.npz"
+
+CORPUS_VERSION = 1
+CORPUS_SEED = 1234
+CORPUS_SIZE = 16
+# Random configurations cc_tuned's tuner starts from
+TUNE_CONFIGS = 9
+
+
+# ============================================================================
+# Cases
+# ============================================================================
+def _disk(yy, xx, cy, cx, ry, rx):
+    return ((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2 <= 1
+
+
+def _ring(yy, xx, cy, cx, ry, rx, thickness):
+    outer = _disk(yy, xx, cy, cx, ry, rx)
+    inner = _disk(yy, xx, cy, cx, max(ry - thickness, 1), max(rx - thickness, 1))
+    return outer & ~inner
+
+
+def _bar(yy, xx, y0, y1, x0, x1):
+    return (yy >= y0) & (yy < y1) & (xx >= x0) & (xx < x1)
+
+
+def synthetic_crop(rng, index):
+    """
+    One synthetic glyph crop: a centered 'o', 'l' or 'd'-like shape with
+    partial neighbours cut off at the edges, polarity, gradient and noise
+    varied by index. Pure numpy so it renders identically everywhere.
+    """
+    h = int(rng.integers(60, 260))
+    w = int(h * rng.uniform(0.5, 1.1))
+    yy, xx = np.mgrid[0:h, 0:w].astype(float)
+    stroke = max(3, int(min(h, w) * rng.uniform(0.08, 0.16)))
+    cy, cx = h * rng.uniform(0.45, 0.6), w * rng.uniform(0.42, 0.58)
+
+    shape = index % 3
+    if shape == 0:
+        ink = _ring(yy, xx, cy, cx, h * 0.28, w * 0.3, stroke)
+    elif shape == 1:
+        ink = _bar(yy, xx, h * 0.15, h * 0.85, cx - stroke, cx + stroke)
+    else:
+        ink = _ring(yy, xx, cy + h * 0.08, cx - w * 0.05, h * 0.22, w * 0.25, stroke)
+        ink |= _bar(yy, xx, h * 0.12, h * 0.82, cx + w * 0.2 - stroke, cx + w * 0.2)
+
+    # Neighbouring letters poking in from the sides (and sometimes above)
+    if index % 2 == 0:
+        ink |= _ring(yy, xx, cy, -w * 0.12, h * 0.28, w * 0.25, stroke)
+    if index % 4 in (0, 1):
+        ink |= _bar(yy, xx, h * 0.1, h * 0.9, w - stroke * 0.8, w + stroke)
+    if index % 5 == 0:
+        ink |= _bar(yy, xx, -stroke, stroke * 0.6, w * 0.3, w * 0.55)
+
+    dark_text = index % 3 != 2
+    text_level, bg_level = (30.0, 225.0) if dark_text else (235.0, 40.0)
+    gray = np.where(ink, text_level, bg_level)
+
+    # Soften edges like anti-aliasing (3x3 box blur)
+    padded = np.pad(gray, 1, mode="edge")
+    gray = sum(padded[dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3)) / 9
+
+    if index % 4 == 3:
+        gray += np.linspace(-25, 25, w)[None, :]  # Lighting gradient
+    gray += rng.normal(0, 4, size=(h, w))
+
+    gray = np.clip(gray, 0, 255)
+    tint = np.array([1.0, 0.97, 0.92])
+    return np.clip(gray[:, :, None] * tint, 0, 255).astype(np.uint8)
+
+
+def load_cases():
+    """Return [(case name, RGB array)] for screenshots + synthetic corpus"""
+    cases = []
+    for path in sorted(SCREENSHOT_DIR.glob("*.png")):
+        cases.append((f"screenshot/{path.stem}", np.asarray(Image.open(path).convert("RGB"))))
+
+    rng = np.random.default_rng(CORPUS_SEED)
+    for i in range(CORPUS_SIZE):
+        cases.append((f"synthetic/{i:02d}", synthetic_crop(rng, i)))
+    return cases
+
+
+# ============================================================================
+# Algorithm runners: each returns (masks dict, scalars dict)
+# ============================================================================
+def _indices(values):
+    return [int(v) for v in values]
+
+
+def _maybe_int(value):
+    return None if value is None else int(value)
+
+
+def run_cc(func=algo_connected_components, **kwargs):
+    """Runner for algo_connected_components() or a variant with the same debug output"""
+    def run(img):
+        mask, debug = func(img, **kwargs)
+        main = debug.get("main_component") or {}
+        return {"mask": mask}, {
+            "num_features": int(debug.get("num_features", 0)),
+            "num_components": len(debug.get("components", [])),
+            "num_intruders": len(debug.get("intruder_components", [])),
+            "main_score": float(main["score"]) if main else None,
+            "intruder_scores": [float(c["score"]) for c in debug.get("intruder_components", [])],
+        }
+    return run
+
+
+def run_column_density(img):
+    left, right, debug = algo_column_density(img)
+    return {}, {"left": _maybe_int(left), "right": _maybe_int(right)}
+
+
+def run_projection_profile(img):
+    left, right, debug = algo_projection_profile(img)
+    return {}, {"left": _maybe_int(left), "right": _maybe_int(right), "valleys": _indices(debug["valleys"])}
+
+
+def run_flood_fill(img):
+    left, right, debug = algo_flood_fill_corners(img)
+    return {"intruder_mask": debug["intruder_mask"]}, {
+        "left": _maybe_int(left),
+        "right": _maybe_int(right),
+        "num_components": int(debug["num_components"]),
+    }
+
+
+def run_row_projection(img):
+    top, bottom, debug = algo_row_projection(img)
+    return {}, {"top": _maybe_int(top), "bottom": _maybe_int(bottom), "valleys": _indices(debug.get("valleys", []))}
+
+
+def run_combined(img):
+    masks, _ = algo_combined_projection(img)
+    return {}, {side: _maybe_int(value) for side, value in masks.items()}
+
+
+def run_gradient(img):
+    left, right, debug = algo_gradient_edges(img)
+    return {}, {"left": _maybe_int(left), "right": _maybe_int(right), "peaks": _indices(debug["peaks"])}
+
+
+def run_tuned(img):
+    """
+    auto_tune.tune() on the whole case as one box (proxy objective), then the
+    connected-component mask with the winning parameters
+    """
+    h, w = img.shape[:2]
+    # Edge-pad so the tuner's crop shifted by 1 px sees the case's own border, not black fill
+    padded = np.pad(img, ((0, 1), (0, 1)) + ((0, 0),) * (img.ndim - 2), mode="edge")
+    evaluator = BoxEvaluator(padded, {"x": 0, "y": 0, "width": w, "height": h})
+    params, score, _ = tune([evaluator], "proxy", n_configs=TUNE_CONFIGS)
+    masks, scalars = run_cc(anytime_connected_components, dilation_percent=params["dilation_percent"],
+                            sensitivity=params["sensitivity"], min_area_ratio=params["min_area_ratio"])(img)
+    return masks, {**scalars, "tune_score": float(score), **{f"tuned_{k}": v for k, v in params.items()}}
+
+
+def run_ensemble(img):
+    mask, debug = algo_ensemble(img, cc_options={"dilation_percent": 1.0})
+    return {"mask": mask}, {"voters": sorted(k for k, v in debug.get("voters", {}).items() if v)}
+
+
+ALGORITHMS = {
+    "cc_default": run_cc(),
+    "cc_app": run_cc(min_area_ratio=0.0005, dilation_percent=2.5),
+    "cc_adaptive": run_cc(adaptive_threshold=True, dilation_percent=1.0),
+    # Must stay identical to cc_app / cc_adaptive
+    "cc_lean": run_cc(lean_connected_components, min_area_ratio=0.0005, dilation_percent=2.5),
+    "cc_lean_adaptive": run_cc(lean_connected_components, adaptive_threshold=True, dilation_percent=1.0),
+    # The anytime full stage (distance-transform dilation); must stay identical to cc_app
+    "cc_anytime": run_cc(anytime_connected_components, min_area_ratio=0.0005, dilation_percent=2.5),
+    "cc_tuned": run_tuned,
+    "column_density": run_column_density,
+    "projection_profile": run_projection_profile,
+    "flood_fill_corners": run_flood_fill,
+    "row_projection": run_row_projection,
+    "combined_projection": run_combined,
+    "gradient_edges": run_gradient,
+    "ensemble": run_ensemble,
+}
+
+
+def run_timed(func, img, repeats):
+    """Run func(img) `repeats` times; return (result of last run, best seconds)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = func(img)
+            best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def run_all(algorithms, repeats):
+    """Yield (case, algo, shape, masks, scalars, seconds) for every combination"""
+    for case_name, img in load_cases():
+        for algo_name in algorithms:
+            (masks, scalars), seconds = run_timed(ALGORITHMS[algo_name], img, repeats)
+            yield case_name, algo_name, img.shape[:2], masks, scalars, seconds
+
+
+# ============================================================================
+# Storage
+# ============================================================================
+def _mask_key(case_name, algo_name, mask_name):
+    return f"{case_name}::{algo_name}::{mask_name}"
+
+
+def pack_mask(mask, shape):
+    """Store None as an all-False mask so shape is always recorded"""
+    if mask is None:
+        mask = np.zeros(shape, dtype=bool)
+    return np.packbits(mask, axis=None)
+
+
+def unpack_mask(packed, shape):
+    return np.unpackbits(packed, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+
+
+def record(args):
+    algorithms = args.algorithms or list(ALGORITHMS)
+    manifest = {"corpus_version": CORPUS_VERSION, "cases": {}}
+    arrays = {}
+    if args.algorithms and MANIFEST_PATH.exists():
+        # Re-record only the named algorithms and keep every other golden
+        previous = json.loads(MANIFEST_PATH.read_text())
+        if previous.get("corpus_version") == CORPUS_VERSION:
+            manifest = previous
+            with np.load(MASKS_PATH) as npz:
+                arrays = {key: npz[key] for key in npz.files if key.split("::")[1] not in algorithms}
+
+    for case_name, algo_name, shape, masks, scalars, seconds in run_all(algorithms, args.repeats):
+        entry = {"scalars": scalars, "seconds": seconds, "masks": {}}
+        for mask_name, mask in masks.items():
+            arrays[_mask_key(case_name, algo_name, mask_name)] = pack_mask(mask, shape)
+            entry["masks"][mask_name] = {"shape": list(shape), "empty": mask is None or not mask.any()}
+        manifest["cases"].setdefault(case_name, {})[algo_name] = entry
+        print(f"  {case_name:<40} {algo_name:<20} {seconds * 1000:8.1f} ms")
+
+    GOLDEN_DIR.mkdir(exist_ok=True)
+    np.savez_compressed(MASKS_PATH, **arrays)
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+    print(f"\nRecorded {sum(len(c) for c in manifest['cases'].values())} results to {GOLDEN_DIR}")
+
+
+# ============================================================================
+# Comparison
+# ============================================================================
+def compare_scalars(expected, actual, rtol, index_tolerance):
+    """Return a list of human-readable differences (empty = match)"""
+    diffs = []
+    for key in sorted(set(expected) | set(actual)):
+        exp, act = expected.get(key), actual.get(key)
+        if isinstance(exp, list) and isinstance(act, list) and all(isinstance(v, int) for v in exp + act):
+            if len(exp) != len(act) or any(abs(e - a) > index_tolerance for e, a in zip(exp, act)):
+                diffs.append(f"{key}: {exp} -> {act}")
+        elif isinstance(exp, list) and isinstance(act, list) and all(isinstance(v, float) for v in exp + act):
+            if len(exp) != len(act) or not np.allclose(exp, act, rtol=rtol):
+                diffs.append(f"{key}: {exp} -> {act}")
+        elif isinstance(exp, int) and isinstance(act, int) and key in ("left", "right", "top", "bottom"):
+            if abs(exp - act) > index_tolerance:
+                diffs.append(f"{key}: {exp} -> {act}")
+        elif isinstance(exp, float) and isinstance(act, float):
+            if not np.isclose(exp, act, rtol=rtol):
+                diffs.append(f"{key}: {exp:.4f} -> {act:.4f}")
+        elif exp != act:
+            diffs.append(f"{key}: {exp} -> {act}")
+    return diffs
+
+
+def compare_mask(expected, actual):
+    """Return (mismatch fraction, IoU) between two boolean masks"""
+    if expected.shape != actual.shape:
+        return 1.0, 0.0
+    mismatch = np.count_nonzero(expected != actual) / expected.size
+    union = np.count_nonzero(expected | actual)
+    iou = np.count_nonzero(expected & actual) / union if union else 1.0
+    return mismatch, iou
+
+
+def check(args):
+    if not MANIFEST_PATH.exists():
+        print(f"No goldens at {GOLDEN_DIR}; run `record` first")
+        return 2
+
+    manifest = json.loads(MANIFEST_PATH.read_text())
+    if manifest.get("corpus_version") != CORPUS_VERSION:
+        print(f"Goldens were recorded with corpus v{manifest.get('corpus_version')}, "
+              f"this script generates v{CORPUS_VERSION}; re-record")
+        return 2
+    golden_masks = np.load(MASKS_PATH)
+    algorithms = args.algorithms or sorted({a for case in manifest["cases"].values() for a in case})
+
+    failures = 0
+    totals = {}  # algo -> [golden seconds, new seconds, min IoU]
+
+    print(f"{'case':<40} {'algorithm':<20} {'status':<6} {'mismatch':>9} {'IoU':>7} {'golden':>9} {'now':>9} {'speedup':>8}")
+    for case_name, algo_name, shape, masks, scalars, seconds in run_all(algorithms, args.repeats):
+        golden = manifest["cases"].get(case_name, {}).get(algo_name)
+        if golden is None:
+            print(f"{case_name:<40} {algo_name:<20} {'NEW':<6}")
+            continue
+
+        problems = compare_scalars(golden["scalars"], scalars, args.rtol, args.index_tolerance)
+        worst_mismatch, worst_iou = 0.0, 1.0
+        for mask_name, info in golden["masks"].items():
+            expected = unpack_mask(golden_masks[_mask_key(case_name, algo_name, mask_name)], tuple(info["shape"]))
+            actual = masks.get(mask_name)
+            actual = np.zeros(shape, dtype=bool) if actual is None else actual.astype(bool)
+            mismatch, iou = compare_mask(expected, actual)
+            worst_mismatch, worst_iou = max(worst_mismatch, mismatch), min(worst_iou, iou)
+            if mismatch > args.pixel_tolerance:
+                problems.append(f"{mask_name}: {mismatch * 100:.3f}% pixels differ (IoU {iou:.4f})")
+
+        status = "FAIL" if problems else "ok"
+        failures += bool(problems)
+        speedup = golden["seconds"] / seconds if seconds > 0 else float("inf")
+        total = totals.setdefault(algo_name, [0.0, 0.0, 1.0])
+        total[0] += golden["seconds"]
+        total[1] += seconds
+        total[2] = min(total[2], worst_iou)
+
+        print(f"{case_name:<40} {algo_name:<20} {status:<6} {worst_mismatch * 100:8.3f}% {worst_iou:7.4f} "
+              f"{golden['seconds'] * 1000:7.1f}ms {seconds * 1000:7.1f}ms {speedup:7.2f}x")
+        for problem in problems:
+            print(f"    {problem}")
+
+    print("\n" + "=" * 60)
+    print(f"{'algorithm':<20} {'golden':>10} {'now':>10} {'speedup':>8} {'min IoU':>8}")
+    for algo_name, (golden_s, now_s, min_iou) in totals.items():
+        speedup = golden_s / now_s if now_s > 0 else float("inf")
+        print(f"{algo_name:<20} {golden_s * 1000:8.1f}ms {now_s * 1000:8.1f}ms {speedup:7.2f}x {min_iou:8.4f}")
+    print("=" * 60)
+    print(f"{failures} failing result(s)" if failures else "All results match goldens")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-output regression checks for sanitize algorithms")
+    parser.add_argument("command", choices=("record", "check"))
+    parser.add_argument("--algorithms", nargs="+", choices=sorted(ALGORITHMS), help="subset to run (default: all)")
+    parser.add_argument("--repeats", type=int, default=3, help="timing runs per result (best is kept)")
+    parser.add_argument("--pixel-tolerance", type=float, default=0.0, help="allowed fraction of differing mask pixels")
+    parser.add_argument("--index-tolerance", type=int, default=0, help="allowed drift (px) in valley/boundary indices")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="relative tolerance for float scalars")
+    args = parser.parse_args()
+
+    warm_up()
+    if args.command == "record":
+        record(args)
+        return 0
+    return check(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Integral histogram for bulk per-box Otsu thresholds.
+
+A standalone tool for batch jobs that need Otsu thresholds for many boxes of
+the same page (dataset export, QA scripts); the sanitize path does not use it.
+AnalysisContext.get_binary() thresholds the float luminance of each crop,
+while this works on the uint8-rounded page, so its thresholds can differ from
+the ones sanitize uses by up to one gray level.
+
+filters.threshold_otsu builds a histogram from scratch for every crop. This
+builds a page-level integral histogram over uint8 grayscale once; any
+rectangle's 256-bin histogram is then a few lookups, and Otsu thresholds for
+many boxes come out of one vectorized pass over a (boxes x 256) array.
+
+A full per-pixel integral histogram is H x W x 256 counts, which is gigabytes
+for a page. The table is therefore kept on a grid of `cell` x `cell` blocks:
+the grid-aligned interior of a box costs O(256), and the few rows/columns
+between the box edge and the grid are counted directly, at most ~2 * cell *
+(w + h) pixels. Cells too small for MAX_TABLE_BYTES are rejected.
+
+The gain is modest: on teenage.png (2572x918), 500 random boxes take about
+12 ms to build plus 30 ms to threshold at cell 32, against about 70 ms for
+per-crop threshold_otsu; 5000 boxes take about 330 ms against 650 ms.
+
+Thresholds are identical to filters.threshold_otsu(crop) on the uint8 crop:
+same integer histogram, same cumulative sums, same argmax tie-breaking.
+
+Run: python3 -u scripts/integral_histogram.py [page.png] [--boxes 500] [--cell 32]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from sanitize_algorithms import to_grayscale
+
+DEFAULT_PAGE = Path(__file__).resolve().parent.parent / "public/teenage.png"
+
+DEFAULT_CELL = 32
+# Largest integral table IntegralHistogram will allocate
+MAX_TABLE_BYTES = 64 * 1024 * 1024
+
+
+def to_gray_uint8(img_array):
+    """Luminance grayscale (same weights as to_grayscale) rounded to uint8"""
+    return np.clip(np.rint(to_grayscale(img_array)), 0, 255).astype(np.uint8)
+
+
+def table_bytes(shape, cell, dtype=np.int32):
+    """Size of the integral table for a page of `shape` on a `cell` grid"""
+    h, w = shape
+    return (h // cell + 1) * (w // cell + 1) * 256 * np.dtype(dtype).itemsize
+
+
+def smallest_cell(shape, max_table_bytes=MAX_TABLE_BYTES, dtype=np.int32):
+    """Smallest cell whose integral table fits in max_table_bytes"""
+    cell = 1
+    while table_bytes(shape, cell, dtype) > max_table_bytes:
+        cell += 1
+    return cell
+
+
+class IntegralHistogram:
+    """
+    Cumulative 256-bin histograms on a cell grid over a uint8 page.
+
+    table[gy, gx] is the histogram of gray[:gy * cell, :gx * cell].
+    """
+
+    def __init__(self, gray, cell=DEFAULT_CELL, max_table_bytes=MAX_TABLE_BYTES):
+        if gray.dtype != np.uint8:
+            raise ValueError("IntegralHistogram needs a uint8 grayscale page")
+        h, w = gray.shape
+        dtype = np.int32 if h * w < 2 ** 31 else np.int64
+        if table_bytes(gray.shape, cell, dtype) > max_table_bytes:
+            raise ValueError(f"cell {cell} needs a {table_bytes(gray.shape, cell, dtype) / 1e6:.0f} MB table "
+                             f"(limit {max_table_bytes / 1e6:.0f} MB); "
+                             f"use cell >= {smallest_cell(gray.shape, max_table_bytes, dtype)}")
+        self.gray = gray
+        self.cell = cell
+        gh, gw = h // cell, w // cell
+
+        self.table = np.zeros((gh + 1, gw + 1, 256), dtype=dtype)
+
+        # Built one band of grid rows at a time so the temporary keys stay small
+        cell_cols = np.arange(gw * cell) // cell
+        running = np.zeros((gw, 256), dtype=self.table.dtype)
+        for gy in range(gh):
+            band = gray[gy * cell:(gy + 1) * cell, :gw * cell]
+            keys = cell_cols[None, :] * 256 + band
+            running += np.bincount(keys.ravel(), minlength=gw * 256).reshape(gw, 256).astype(running.dtype)
+            self.table[gy + 1, 1:] = np.cumsum(running, axis=0)
+
+    def histogram(self, y0, y1, x0, x1):
+        """256-bin histogram of gray[y0:y1, x0:x1]"""
+        cell = self.cell
+        gy0, gx0 = -(-y0 // cell), -(-x0 // cell)  # ceil
+        gy1 = min(y1 // cell, self.table.shape[0] - 1)
+        gx1 = min(x1 // cell, self.table.shape[1] - 1)
+
+        if gy0 >= gy1 or gx0 >= gx1:
+            return np.bincount(self.gray[y0:y1, x0:x1].ravel(), minlength=256).astype(np.int64)
+
+        t = self.table
+        hist = (t[gy1, gx1].astype(np.int64) - t[gy0, gx1] - t[gy1, gx0] + t[gy0, gx0])
+
+        # Strips between the box edge and the grid-aligned interior
+        iy0, iy1, ix0, ix1 = gy0 * cell, gy1 * cell, gx0 * cell, gx1 * cell
+        gray = self.gray
+        for strip in (gray[y0:iy0, x0:x1], gray[iy1:y1, x0:x1], gray[iy0:iy1, x0:ix0], gray[iy0:iy1, ix1:x1]):
+            if strip.size:
+                hist += np.bincount(strip.ravel(), minlength=256)
+        return hist
+
+    def histograms(self, boxes):
+        """(N, 256) histograms for boxes given as (x, y, width, height)"""
+        h, w = self.gray.shape
+        out = np.empty((len(boxes), 256), dtype=np.int64)
+        for i, (x, y, bw, bh) in enumerate(boxes):
+            x0, y0 = max(int(x), 0), max(int(y), 0)
+            out[i] = self.histogram(y0, min(int(y + bh), h), x0, min(int(x + bw), w))
+        return out
+
+    def otsu_thresholds(self, boxes):
+        """Otsu threshold per box, identical to threshold_otsu on each uint8 crop"""
+        return otsu_from_histograms(self.histograms(boxes))
+
+
+def otsu_from_histograms(hists):
+    """
+    Vectorized Otsu over rows of 256-bin integer histograms.
+
+    Follows skimage's threshold_otsu step for step, including its float32
+    counts (cumulative weights round the same way). Leading/trailing empty
+    bins only add exact zeros to the cumulative sums, so once the split points
+    outside [min, max) are masked out, argmax over the full 256 bins lands on
+    the same index skimage finds on its trimmed histogram.
+    """
+    hists = np.asarray(hists, dtype=np.int64)
+    centers = np.arange(256, dtype=np.int64)
+
+    nonzero = hists > 0
+    first = nonzero.argmax(axis=1)
+    last = 255 - nonzero[:, ::-1].argmax(axis=1)
+    single = first == last  # threshold_otsu returns the only value present
+
+    counts = hists.astype(np.float32)
+    weighted = counts * centers
+    weight1 = np.cumsum(counts, axis=1)
+    weight2 = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean1 = np.cumsum(weighted, axis=1) / weight1
+        mean2 = (np.cumsum(weighted[:, ::-1], axis=1) / weight2[:, ::-1])[:, ::-1]
+        variance12 = weight1[:, :-1] * weight2[:, 1:] * (mean1[:, :-1] - mean2[:, 1:]) ** 2
+
+    # Split points outside [first, last) are NaN or not real splits
+    idx = np.arange(255)
+    valid = (idx[None, :] >= first[:, None]) & (idx[None, :] < last[:, None])
+    variance12 = np.where(valid, variance12, -np.inf)
+
+    thresholds = np.where(single, first, variance12.argmax(axis=1))
+    return thresholds
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Bulk per-box Otsu via an integral histogram")
+    parser.add_argument("page", nargs="?", type=Path, default=DEFAULT_PAGE)
+    parser.add_argument("--boxes", type=int, default=500, help="random boxes to threshold")
+    parser.add_argument("--cell", type=int, default=DEFAULT_CELL, help="integral table grid cell (px)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from PIL import Image
+    from skimage.filters import threshold_otsu
+
+    gray = to_gray_uint8(np.asarray(Image.open(args.page).convert("RGB")))
+    h, w = gray.shape
+    rng = np.random.default_rng(args.seed)
+    bw = rng.integers(20, max(21, w // 8), args.boxes)
+    bh = rng.integers(20, max(21, h // 4), args.boxes)
+    boxes = np.stack([rng.integers(0, w - bw), rng.integers(0, h - bh), bw, bh], axis=1)
+
+    print(f"Page {w}x{h}, {args.boxes} boxes, cell {args.cell}")
+
+    started = time.perf_counter()
+    try:
+        integral = IntegralHistogram(gray, cell=args.cell)
+    except ValueError as e:
+        parser.error(str(e))
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    bulk = integral.otsu_thresholds(boxes)
+    bulk_time = time.perf_counter() - started
+    print(f"  Integral: build {built * 1000:.1f} ms ({integral.table.nbytes / 1e6:.1f} MB), "
+          f"thresholds {bulk_time * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    reference = np.array([threshold_otsu(gray[y:y + bh_, x:x + bw_]) for x, y, bw_, bh_ in boxes])
+    print(f"  Per-crop threshold_otsu: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    mismatches = np.count_nonzero(bulk != reference)
+    print("  Thresholds identical" if mismatches == 0 else f"  {mismatches} MISMATCHED thresholds")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
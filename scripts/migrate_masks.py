@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Offline bulk migration of legacy box masks to the eraseMask format.
+
+migrateBox() in src/utils/migrateMasks.js converts old masks lazily, one box
+at a time, every time a project loads:
+
+  brushMask      stroke arrays that mark what to KEEP; rasterized inverted
+                 (brushMaskToEraseMask), only when the box has no eraseMask
+  eraseMaskData  RGBA pixels, erase where alpha > 127 (rgbaToEraseMask)
+
+This rewrites exported projects (ZIPs or unpacked directories, see
+project_io.py) once, with the same rules and the same merge order
+(mergeEraseMasks), so the app stops paying for it on load. Masks are written
+in the serializeEraseMask() layout: a flat pixels list (0 = keep, 255 =
+erase), width, height, offsetX, offsetY.
+
+Strokes are rasterized with numpy instead of a canvas: each segment is
+stamped as a capsule (line of width `size` with round caps and joins, which
+also covers the per-point circles), and the "fill the interior" pass is a
+vectorized nonzero-winding scanline fill. Pixels are sampled at their
+centers, which is where the canvas's anti-aliased coverage crosses the
+R > 127 threshold, so edge pixels can differ from a browser in rare cases.
+
+Compaction (on by default, --no-trim to skip) crops each eraseMask to the
+bounding box of its erased pixels and drops masks with nothing erased. Masks
+are in absolute image coordinates, so this does not change what is erased.
+annotations.json is written without indentation; ExportPanel's indent=2
+puts every mask pixel on its own line.
+
+With --out, each project is written to <out>/<stem>-<hash><suffix> (the
+project_key() of its path, as project_previews.py does), since stems can
+repeat across folders.
+
+Run: python3 -u scripts/migrate_masks.py projects/ [--out migrated/] [--workers 4]
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from project_io import find_projects, js_round, project_key
+
+
+# ============================================================================
+# Rasterization (brushMaskToEraseMask)
+# ============================================================================
+def stamp_segment(keep, x0, y0, x1, y1, radius):
+    """Mark pixels whose center is within `radius` of segment (x0, y0)-(x1, y1)"""
+    h, w = keep.shape
+    bx0, bx1 = max(math.floor(min(x0, x1) - radius), 0), min(math.ceil(max(x0, x1) + radius) + 1, w)
+    by0, by1 = max(math.floor(min(y0, y1) - radius), 0), min(math.ceil(max(y0, y1) + radius) + 1, h)
+    if bx0 >= bx1 or by0 >= by1:
+        return
+
+    dx = (np.arange(bx0, bx1) + 0.5 - x0)[None, :]
+    dy = (np.arange(by0, by1) + 0.5 - y0)[:, None]
+    vx, vy = x1 - x0, y1 - y0
+    length2 = vx * vx + vy * vy
+    if length2 > 0:
+        t = np.clip((dx * vx + dy * vy) / length2, 0, 1)
+        dx, dy = dx - t * vx, dy - t * vy
+    keep[by0:by1, bx0:bx1] |= dx * dx + dy * dy <= radius * radius
+
+
+def winding_fill(polygons, shape):
+    """
+    Nonzero-winding fill of closed polygons (lists of (x, y) vertices),
+    sampled at pixel centers. Each polygon edge adds its direction to every
+    pixel center left of where it crosses that row; a prefix sum along the row
+    turns that into winding numbers.
+    """
+    h, w = shape
+    edges = [(np.asarray(p, dtype=np.float64), np.roll(np.asarray(p, dtype=np.float64), -1, axis=0))
+             for p in polygons if len(p) >= 3]
+    if not edges:
+        return np.zeros(shape, dtype=bool)
+    a = np.concatenate([e[0] for e in edges])
+    b = np.concatenate([e[1] for e in edges])
+
+    ys = np.arange(h)[:, None] + 0.5
+    upward = (a[:, 1] <= ys) & (b[:, 1] > ys)
+    downward = (b[:, 1] <= ys) & (a[:, 1] > ys)
+    rows, edge_ids = np.nonzero(upward | downward)
+    if rows.size == 0:
+        return np.zeros(shape, dtype=bool)
+
+    ea, eb = a[edge_ids], b[edge_ids]
+    x_cross = ea[:, 0] + (rows + 0.5 - ea[:, 1]) * (eb[:, 0] - ea[:, 0]) / (eb[:, 1] - ea[:, 1])
+    sign = np.where(upward[rows, edge_ids], 1, -1)
+    # Pixel column c has its center left of the crossing when c < x_cross - 0.5
+    stop = np.clip(np.ceil(x_cross - 0.5), 0, w).astype(np.int64)
+
+    diff = np.zeros((h, w + 1), dtype=np.int32)
+    np.add.at(diff, (rows, np.zeros_like(rows)), sign)
+    np.add.at(diff, (rows, stop), -sign)
+    return np.cumsum(diff[:, :w], axis=1) != 0
+
+
+def brush_keep_mask(strokes, width, height, box_x, box_y):
+    """Pixels the brush strokes keep, in box-relative coordinates"""
+    keep = np.zeros((height, width), dtype=bool)
+    polygons = []
+    for stroke in strokes:
+        points = stroke.get("points") or []
+        if not points:
+            continue
+        xy = [(p["x"] - box_x, p["y"] - box_y) for p in points]
+        radius = stroke["size"] / 2
+        # Zero-length segments (single points, repeated points) stamp a disk
+        for (x0, y0), (x1, y1) in zip(xy, xy[1:] or xy):
+            stamp_segment(keep, x0, y0, x1, y1, radius)
+        polygons.append(xy)
+    keep |= winding_fill(polygons, keep.shape)
+    return keep
+
+
+def brush_mask_to_erase_mask(brush_mask, box):
+    """brushMaskToEraseMask(): box-sized mask erasing everything the strokes don't keep"""
+    width, height = js_round(box["width"]), js_round(box["height"])
+    if width <= 0 or height <= 0:
+        raise ValueError(f"box {box.get('char')!r} has no area to rasterize a brushMask into")
+    keep = brush_keep_mask(brush_mask, width, height, box["x"], box["y"])
+    return np.where(keep, 0, 255).astype(np.uint8), box["x"], box["y"]
+
+
+def rgba_to_erase_mask(erase_mask_data):
+    """rgbaToEraseMask(): erase where alpha > 127. Offsets are unset, i.e. 0"""
+    pixels = erase_mask_data["pixels"]
+    if isinstance(pixels, dict):
+        # JSON.stringify of a typed array: {"0": r, "1": g, ...}
+        pixels = [pixels[str(i)] for i in range(len(pixels))]
+    width, height = erase_mask_data["width"], erase_mask_data["height"]
+    alpha = np.asarray(pixels, dtype=np.uint8).reshape(height, width, 4)[:, :, 3]
+    return np.where(alpha > 127, 255, 0).astype(np.uint8), 0, 0
+
+
+# ============================================================================
+# Merging / compaction
+# ============================================================================
+def merge_erase_masks(mask1, mask2):
+    """
+    mergeEraseMasks() on (uint8 pixels, offset_x, offset_y) tuples: mask1 is
+    copied as is, then mask2 ORs in 255 wherever it is nonzero.
+    """
+    if mask1 is None:
+        return mask2
+    if mask2 is None:
+        return mask1
+    (p1, x1, y1), (p2, x2, y2) = mask1, mask2
+    min_x, min_y = min(x1, x2), min(y1, y2)
+    max_x = max(x1 + p1.shape[1], x2 + p2.shape[1])
+    max_y = max(y1 + p1.shape[0], y2 + p2.shape[0])
+
+    merged = np.zeros((int(max_y - min_y), int(max_x - min_x)), dtype=np.uint8)
+    r1, c1 = int(y1 - min_y), int(x1 - min_x)
+    merged[r1:r1 + p1.shape[0], c1:c1 + p1.shape[1]] = p1
+    r2, c2 = int(y2 - min_y), int(x2 - min_x)
+    merged[r2:r2 + p2.shape[0], c2:c2 + p2.shape[1]][p2 > 0] = 255
+    return merged, min_x, min_y
+
+
+def trim_erase_mask(mask):
+    """Crop to the erased pixels' bounding box; None if nothing is erased"""
+    pixels, ox, oy = mask
+    rows, cols = np.any(pixels, axis=1), np.any(pixels, axis=0)
+    if not rows.any():
+        return None
+    r0, r1 = rows.argmax(), len(rows) - rows[::-1].argmax()
+    c0, c1 = cols.argmax(), len(cols) - cols[::-1].argmax()
+    return pixels[r0:r1, c0:c1], ox + int(c0), oy + int(r0)
+
+
+def serialize_erase_mask(mask):
+    """serializeEraseMask() layout"""
+    if mask is None:
+        return None
+    pixels, ox, oy = mask
+    return {
+        "pixels": pixels.ravel().tolist(),
+        "width": pixels.shape[1],
+        "height": pixels.shape[0],
+        "offsetX": ox or 0,
+        "offsetY": oy or 0,
+    }
+
+
+def parse_erase_mask(erase_mask):
+    """Stored eraseMask -> (uint8 pixels, offset_x, offset_y), values kept as stored"""
+    if not erase_mask:
+        return None
+    pixels = np.asarray(erase_mask["pixels"], dtype=np.uint8).reshape(erase_mask["height"], erase_mask["width"])
+    return pixels, erase_mask.get("offsetX") or 0, erase_mask.get("offsetY") or 0
+
+
+def migrate_box(box, trim=True):
+    """
+    migrateBox() plus optional compaction. Returns (box, changed); the input
+    box is not modified.
+    """
+    migrated = dict(box)
+    mask = parse_erase_mask(box.get("eraseMask"))
+    changed = False
+
+    if box.get("brushMask") and not box.get("eraseMask"):
+        mask = merge_erase_masks(mask, brush_mask_to_erase_mask(box["brushMask"], box))
+        del migrated["brushMask"]
+        changed = True
+
+    if box.get("eraseMaskData") and box["eraseMaskData"].get("isEraseMask"):
+        mask = merge_erase_masks(mask, rgba_to_erase_mask(box["eraseMaskData"]))
+        del migrated["eraseMaskData"]
+        changed = True
+
+    if trim and mask is not None:
+        trimmed = trim_erase_mask(mask)
+        if trimmed is None or trimmed[0].shape != mask[0].shape:
+            mask, changed = trimmed, True
+
+    if changed:
+        migrated["eraseMask"] = serialize_erase_mask(mask)
+    return migrated, changed
+
+
+# ============================================================================
+# Projects
+# ============================================================================
+def _write_atomic(path, write):
+    """Write via a temp file in the same directory, then rename over `path`"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    os.close(fd)
+    try:
+        write(Path(tmp))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def migrate_project(project_path, out_root=None, trim=True):
+    """
+    Migrate one project in place (or into out_root, as <stem>-<hash><suffix>
+    from project_key() so same-named projects from different folders don't
+    overwrite each other); returns stats
+    """
+    project_path = Path(project_path)
+    is_zip = project_path.suffix == ".zip"
+    if is_zip:
+        with zipfile.ZipFile(project_path) as zf:
+            raw = zf.read("annotations.json")
+    else:
+        raw = (project_path / "annotations.json").read_bytes()
+
+    annotations = json.loads(raw)
+    boxes = annotations.get("boxes") or []
+    target = Path(out_root) / (project_key(project_path) + project_path.suffix) if out_root else project_path
+    stats = {"boxes": len(boxes), "migrated": 0, "skipped": 0, "bytes_before": len(raw), "bytes_after": len(raw),
+             "target": target}
+    if not trim and not needs_migration(boxes) and out_root is None:
+        return stats
+
+    migrated = []
+    for box in boxes:
+        try:
+            box, box_changed = migrate_box(box, trim=trim)
+        except ValueError:
+            # migrateBox() would throw on this box too; leave it for the app
+            box_changed = False
+            stats["skipped"] += 1
+        migrated.append(box)
+        stats["migrated"] += box_changed
+
+    changed = stats["migrated"]
+    if not changed and target == project_path:
+        return stats
+
+    annotations["boxes"] = migrated
+    encoded = json.dumps(annotations, separators=(",", ":")).encode("utf-8")
+    stats["bytes_after"] = len(encoded)
+
+    if is_zip:
+        def write(tmp):
+            with zipfile.ZipFile(project_path) as src, zipfile.ZipFile(tmp, "w") as dst:
+                for info in src.infolist():
+                    if info.filename == "annotations.json":
+                        dst.writestr(info, encoded, compress_type=zipfile.ZIP_DEFLATED)
+                    else:
+                        dst.writestr(info, src.read(info))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(target, write)
+    else:
+        if target != project_path:
+            shutil.copytree(project_path, target, dirs_exist_ok=True)
+        _write_atomic(target / "annotations.json", lambda tmp: tmp.write_bytes(encoded))
+    return stats
+
+
+def needs_migration(boxes):
+    """needsMigration() from migrateMasks.js"""
+    return any(box.get("brushMask") or (box.get("eraseMaskData") or {}).get("isEraseMask") for box in boxes)
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy box masks to eraseMask in bulk")
+    parser.add_argument("projects", nargs="+", help="project ZIPs, project dirs, or dirs containing them")
+    parser.add_argument("--out", type=Path, help="write migrated projects here instead of in place")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-trim", dest="trim", action="store_false",
+                        help="keep eraseMask extents as they are instead of cropping to erased pixels")
+    args = parser.parse_args()
+
+    # The same project listed twice would be written by two workers at once
+    projects = list({project_key(path): path for path in find_projects(args.projects)}.values())
+    print(f"Migrating {len(projects)} project(s){f' into {args.out}' if args.out else ' in place'}")
+
+    started = time.perf_counter()
+    totals = {"boxes": 0, "migrated": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [(path, pool.submit(migrate_project, path, args.out, args.trim)) for path in projects]
+        for path, future in futures:
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"  {path}: FAILED ({e})")
+                continue
+            for key in totals:
+                totals[key] += stats[key]
+            where = f"{path} -> {stats['target']}" if args.out else str(path)
+            print(f"  {where}: {stats['migrated']}/{stats['boxes']} boxes rewritten, "
+                  f"annotations {stats['bytes_before'] / 1024:.0f} -> {stats['bytes_after'] / 1024:.0f} KB"
+                  + (f", {stats['skipped']} box(es) with no area skipped" if stats["skipped"] else ""))
+
+    print(f"{totals['migrated']}/{totals['boxes']} boxes rewritten, "
+          f"annotations {totals['bytes_before'] / 1e6:.2f} -> {totals['bytes_after'] / 1e6:.2f} MB "
+          f"in {time.perf_counter() - started:.2f} s" + (f", {failed} project(s) failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Read annotator projects from disk.
+
+Python tools can't reach the browser's IndexedDB, so they work on what the
+app exports: the project ZIP from ExportPanel (annotations.json + the source
+image) or an unpacked directory with the same two files.
+
+eraseMask format matches src/utils/maskUtils.js: single channel, 0 = keep,
+255 = erase, stored in absolute image coordinates at (offsetX, offsetY).
+"""
+
+import hashlib
+import io
+import json
+import math
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+
+
+def find_projects(paths):
+    """Expand files/directories into project paths (ZIPs or dirs with annotations.json)"""
+    found = []
+    for path in map(Path, paths):
+        if path.is_dir() and (path / "annotations.json").exists():
+            found.append(path)
+        elif path.is_dir():
+            found.extend(sorted(path.glob("*.zip")))
+            found.extend(sorted(p.parent for p in path.glob("*/annotations.json")))
+        elif path.suffix == ".zip":
+            found.append(path)
+    return found
+
+
+def load_project(path):
+    """
+    Load a project ZIP or directory.
+    Returns {"name", "key", "path", "annotations", "image_name", "image_bytes"};
+    the image is left encoded so callers that only need boxes skip decoding.
+    """
+    path = Path(path)
+    if path.is_dir():
+        annotations = json.loads((path / "annotations.json").read_text())
+        image_path = _pick_image(path.iterdir(), annotations.get("imageName"))
+        image_bytes = image_path.read_bytes() if image_path else None
+        image_name = image_path.name if image_path else None
+    else:
+        with zipfile.ZipFile(path) as zf:
+            annotations = json.loads(zf.read("annotations.json"))
+            names = [Path(n) for n in zf.namelist()]
+            image_path = _pick_image(names, annotations.get("imageName"))
+            image_bytes = zf.read(str(image_path)) if image_path else None
+            image_name = image_path.name if image_path else None
+
+    return {
+        "name": path.stem,
+        "key": project_key(path),
+        "path": path,
+        "annotations": annotations,
+        "image_name": image_name,
+        "image_bytes": image_bytes,
+    }
+
+
+def project_key(path):
+    """
+    Unique, filesystem-safe id for a project path: its stem plus a short hash
+    of the resolved path, so a/p1.zip and b/p1.zip don't collide
+    """
+    path = Path(path)
+    return f"{path.stem}-{hashlib.sha1(str(path.resolve()).encode('utf-8')).hexdigest()[:8]}"
+
+
+def _pick_image(paths, preferred_name):
+    images = [p for p in paths if Path(p).suffix.lower() in IMAGE_SUFFIXES]
+    for p in images:
+        if Path(p).name == preferred_name:
+            return Path(p)
+    return Path(images[0]) if images else None
+
+
+def decode_image(image_bytes):
+    """Decode project image bytes to an RGB uint8 array"""
+    return np.asarray(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+
+
+def content_hash(*parts):
+    """Stable hex digest over bytes/str/JSON-able parts"""
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = json.dumps(part, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def js_round(value):
+    """JS Math.round(): halves round up (Python's round() sends 10.5 to 10)"""
+    return math.floor(value + 0.5)
+
+
+def box_rect(box):
+    """Integer (x0, y0, x1, y1) of a box, rounded with Math.round() as migrateBox() does"""
+    x0, y0 = js_round(box["x"]), js_round(box["y"])
+    return x0, y0, x0 + js_round(box["width"]), y0 + js_round(box["height"])
+
+
+def erase_mask_array(erase_mask):
+    """eraseMask dict -> (bool array, offset_x, offset_y), or None"""
+    if not erase_mask:
+        return None
+    width, height = erase_mask["width"], erase_mask["height"]
+    pixels = np.asarray(erase_mask["pixels"], dtype=np.uint8).reshape(height, width)
+    return pixels > 0, int(erase_mask.get("offsetX") or 0), int(erase_mask.get("offsetY") or 0)
+
+
+def box_erase_mask(box):
+    """
+    A box's eraseMask clipped to the box rectangle, in box-relative coords.
+    Returns a bool array of the box's size (all False when there is no mask).
+    """
+    x0, y0, x1, y1 = box_rect(box)
+    out = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=bool)
+    parsed = erase_mask_array(box.get("eraseMask"))
+    if parsed is None:
+        return out
+
+    mask, ox, oy = parsed
+    mh, mw = mask.shape
+    # Intersection of mask and box in image coordinates
+    ix0, iy0 = max(x0, ox), max(y0, oy)
+    ix1, iy1 = min(x1, ox + mw), min(y1, oy + mh)
+    if ix0 < ix1 and iy0 < iy1:
+        out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = mask[iy0 - oy:iy1 - oy, ix0 - ox:ix1 - ox]
+    return out
+
+
+def crop_box(image, box):
+    """Crop a box out of an image array, clamped to the image bounds"""
+    x0, y0, x1, y1 = box_rect(box)
+    h, w = image.shape[:2]
+    crop = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)) + image.shape[2:], dtype=image.dtype)
+    cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+    if cx0 < cx1 and cy0 < cy1:
+        crop[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = image[cy0:cy1, cx0:cx1]
+    return crop
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Batch thumbnail and contact-sheet generator for exported projects.
+
+For each project (ZIP export or unpacked directory, see project_io.py):
+
+  <out>/<key>/thumbnail.webp    - downscaled page with box outlines and
+                                  erase masks overlaid
+  <out>/<key>/contact_sheet.png - every sanitized glyph in a grid
+  <out>/<key>/glyphs/<hash>.png - cached contact-sheet cells
+  <out>/<key>/previews.json     - content hashes from the last run
+
+<key> is project_io.project_key(): the project's stem plus a hash of its
+path, so same-named projects from different folders get their own outputs.
+
+Work is incremental. Every glyph cell is keyed by a hash of the image bytes,
+its box and its eraseMask. The thumbnail and sheet are keyed by the hashes of
+everything they contain. A re-run only re-renders boxes that changed. The
+image is decoded only when something actually needs rendering.
+
+Run: python3 -u scripts/project_previews.py projects/ --out previews/
+"""
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from project_io import (
+    box_erase_mask,
+    box_rect,
+    content_hash,
+    crop_box,
+    decode_image,
+    erase_mask_array,
+    find_projects,
+    load_project,
+)
+
+RENDER_VERSION = 1
+
+BOX_COLOR = np.array([40, 200, 90], dtype=np.float32)
+MASK_COLOR = np.array([255, 50, 50], dtype=np.float32)
+MASK_ALPHA = 0.55
+
+
+# ============================================================================
+# Thumbnail
+# ============================================================================
+def downscale(image, max_size):
+    """Downscale an RGB array so its longest side is <= max_size; returns (array, scale)"""
+    h, w = image.shape[:2]
+    scale = min(max_size / w, max_size / h, 1.0)
+    if scale >= 1.0:
+        return image.copy(), 1.0
+    img = Image.fromarray(image)
+    # reducing_gap does a cheap integer reduce first, then a short resample
+    img.thumbnail((max(1, round(w * scale)), max(1, round(h * scale))), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    thumb = np.array(img)
+    return thumb, thumb.shape[1] / w
+
+
+def mask_coverage(boxes, shape, scale):
+    """Union of all eraseMasks resampled (nearest) onto a thumbnail grid"""
+    th, tw = shape
+    coverage = np.zeros((th, tw), dtype=bool)
+    for box in boxes:
+        parsed = erase_mask_array(box.get("eraseMask"))
+        if parsed is None:
+            continue
+        mask, ox, oy = parsed
+        mh, mw = mask.shape
+        ty0, ty1 = max(int(oy * scale), 0), min(int(math.ceil((oy + mh) * scale)), th)
+        tx0, tx1 = max(int(ox * scale), 0), min(int(math.ceil((ox + mw) * scale)), tw)
+        if ty0 >= ty1 or tx0 >= tx1:
+            continue
+        rows = np.clip(((np.arange(ty0, ty1) + 0.5) / scale).astype(int) - oy, 0, mh - 1)
+        cols = np.clip(((np.arange(tx0, tx1) + 0.5) / scale).astype(int) - ox, 0, mw - 1)
+        coverage[ty0:ty1, tx0:tx1] |= mask[np.ix_(rows, cols)]
+    return coverage
+
+
+def box_outlines(boxes, shape, scale):
+    """
+    1px outlines of every box on a thumbnail grid, without a per-box draw loop:
+    each edge is written as +1/-1 into a difference array, then one cumsum
+    along each axis turns the markers into line segments.
+    """
+    th, tw = shape
+    if not boxes:
+        return np.zeros((th, tw), dtype=bool)
+
+    rects = np.array([box_rect(b) for b in boxes], dtype=float) * scale
+    x0 = np.clip(rects[:, 0].astype(int), 0, tw - 1)
+    y0 = np.clip(rects[:, 1].astype(int), 0, th - 1)
+    x1 = np.clip(np.ceil(rects[:, 2]).astype(int) - 1, 0, tw - 1)
+    y1 = np.clip(np.ceil(rects[:, 3]).astype(int) - 1, 0, th - 1)
+
+    horizontal = np.zeros((th, tw + 1), dtype=np.int32)
+    for y in (y0, y1):
+        np.add.at(horizontal, (y, x0), 1)
+        np.add.at(horizontal, (y, x1 + 1), -1)
+
+    vertical = np.zeros((th + 1, tw), dtype=np.int32)
+    for x in (x0, x1):
+        np.add.at(vertical, (y0, x), 1)
+        np.add.at(vertical, (y1 + 1, x), -1)
+
+    return (np.cumsum(horizontal, axis=1)[:, :tw] > 0) | (np.cumsum(vertical, axis=0)[:th, :] > 0)
+
+
+def render_thumbnail(image, boxes, max_size):
+    thumb, scale = downscale(image, max_size)
+    out = thumb.astype(np.float32)
+
+    coverage = mask_coverage(boxes, thumb.shape[:2], scale)
+    out[coverage] = out[coverage] * (1 - MASK_ALPHA) + MASK_COLOR * MASK_ALPHA
+    out[box_outlines(boxes, thumb.shape[:2], scale)] = BOX_COLOR
+
+    return Image.fromarray(out.astype(np.uint8))
+
+
+# ============================================================================
+# Contact sheet
+# ============================================================================
+def render_glyph_cell(image, box, cell_size, label_height=14):
+    """One contact-sheet cell: the sanitized glyph fitted into a square, char label below"""
+    crop = crop_box(image, box)
+    erased = box_erase_mask(box)
+
+    cell = Image.new("RGB", (cell_size, cell_size + label_height), (255, 255, 255))
+    if crop.size:
+        rgba = np.dstack([crop, np.where(erased, 0, 255).astype(np.uint8)])
+        glyph = Image.fromarray(rgba, "RGBA")
+        glyph.thumbnail((cell_size - 4, cell_size - 4), Image.Resampling.LANCZOS)
+        cell.paste(glyph, ((cell_size - glyph.width) // 2, (cell_size - glyph.height) // 2), glyph)
+
+    draw = ImageDraw.Draw(cell)
+    draw.text((4, cell_size), str(box.get("char", "")), fill=(80, 80, 80))
+    return cell
+
+
+def compose_sheet(cell_paths, columns):
+    """Grid of the cell PNGs; each file is open only while it is pasted"""
+    with Image.open(cell_paths[0]) as first:
+        cell_w, cell_h = first.size
+    rows = math.ceil(len(cell_paths) / columns)
+    sheet = Image.new("RGB", (cell_w * min(columns, len(cell_paths)), cell_h * rows), (255, 255, 255))
+    for i, path in enumerate(cell_paths):
+        with Image.open(path) as cell:
+            sheet.paste(cell, ((i % columns) * cell_w, (i // columns) * cell_h))
+    return sheet
+
+
+# ============================================================================
+# Incremental driver
+# ============================================================================
+def glyph_hash(image_hash, box, cell_size):
+    key = {k: box.get(k) for k in ("char", "x", "y", "width", "height", "eraseMask")}
+    return content_hash("glyph", RENDER_VERSION, cell_size, image_hash, key)
+
+
+def process_project(project_path, out_root, args):
+    """Render whatever changed for one project; returns a stats dict"""
+    project = load_project(project_path)
+    boxes = project["annotations"].get("boxes") or []
+    out_dir = out_root / project["key"]
+    glyph_dir = out_dir / "glyphs"
+    glyph_dir.mkdir(parents=True, exist_ok=True)
+
+    index_path = out_dir / "previews.json"
+    previous = json.loads(index_path.read_text()) if index_path.exists() else {}
+
+    image_hash = content_hash(project["image_bytes"] or b"")
+    glyph_hashes = [glyph_hash(image_hash, box, args.cell_size) for box in boxes]
+    thumb_hash = content_hash("thumb", RENDER_VERSION, args.thumb_size, glyph_hashes, image_hash)
+    sheet_hash = content_hash("sheet", RENDER_VERSION, args.columns, glyph_hashes)
+
+    thumb_path = out_dir / "thumbnail.webp"
+    sheet_path = out_dir / "contact_sheet.png"
+    missing = [i for i, h in enumerate(glyph_hashes) if not (glyph_dir / f"{h}.png").exists()]
+    need_thumb = args.force or previous.get("thumbnail") != thumb_hash or not thumb_path.exists()
+    need_sheet = args.force or previous.get("contact_sheet") != sheet_hash or not sheet_path.exists()
+    if args.force:
+        missing = list(range(len(boxes)))
+
+    stats = {"boxes": len(boxes), "glyphs_rendered": 0, "thumbnail": False, "contact_sheet": False}
+
+    image = None
+    if (missing or need_thumb) and project["image_bytes"] is not None:
+        image = decode_image(project["image_bytes"])
+
+    if image is not None:
+        for i in missing:
+            render_glyph_cell(image, boxes[i], args.cell_size).save(glyph_dir / f"{glyph_hashes[i]}.png")
+        stats["glyphs_rendered"] = len(missing)
+
+        if need_thumb:
+            render_thumbnail(image, boxes, args.thumb_size).save(thumb_path, quality=80)
+            stats["thumbnail"] = True
+
+    if need_sheet and glyph_hashes and all((glyph_dir / f"{h}.png").exists() for h in glyph_hashes):
+        cell_paths = [glyph_dir / f"{h}.png" for h in glyph_hashes]
+        compose_sheet(cell_paths, args.columns).save(sheet_path, compress_level=args.compress_level)
+        stats["contact_sheet"] = True
+
+    # Drop cells for boxes that no longer exist
+    keep = {f"{h}.png" for h in glyph_hashes}
+    for stale in glyph_dir.glob("*.png"):
+        if stale.name not in keep:
+            stale.unlink()
+
+    index_path.write_text(json.dumps({
+        "image": image_hash,
+        "thumbnail": thumb_hash if thumb_path.exists() else None,
+        "contact_sheet": sheet_hash if sheet_path.exists() else None,
+        "glyphs": glyph_hashes,
+    }, indent=1) + "\n")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate project thumbnails and glyph contact sheets")
+    parser.add_argument("projects", nargs="+", help="project ZIPs, project dirs, or dirs containing them")
+    parser.add_argument("--out", type=Path, default=Path("previews"))
+    parser.add_argument("--thumb-size", type=int, default=200, help="max thumbnail side (px)")
+    parser.add_argument("--cell-size", type=int, default=64, help="contact-sheet cell size (px)")
+    parser.add_argument("--columns", type=int, default=16, help="contact-sheet columns")
+    parser.add_argument("--compress-level", type=int, default=3, help="PNG zlib level for contact sheets")
+    parser.add_argument("--force", action="store_true", help="ignore caches and re-render everything")
+    args = parser.parse_args()
+
+    projects = find_projects(args.projects)
+    print(f"Previewing {len(projects)} project(s) into {args.out}")
+
+    for project_path in projects:
+        started = time.perf_counter()
+        stats = process_project(project_path, args.out, args)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"  {project_path}: {stats['glyphs_rendered']}/{stats['boxes']} glyphs rendered, "
+              f"thumbnail {'updated' if stats['thumbnail'] else 'cached'}, "
+              f"sheet {'updated' if stats['contact_sheet'] else 'cached'} ({elapsed:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
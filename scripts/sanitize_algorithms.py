@@ -0,0 +1,882 @@
+#!/usr/bin/env python3
+"""
+Sanitize box analysis algorithms.
+
+Importable core of scripts/test_sanitize.py: grayscale/threshold helpers and
+the seven intruder-detection algorithms, without any visualization or I/O.
+
+scipy and skimage submodules are loaded lazily on first attribute access, so
+`import sanitize_algorithms` only pays for numpy. Call warm_up() to pull the
+heavy modules in ahead of time (e.g. in a long-lived worker before the first
+request arrives).
+"""
+
+import importlib
+
+import numpy as np
+
+
+class _LazyModule:
+    """Module proxy that imports `name` the first time an attribute is read"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+ndimage = _LazyModule("scipy.ndimage")
+signal = _LazyModule("scipy.signal")
+filters = _LazyModule("skimage.filters")
+morphology = _LazyModule("skimage.morphology")
+segmentation = _LazyModule("skimage.segmentation")
+
+LAZY_MODULES = (ndimage, signal, filters, morphology, segmentation)
+
+
+def warm_up():
+    """
+    Import every heavy submodule and run each hot code path once on a tiny
+    synthetic crop, so later calls don't pay first-use costs.
+    """
+    for module in LAZY_MODULES:
+        module._load()
+
+    crop = np.full((48, 48, 3), 255, dtype=np.uint8)
+    crop[8:40, 20:28] = 0
+    crop[10:38, :4] = 0
+    algo_connected_components(crop, dilation_percent=2.0)
+    algo_connected_components(crop, adaptive_threshold=True)
+    algo_projection_profile(crop)
+    algo_flood_fill_corners(crop)
+    algo_gradient_edges(crop)
+
+
+def to_grayscale(img_array):
+    """Convert to grayscale using luminance formula"""
+    return 0.299 * img_array[:,:,0] + 0.587 * img_array[:,:,1] + 0.114 * img_array[:,:,2]
+
+
+def detect_text_color(img_array):
+    """
+    Detect if text is dark-on-light or light-on-dark.
+    Returns True if text appears darker than background.
+    """
+    return _gray_is_dark_text(to_grayscale(img_array))
+
+
+def _gray_is_dark_text(gray):
+    """detect_text_color() on an already-converted grayscale image"""
+    # Check corners vs center
+    h, w = gray.shape
+    corner_avg = (gray[0,0] + gray[0,-1] + gray[-1,0] + gray[-1,-1]) / 4
+    center_avg = gray[h//3:2*h//3, w//3:2*w//3].mean()
+    return center_avg < corner_avg  # True if center (text) is darker
+
+
+def get_binary(gray, invert=False):
+    """Convert grayscale to binary using Otsu's threshold"""
+    threshold = filters.threshold_otsu(gray)
+    if invert:
+        return gray > threshold  # Light pixels are foreground
+    return gray < threshold  # Dark pixels are foreground
+
+
+# ============================================================================
+# Shared analysis context
+# ============================================================================
+class AnalysisContext:
+    """
+    Intermediates shared by every algorithm for one crop.
+
+    Each value is computed on first access and cached, so running several
+    algorithms on the same context converts to grayscale, detects text color,
+    runs Otsu, projects and labels only once. Cached arrays are shared between
+    algorithms and must not be modified in place.
+
+    Every algo_* function takes an optional ctx; pass the same one to all of
+    them (as algo_ensemble does) to share the work.
+    """
+
+    def __init__(self, img_array):
+        self.img_array = img_array
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def gray(self):
+        return self._cached("gray", lambda: to_grayscale(self.img_array))
+
+    @property
+    def is_dark_text(self):
+        return self._cached("is_dark_text", lambda: _gray_is_dark_text(self.gray))
+
+    @property
+    def binary(self):
+        """Otsu binary with foreground = text"""
+        return self._cached("binary", lambda: get_binary(self.gray, invert=not self.is_dark_text))
+
+    @property
+    def column_projection(self):
+        """Foreground pixel count per column (int)"""
+        return self._cached("column_projection", lambda: self.binary.sum(axis=0))
+
+    @property
+    def row_projection(self):
+        """Foreground pixel count per row (int)"""
+        return self._cached("row_projection", lambda: self.binary.sum(axis=1))
+
+    @property
+    def sobel_h(self):
+        """Horizontal gradient (vertical edges) of gray scaled to 0-1"""
+        return self._cached("sobel_h", lambda: filters.sobel_h(self.gray / 255.0))
+
+    def adaptive_binary(self):
+        """Local-threshold binary, better for gradients and shadows"""
+        def compute():
+            gray = self.gray
+            block_size = max(35, min(gray.shape) // 10)
+            if block_size % 2 == 0:
+                block_size += 1  # Must be odd
+            local_thresh = filters.threshold_local(gray, block_size, offset=10)
+            if self.is_dark_text:
+                return gray < local_thresh
+            return gray > local_thresh
+        return self._cached("adaptive_binary", compute)
+
+    def component_labels(self, adaptive=False):
+        """
+        Closed + hole-filled binary, labeled.
+        Returns (binary, labeled, num_features); binary is the unfilled
+        threshold result the labels were built from.
+        """
+        def compute():
+            binary = self.adaptive_binary() if adaptive else self.binary
+
+            # Morphological closing to connect nearby parts and fill small gaps
+            # This helps with letters that have thin connections or slight gaps
+            struct = morphology.disk(3)
+            binary_closed = morphology.binary_closing(binary, struct)
+
+            # Fill holes to handle letter counters (like the hole in 'o', 'a', 'e')
+            binary_filled = ndimage.binary_fill_holes(binary_closed)
+
+            # Label connected components on the filled/closed binary
+            labeled, num_features = ndimage.label(binary_filled)
+            return binary, labeled, num_features
+        return self._cached(("component_labels", adaptive), compute)
+
+
+def _context(img_array, ctx):
+    """Return ctx, or a fresh context when the caller didn't share one"""
+    return ctx if ctx is not None else AnalysisContext(img_array)
+
+
+# ============================================================================
+# Algorithm 1: Column Density Valley Detection (current implementation)
+# ============================================================================
+def algo_column_density(img_array, edge_search_percent=30, valley_threshold=0.15, min_valley_width=5,
+                        ctx=None):
+    """
+    Detect intruders by finding valleys in column density profile.
+    If we see content at edge, then a valley, the edge content is an intruder.
+    """
+    ctx = _context(img_array, ctx)
+    binary = ctx.binary
+
+    h, w = binary.shape
+
+    # Calculate column density (count of foreground pixels per column)
+    column_density = ctx.column_projection
+    max_density = column_density.max()
+
+    if max_density == 0:
+        return None, None, {"column_density": column_density, "message": "No content detected"}
+
+    valley_threshold_abs = max_density * valley_threshold
+    content_threshold = max_density * 0.3
+    edge_search_width = int(w * edge_search_percent / 100)
+
+    # Search from left
+    left_mask_end = None
+    saw_content = False
+    consecutive_low = 0
+
+    for x in range(edge_search_width):
+        is_content = column_density[x] > content_threshold
+        is_valley = column_density[x] <= valley_threshold_abs
+
+        if is_content:
+            saw_content = True
+            consecutive_low = 0
+        elif is_valley and saw_content:
+            consecutive_low += 1
+            if consecutive_low >= min_valley_width:
+                left_mask_end = x - consecutive_low + 1
+                break
+        else:
+            consecutive_low = 0
+
+    # Search from right
+    right_mask_start = None
+    saw_content = False
+    consecutive_low = 0
+
+    for x in range(w - 1, w - edge_search_width - 1, -1):
+        is_content = column_density[x] > content_threshold
+        is_valley = column_density[x] <= valley_threshold_abs
+
+        if is_content:
+            saw_content = True
+            consecutive_low = 0
+        elif is_valley and saw_content:
+            consecutive_low += 1
+            if consecutive_low >= min_valley_width:
+                right_mask_start = x + consecutive_low
+                break
+        else:
+            consecutive_low = 0
+
+    return left_mask_end, right_mask_start, {
+        "column_density": column_density,
+        "max_density": max_density,
+        "valley_threshold_abs": valley_threshold_abs,
+        "content_threshold": content_threshold,
+    }
+
+
+# ============================================================================
+# Algorithm 2: Connected Component Analysis (Shape-based masking)
+# ============================================================================
+# How aggressively algo_connected_components() marks edge components as intruders
+SENSITIVITY_SETTINGS = {
+    'low': {'score_ratio': 0.3, 'require_cut_off': True},
+    'medium': {'score_ratio': 0.5, 'require_cut_off': False},
+    'high': {'score_ratio': 0.7, 'require_cut_off': False},
+}
+
+# Band (px) along each edge that decides whether a component is cut off
+EDGE_MARGIN = 5
+EDGE_SLICES = {
+    "left": (slice(None), slice(None, EDGE_MARGIN)),
+    "right": (slice(None), slice(-EDGE_MARGIN, None)),
+    "top": (slice(None, EDGE_MARGIN), slice(None)),
+    "bottom": (slice(-EDGE_MARGIN, None), slice(None)),
+}
+
+
+def score_component(area, bbox, centroid, shape, edge_sum):
+    """
+    Edge contact, cut-off flags and score of one component (higher = more
+    likely the main letter). Shared by algo_connected_components() and
+    lean_sanitize.lean_connected_components() so both score identically.
+
+    bbox is (min_col, min_row, max_col, max_row), centroid (x, y).
+    edge_sum(side) returns the component's pixel count within EDGE_MARGIN of
+    that side ("left", "right", "top", "bottom"); it is only called for sides
+    the component touches.
+    """
+    h, w = shape
+    total_area = h * w
+    min_col, min_row, max_col, max_row = bbox
+    centroid_x, centroid_y = centroid
+    bbox_width = max_col - min_col
+    bbox_height = max_row - min_row
+
+    # Check which edges it touches (within 3 pixels)
+    touches_left = min_col <= 3
+    touches_right = max_col >= w - 4
+    touches_top = min_row <= 3
+    touches_bottom = max_row >= h - 4
+
+    # Check if component is "cut off" at the edge (partial letter)
+    # A cut-off component has significant density right at the edge
+    cut_off_left = touches_left and edge_sum("left") > (bbox_height * EDGE_MARGIN * 0.3)
+    cut_off_right = touches_right and edge_sum("right") > (bbox_height * EDGE_MARGIN * 0.3)
+    cut_off_top = touches_top and edge_sum("top") > (bbox_width * EDGE_MARGIN * 0.3)
+    cut_off_bottom = touches_bottom and edge_sum("bottom") > (bbox_width * EDGE_MARGIN * 0.3)
+
+    is_cut_off = cut_off_left or cut_off_right or cut_off_top or cut_off_bottom
+
+    # Score: higher = more likely to be the main letter (keep)
+    score = 0
+
+    # Centroid distance from center (normalized 0-1) - STRONG weight on centering
+    dist_from_center_x = abs(centroid_x - w / 2) / (w / 2)
+    dist_from_center_y = abs(centroid_y - h / 2) / (h / 2)
+
+    # Being centered is very important
+    score += (1 - dist_from_center_x) * 50
+    score += (1 - dist_from_center_y) * 30
+
+    # Large area is good but less important than centering
+    area_ratio = area / total_area
+    score += area_ratio * 40
+
+    # Bbox coverage of image (main letter usually spans a good portion)
+    bbox_coverage_x = bbox_width / w
+    bbox_coverage_y = bbox_height / h
+    score += bbox_coverage_x * 20
+    score += bbox_coverage_y * 20
+
+    # Touching only one edge is suspicious (intruder)
+    if touches_left and not touches_right:
+        score -= 40
+    if touches_right and not touches_left:
+        score -= 40
+    if touches_top and not touches_bottom:
+        score -= 20
+    if touches_bottom and not touches_top:
+        score -= 20
+
+    # Being cut off at edge is very suspicious
+    if is_cut_off:
+        score -= 60
+
+    # Touching opposite edges means it spans the box (likely main letter)
+    if touches_left and touches_right:
+        score += 40
+    if touches_top and touches_bottom:
+        score += 30
+
+    return {
+        "area_ratio": area_ratio,
+        "touches": {"left": touches_left, "right": touches_right, "top": touches_top, "bottom": touches_bottom},
+        "cut_off": {"left": cut_off_left, "right": cut_off_right, "top": cut_off_top, "bottom": cut_off_bottom},
+        "is_cut_off": is_cut_off,
+        "score": score,
+    }
+
+
+def select_intruders(components, sensitivity):
+    """
+    Intruders among score-sorted components; components[0] is the main letter.
+
+    A component is an intruder if it touches an edge and either is cut off
+    (partial letter) or, unless the sensitivity requires a cut-off, scores
+    well below the main letter.
+    """
+    settings = SENSITIVITY_SETTINGS.get(sensitivity, SENSITIVITY_SETTINGS['medium'])
+    main_component = components[0]
+
+    intruder_components = []
+    for comp in components[1:]:  # Skip the main component
+        # Must touch at least one edge
+        if not any(comp["touches"].values()):
+            continue
+        # If it's cut off at an edge, it's definitely an intruder
+        # Or if score is much lower than main (based on sensitivity)
+        if comp["is_cut_off"] or (
+            not settings['require_cut_off'] and comp["score"] < main_component["score"] * settings['score_ratio']
+        ):
+            intruder_components.append(comp)
+    return intruder_components
+
+
+def algo_connected_components(img_array, min_area_ratio=0.005, dilation=0,
+                               dilation_percent=None, adaptive_threshold=False,
+                               sensitivity='medium', ctx=None):
+    """
+    Find connected components (blobs) and identify intruders by their shape.
+    Returns actual pixel masks for intruding shapes, not just rectangular regions.
+
+    Parameters:
+    - dilation: fixed pixels to expand the mask by (catches anti-aliased edges)
+    - dilation_percent: percentage of image size for dilation (overrides dilation if set)
+                        e.g., 1.0 = 1% of min(width, height)
+    - adaptive_threshold: use adaptive thresholding for better gradient handling
+    - sensitivity: 'low', 'medium', 'high' - how aggressively to detect intruders
+
+    Improvements:
+    - Morphological closing to connect nearby parts (handles letters with gaps)
+    - Better scoring: strongly prefer centered components
+    - Only mask components that touch an edge AND are cut off (partial)
+    - Handle letter counters (holes) by using filled binary
+    """
+    ctx = _context(img_array, ctx)
+
+    # Threshold (Otsu or adaptive), close, fill holes and label
+    binary, labeled, num_features = ctx.component_labels(adaptive=adaptive_threshold)
+
+    h, w = binary.shape
+
+    total_area = h * w
+
+    components = []
+
+    for i in range(1, num_features + 1):
+        component_mask = labeled == i
+
+        # Use original binary for the actual mask (not filled)
+        # This gives us the true letter shape without filled counters
+        actual_mask = binary & component_mask
+
+        area = actual_mask.sum()
+
+        # Skip tiny noise
+        if area < total_area * min_area_ratio:
+            continue
+
+        # Find bounding box and centroid
+        rows, cols = np.where(component_mask)
+        if len(rows) == 0:
+            continue
+
+        bbox = (cols.min(), rows.min(), cols.max(), rows.max())
+        centroid = (cols.mean(), rows.mean())
+
+        components.append({
+            "id": i,
+            "area": area,
+            "centroid": centroid,
+            "bbox": bbox,
+            **score_component(area, bbox, centroid, (h, w), lambda side: actual_mask[EDGE_SLICES[side]].sum()),
+            "mask": actual_mask,  # Use original binary, not filled
+        })
+
+    if not components:
+        return None, {"message": "No components found", "components": []}
+
+    # Find the main letter (highest score)
+    components.sort(key=lambda c: c["score"], reverse=True)
+    main_component = components[0]
+
+    intruder_components = select_intruders(components, sensitivity)
+    intruder_masks = [comp["mask"] for comp in intruder_components]
+
+    # Combine all intruder masks
+    if intruder_masks:
+        combined_mask = np.logical_or.reduce(intruder_masks)
+
+        # Calculate actual dilation pixels
+        if dilation_percent is not None:
+            # Use percentage of smaller image dimension
+            actual_dilation = int(min(h, w) * dilation_percent / 100)
+        else:
+            actual_dilation = dilation
+
+        # Apply dilation to catch anti-aliased edges
+        if actual_dilation > 0:
+            struct = morphology.disk(actual_dilation)
+            combined_mask = morphology.binary_dilation(combined_mask, struct)
+    else:
+        combined_mask = None
+        actual_dilation = 0
+
+    return combined_mask, {
+        "components": components,
+        "main_component": main_component,
+        "intruder_components": intruder_components,
+        "num_features": num_features,
+        "type": "shape_mask",
+        "settings": {
+            "dilation": dilation,
+            "dilation_percent": dilation_percent,
+            "actual_dilation_px": actual_dilation if intruder_masks else 0,
+            "adaptive_threshold": adaptive_threshold,
+            "sensitivity": sensitivity,
+        },
+    }
+
+
+# ============================================================================
+# Algorithm 3: Vertical Projection Profile with Adaptive Threshold
+# ============================================================================
+def algo_projection_profile(img_array, smoothing=5, valley_depth_ratio=0.3, ctx=None):
+    """
+    Similar to column density but with:
+    - Smoothing to reduce noise
+    - Adaptive valley detection based on local minima
+    - Derivative-based valley finding
+    """
+    ctx = _context(img_array, ctx)
+
+    h, w = ctx.binary.shape
+
+    # Column projection
+    projection = ctx.column_projection.astype(float)
+
+    # Smooth the projection
+    if smoothing > 1:
+        kernel = np.ones(smoothing) / smoothing
+        projection_smooth = np.convolve(projection, kernel, mode='same')
+    else:
+        projection_smooth = projection
+
+    # Find local minima (valleys)
+    # Invert to find minima as peaks
+    inverted = projection_smooth.max() - projection_smooth
+    peaks, properties = signal.find_peaks(inverted, prominence=projection_smooth.max() * valley_depth_ratio)
+
+    # Find the deepest valley in left third and right third
+    left_third = w // 3
+    right_two_thirds = 2 * w // 3
+
+    left_valleys = peaks[peaks < left_third]
+    right_valleys = peaks[peaks > right_two_thirds]
+
+    left_mask_end = None
+    right_mask_start = None
+
+    # For left valleys, pick the one closest to center (rightmost valley in left region)
+    if len(left_valleys) > 0:
+        left_mask_end = left_valleys[-1]  # Rightmost valley in left third
+
+    # For right valleys, pick the one closest to center (leftmost valley in right region)
+    if len(right_valleys) > 0:
+        right_mask_start = right_valleys[0]  # Leftmost valley in right third
+
+    return left_mask_end, right_mask_start, {
+        "projection": projection,
+        "projection_smooth": projection_smooth,
+        "valleys": peaks,
+    }
+
+
+# ============================================================================
+# Algorithm 4: Flood Fill from Corners
+# ============================================================================
+def algo_flood_fill_corners(img_array, tolerance=30, ctx=None):
+    """
+    Flood fill from corners to find background, then anything connected
+    to edges but not to center is an intruder.
+    """
+    gray = _context(img_array, ctx).gray
+    h, w = gray.shape
+
+    # Use skimage's flood fill from corners
+    # Start with a copy
+    mask = np.zeros((h, w), dtype=bool)
+
+    # Get corner colors (assumed background)
+    corners = [
+        (0, 0), (0, w-1), (h-1, 0), (h-1, w-1)
+    ]
+
+    # Flood fill from each corner
+    for corner in corners:
+        try:
+            corner_val = gray[corner]
+            filled = segmentation.flood(gray, corner, tolerance=tolerance)
+            mask |= filled
+        except:
+            pass
+
+    # Invert to get foreground
+    foreground = ~mask
+
+    # Label connected components in foreground
+    labeled, num = ndimage.label(foreground)
+
+    # Find which components touch edges vs which are in center
+    edge_components = set()
+    center_components = set()
+
+    center_region = labeled[h//4:3*h//4, w//4:3*w//4]
+    center_labels = set(np.unique(center_region)) - {0}
+
+    # Check edges
+    edge_labels = set()
+    edge_labels.update(np.unique(labeled[0, :]))  # Top
+    edge_labels.update(np.unique(labeled[-1, :]))  # Bottom
+    edge_labels.update(np.unique(labeled[:, 0]))  # Left
+    edge_labels.update(np.unique(labeled[:, -1]))  # Right
+    edge_labels.discard(0)
+
+    # Components that touch edge but not center are intruders
+    intruder_labels = edge_labels - center_labels
+
+    # Create intruder mask
+    intruder_mask = np.isin(labeled, list(intruder_labels))
+
+    # Find left and right bounds of intruder regions
+    if intruder_mask.any():
+        cols_with_intruders = np.where(intruder_mask.any(axis=0))[0]
+
+        # Left intruders
+        left_intruders = cols_with_intruders[cols_with_intruders < w//3]
+        left_mask_end = left_intruders.max() + 1 if len(left_intruders) > 0 else None
+
+        # Right intruders
+        right_intruders = cols_with_intruders[cols_with_intruders > 2*w//3]
+        right_mask_start = right_intruders.min() if len(right_intruders) > 0 else None
+    else:
+        left_mask_end = None
+        right_mask_start = None
+
+    return left_mask_end, right_mask_start, {
+        "foreground": foreground,
+        "intruder_mask": intruder_mask,
+        "num_components": num,
+    }
+
+
+# ============================================================================
+# Algorithm 5: Row Projection Profile (Horizontal valleys for top/bottom intrusion)
+# ============================================================================
+def algo_row_projection(img_array, smoothing=5, valley_depth_ratio=0.15, edge_search_percent=40, ctx=None):
+    """
+    Similar to column projection but for ROWS - detects horizontal valleys.
+    Finds intrusions from above (ascenders) or below (descenders) that poke
+    into the vertical space of the target letter.
+
+    Returns top_mask_end, bottom_mask_start (row indices)
+    """
+    ctx = _context(img_array, ctx)
+
+    h, w = ctx.binary.shape
+
+    # Row projection (sum of foreground pixels per row)
+    row_projection = ctx.row_projection.astype(float)
+
+    # Smooth the projection
+    if smoothing > 1:
+        kernel = np.ones(smoothing) / smoothing
+        row_projection_smooth = np.convolve(row_projection, kernel, mode='same')
+    else:
+        row_projection_smooth = row_projection
+
+    max_density = row_projection_smooth.max()
+    if max_density == 0:
+        return None, None, {"row_projection": row_projection, "message": "No content"}
+
+    # Find local minima (valleys) in the row projection
+    # Lower prominence threshold to catch smaller valleys
+    inverted = row_projection_smooth.max() - row_projection_smooth
+    peaks, properties = signal.find_peaks(inverted, prominence=max_density * valley_depth_ratio, distance=10)
+
+    edge_search_height = int(h * edge_search_percent / 100)
+
+    # Find valleys in top region
+    top_valleys = peaks[peaks < edge_search_height]
+    # Find valleys in bottom region
+    bottom_valleys = peaks[peaks > h - edge_search_height]
+
+    top_mask_end = None
+    bottom_mask_start = None
+    # Per edge: the deepest valley and the densities either side of it
+    edge_valleys = {}
+
+    # For top intrusion: find the deepest valley, mask everything above it
+    if len(top_valleys) > 0:
+        # Pick the valley with the lowest projection value (deepest valley)
+        deepest_top = top_valleys[np.argmin(row_projection_smooth[top_valleys])]
+        # Only mask if there's actual content above the valley
+        content_above = row_projection_smooth[:deepest_top].max() if deepest_top > 0 else 0
+        content_below = row_projection_smooth[deepest_top:].max()
+        valley_depth = row_projection_smooth[deepest_top]
+        edge_valleys["top"] = {"row": int(deepest_top), "content_above": float(content_above),
+                               "content_below": float(content_below), "valley": float(valley_depth)}
+        # Mask if: there's content above AND it's less than content below AND valley is deep
+        if content_above > max_density * 0.1 and content_below > content_above * 1.5:
+            top_mask_end = deepest_top
+
+    # For bottom intrusion: find the deepest valley, mask everything below it
+    if len(bottom_valleys) > 0:
+        deepest_bottom = bottom_valleys[np.argmin(row_projection_smooth[bottom_valleys])]
+        content_above = row_projection_smooth[:deepest_bottom].max()
+        content_below = row_projection_smooth[deepest_bottom:].max() if deepest_bottom < h else 0
+        valley_depth = row_projection_smooth[deepest_bottom]
+        edge_valleys["bottom"] = {"row": int(deepest_bottom), "content_above": float(content_above),
+                                  "content_below": float(content_below), "valley": float(valley_depth)}
+        # Mask if: there's content below AND it's less than content above AND valley is deep
+        if content_below > max_density * 0.1 and content_above > content_below * 1.5:
+            bottom_mask_start = deepest_bottom
+
+    return top_mask_end, bottom_mask_start, {
+        "row_projection": row_projection,
+        "row_projection_smooth": row_projection_smooth,
+        "valleys": peaks,
+        "top_valleys": top_valleys,
+        "bottom_valleys": bottom_valleys,
+        "edge_valleys": edge_valleys,
+        "direction": "horizontal",  # Flag for visualization
+    }
+
+
+# ============================================================================
+# Algorithm 6: Combined Column + Row Projection
+# ============================================================================
+def algo_combined_projection(img_array, smoothing=5, valley_depth_ratio=0.2, ctx=None):
+    """
+    Combines both column (vertical) and row (horizontal) projection analysis
+    to detect intrusions from any edge.
+    """
+    # Both passes share one binary
+    ctx = _context(img_array, ctx)
+
+    # Get column analysis (left/right)
+    left_mask, right_mask, col_debug = algo_projection_profile(
+        img_array, smoothing=smoothing, valley_depth_ratio=valley_depth_ratio, ctx=ctx
+    )
+
+    # Get row analysis (top/bottom)
+    top_mask, bottom_mask, row_debug = algo_row_projection(
+        img_array, smoothing=smoothing, valley_depth_ratio=valley_depth_ratio, ctx=ctx
+    )
+
+    return {
+        "left": left_mask,
+        "right": right_mask,
+        "top": top_mask,
+        "bottom": bottom_mask,
+    }, {
+        "column_density": col_debug.get("projection_smooth", col_debug.get("projection")),
+        "row_projection": row_debug.get("row_projection_smooth", row_debug.get("row_projection")),
+        "direction": "both",
+    }
+
+
+# ============================================================================
+# Algorithm 7: Gradient-based Edge Detection + Column Analysis
+# ============================================================================
+def algo_gradient_edges(img_array, edge_threshold=0.1, ctx=None):
+    """
+    Use Sobel edge detection to find vertical edges (letter boundaries),
+    then look for strong vertical edges that could separate letters.
+    """
+    ctx = _context(img_array, ctx)
+    h, w = ctx.gray.shape
+
+    # Sobel edge detection (vertical edges)
+    sobel_x = ctx.sobel_h  # Horizontal gradient = vertical edges
+
+    # Sum absolute gradient per column
+    edge_strength = np.abs(sobel_x).sum(axis=0)
+
+    # Normalize
+    edge_strength = edge_strength / edge_strength.max() if edge_strength.max() > 0 else edge_strength
+
+    # Find peaks in edge strength (potential letter boundaries)
+    peaks, _ = signal.find_peaks(edge_strength, height=edge_threshold, distance=10)
+
+    # Look for peaks in left and right thirds
+    left_third = w // 3
+    right_two_thirds = 2 * w // 3
+
+    left_peaks = peaks[peaks < left_third]
+    right_peaks = peaks[peaks > right_two_thirds]
+
+    # Pick the strongest peak in each region
+    left_mask_end = None
+    right_mask_start = None
+
+    if len(left_peaks) > 0:
+        strongest_left = left_peaks[np.argmax(edge_strength[left_peaks])]
+        left_mask_end = strongest_left
+
+    if len(right_peaks) > 0:
+        strongest_right = right_peaks[np.argmax(edge_strength[right_peaks])]
+        right_mask_start = strongest_right
+
+    return left_mask_end, right_mask_start, {
+        "edge_strength": edge_strength,
+        "peaks": peaks,
+    }
+
+
+# ============================================================================
+# Algorithm 8: Weighted Ensemble over a shared context
+# ============================================================================
+ENSEMBLE_WEIGHTS = {
+    "connected_components": 3.0,
+    "flood_fill_corners": 2.0,
+    "combined_projection": 1.5,
+    "projection_profile": 1.0,
+    "row_projection": 1.0,
+    "column_density": 1.0,
+    "gradient_edges": 0.5,
+}
+
+
+def strip_mask(shape, left=None, right=None, top=None, bottom=None):
+    """Boolean mask covering the edge strips an edge-based algorithm proposes"""
+    h, w = shape
+    mask = np.zeros((h, w), dtype=bool)
+    if left is not None and left > 0:
+        mask[:, :left] = True
+    if right is not None and right < w:
+        mask[:, right:] = True
+    if top is not None and top > 0:
+        mask[:top, :] = True
+    if bottom is not None and bottom < h:
+        mask[bottom:, :] = True
+    return mask
+
+
+def algo_ensemble(img_array, weights=None, vote_threshold=0.5, cc_options=None, ctx=None):
+    """
+    Run all seven algorithms on one shared AnalysisContext and let them vote
+    on a per-pixel intruder mask.
+
+    Parameters:
+    - weights: {algorithm name: weight}, merged over ENSEMBLE_WEIGHTS.
+               A weight of 0 skips that algorithm entirely.
+    - vote_threshold: fraction of the total weight a pixel needs to be masked
+    - cc_options: keyword arguments passed to algo_connected_components
+
+    Edge-based algorithms vote for whole strips, connected components and
+    flood fill vote for their pixel masks. Returns (mask or None, debug) like
+    algo_connected_components.
+    """
+    ctx = _context(img_array, ctx)
+    weights = {**ENSEMBLE_WEIGHTS, **(weights or {})}
+    shape = ctx.gray.shape
+
+    runners = {
+        "column_density": lambda: strip_mask(shape, *algo_column_density(img_array, ctx=ctx)[:2]),
+        "connected_components": lambda: algo_connected_components(img_array, ctx=ctx, **(cc_options or {}))[0],
+        "projection_profile": lambda: strip_mask(shape, *algo_projection_profile(img_array, ctx=ctx)[:2]),
+        "flood_fill_corners": lambda: algo_flood_fill_corners(img_array, ctx=ctx)[2]["intruder_mask"],
+        "row_projection": lambda: strip_mask(shape, None, None, *algo_row_projection(img_array, ctx=ctx)[:2]),
+        "combined_projection": lambda: strip_mask(shape, **algo_combined_projection(img_array, ctx=ctx)[0]),
+        "gradient_edges": lambda: strip_mask(shape, *algo_gradient_edges(img_array, ctx=ctx)[:2]),
+    }
+
+    unknown = set(weights) - set(runners)
+    if unknown:
+        raise ValueError(f"unknown ensemble algorithm(s): {sorted(unknown)}")
+
+    votes = np.zeros(shape, dtype=float)
+    total_weight = 0.0
+    voters = {}
+
+    for name, run in runners.items():
+        weight = weights[name]
+        if weight <= 0:
+            continue
+        total_weight += weight
+        mask = run()
+        voters[name] = mask is not None and bool(mask.any())
+        if voters[name]:
+            votes[mask] += weight
+
+    if total_weight == 0:
+        return None, {"message": "All ensemble weights are zero", "votes": votes}
+
+    combined_mask = votes >= total_weight * vote_threshold
+    if not combined_mask.any():
+        combined_mask = None
+
+    return combined_mask, {
+        "type": "shape_mask",
+        "votes": votes / total_weight,
+        "voters": voters,
+        "weights": weights,
+        "vote_threshold": vote_threshold,
+    }
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Local HTTP analysis server for box sanitization.
+
+Wraps the connected-component sanitize algorithm from sanitize_algorithms.py
+so the browser can offload pixel work from the main thread. Crops are posted
+as raw RGBA buffers (what `ctx.getImageData` returns) or as PNG, and the
+response is the intruder mask packed 8 pixels per byte (row-major, MSB first).
+
+The mask comes from algo_connected_components() (Otsu threshold, skimage
+morphology), not from the app's analyzeBoxForIntruders(). The defaults are
+the same, but remote masks can differ from local ones by a few pixels.
+src/utils/sanitizeBox.js uses this server when /health answers and falls
+back to analyzing locally otherwise.
+
+Endpoints:
+  GET  /health    - JSON status (queue depth, worker count)
+  POST /sanitize  - analyze one crop
+
+POST /sanitize:
+  Content-Type: application/octet-stream  raw RGBA, needs X-Width / X-Height
+  Content-Type: image/png                 PNG file (any mode)
+  Query params: dilation_percent, min_area_ratio, sensitivity, adaptive,
+                budget_ms (anytime mode, see anytime_sanitize.py),
+                tuned (a key of the --tuned-params cache: that entry's
+                parameters replace the defaults; explicit params still win)
+
+  Response headers:
+    X-Width, X-Height    - mask dimensions
+    X-Intruders          - number of intruder components (0 = empty body)
+    X-Batch-Size         - how many crops shared the executor call
+    X-Stage              - anytime stage the mask came from (projection /
+                           downsampled / full, or none if nothing finished)
+    Server-Timing        - queue / decode / analyze / encode durations (ms)
+
+Requests arriving within --batch-window ms are grouped into one executor call.
+When more than --max-pending crops are waiting the server answers 503 with a
+Retry-After header instead of queueing without bound.
+
+--lean runs the memory-lean variant from lean_sanitize.py (identical masks,
+per-worker scratch buffers reused across crops).
+
+--tuned-params loads a cache written by auto_tune.py once at startup.
+
+Run: python3 -u scripts/sanitize_server.py [--port 8765] [--processes] [--lean] [--tuned-params tuned_params.json]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PIL import Image
+
+from anytime_sanitize import StageCostModel, sanitize_anytime
+from auto_tune import cached_params, load_cache
+from lean_sanitize import lean_connected_components, thread_workspace
+from sanitize_algorithms import algo_connected_components, warm_up
+
+# Defaults mirror analyzeBoxForIntruders() in src/utils/sanitizeBox.js
+DEFAULT_OPTIONS = {
+    "dilation_percent": 2.5,
+    "min_area_ratio": 0.0005,
+    "sensitivity": "medium",
+    "adaptive": False,
+}
+
+# auto_tune.py parameters that connected-component analysis reads
+TUNED_OPTIONS = ("dilation_percent", "min_area_ratio", "sensitivity")
+
+# Stage costs learned across requests: one model per worker process, shared
+# (under its lock) by that process's threads
+ANYTIME_COST_MODEL = StageCostModel()
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, X-Width, X-Height",
+    "Access-Control-Expose-Headers": "X-Width, X-Height, X-Intruders, X-Batch-Size, X-Stage, Server-Timing",
+}
+
+
+class HttpError(Exception):
+    """Raised by request handling to produce a non-200 response"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ============================================================================
+# Decoding / analysis (runs inside the executor)
+# ============================================================================
+def decode_crop(body, content_type, width, height):
+    """Turn a request body into an RGB uint8 array"""
+    if content_type == "image/png":
+        img = Image.open(io.BytesIO(body)).convert("RGB")
+        return np.asarray(img)
+
+    if width is None or height is None:
+        raise ValueError("raw RGBA body needs X-Width and X-Height headers")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"crop must be at least 1x1, got {width}x{height}")
+    if len(body) != width * height * 4:
+        raise ValueError(f"expected {width * height * 4} bytes for {width}x{height} RGBA, got {len(body)}")
+
+    rgba = np.frombuffer(body, dtype=np.uint8).reshape(height, width, 4)
+    return np.ascontiguousarray(rgba[:, :, :3])
+
+
+def analyze_crop(img_array, options):
+    """Run connected-component sanitize and return (mask or None, intruder count)"""
+    kwargs = {
+        "min_area_ratio": options["min_area_ratio"],
+        "dilation_percent": options["dilation_percent"],
+        "adaptive_threshold": options["adaptive"],
+        "sensitivity": options["sensitivity"],
+    }
+    if options.get("lean"):
+        mask, debug = lean_connected_components(img_array, workspace=thread_workspace(), **kwargs)
+    else:
+        mask, debug = algo_connected_components(img_array, **kwargs)
+    return mask, len(debug.get("intruder_components", []))
+
+
+def analyze_crop_anytime(img_array, options):
+    """Best mask within options["budget_ms"]: (mask or None, intruder count, stage)"""
+    result, _ = sanitize_anytime(img_array, options["budget_ms"] / 1000, {
+        "min_area_ratio": options["min_area_ratio"],
+        "dilation_percent": options["dilation_percent"],
+        "adaptive_threshold": options["adaptive"],
+        "sensitivity": options["sensitivity"],
+    }, cost_model=ANYTIME_COST_MODEL)
+    return result["mask"], result["intruders"], result["stage"] or "none"
+
+
+def process_batch(jobs):
+    """
+    Decode, analyze and pack a batch of crops.
+    Each job is (body, content_type, width, height, options); returns one
+    dict per job. Errors are reported per job so one bad crop doesn't fail
+    the whole batch.
+    """
+    results = []
+    for body, content_type, width, height, options in jobs:
+        timing = {}
+        t0 = time.perf_counter()
+        try:
+            img_array = decode_crop(body, content_type, width, height)
+        except Exception as e:
+            results.append({"ok": False, "status": 400, "error": str(e), "timing": timing})
+            continue
+        try:
+            t1 = time.perf_counter()
+            if options.get("budget_ms"):
+                mask, num_intruders, stage = analyze_crop_anytime(img_array, options)
+            else:
+                mask, num_intruders = analyze_crop(img_array, options)
+                stage = "full"
+            t2 = time.perf_counter()
+            packed = np.packbits(mask, axis=None).tobytes() if mask is not None else b""
+            t3 = time.perf_counter()
+
+            timing = {"decode": t1 - t0, "analyze": t2 - t1, "encode": t3 - t2}
+            h, w = img_array.shape[:2]
+            results.append({
+                "ok": True,
+                "width": w,
+                "height": h,
+                "intruders": num_intruders,
+                "stage": stage,
+                "packed": packed,
+                "timing": timing,
+            })
+        except Exception as e:
+            results.append({"ok": False, "status": 500, "error": str(e), "timing": timing})
+    return results
+
+
+# ============================================================================
+# Batching with back-pressure
+# ============================================================================
+class BatchDispatcher:
+    """
+    Groups queued crops into executor calls.
+
+    One dispatcher task runs per executor worker so the pool stays busy; each
+    task waits for a first job, then keeps collecting for up to batch_window
+    seconds (or until max_batch jobs) before handing the batch off.
+    """
+
+    def __init__(self, executor, workers, max_batch=8, batch_window=0.005, max_pending=64):
+        self.executor = executor
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.tasks = []
+        self.in_flight = 0
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def submit(self, job):
+        """Queue a job, returning a future. Raises HttpError(503) when full."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((job, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise HttpError(503, "analysis queue is full")
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            jobs = [job for job, _, _ in batch]
+            self.in_flight += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, process_batch, jobs)
+            except Exception as e:
+                results = [{"ok": False, "status": 500, "error": str(e), "timing": {}} for _ in batch]
+            finally:
+                self.in_flight -= len(batch)
+
+            for (_, future, queued_at), result in zip(batch, results):
+                if future.done():
+                    continue
+                result["timing"]["queue"] = started - queued_at
+                result["batch_size"] = len(batch)
+                future.set_result(result)
+
+
+# ============================================================================
+# HTTP
+# ============================================================================
+def parse_options(query, tuned_cache=None):
+    """Merge query-string options over DEFAULT_OPTIONS (or the tuned entry they name)"""
+    params = parse_qs(query)
+    options = dict(DEFAULT_OPTIONS)
+    if "tuned" in params:
+        key = params["tuned"][0]
+        tuned = cached_params(tuned_cache, key) if tuned_cache is not None else None
+        if tuned is None:
+            raise HttpError(400, f"no tuned parameters for {key}")
+        options.update((name, tuned[name]) for name in TUNED_OPTIONS if name in tuned)
+    try:
+        if "dilation_percent" in params:
+            options["dilation_percent"] = float(params["dilation_percent"][0])
+        if "min_area_ratio" in params:
+            options["min_area_ratio"] = float(params["min_area_ratio"][0])
+        if "budget_ms" in params:
+            options["budget_ms"] = float(params["budget_ms"][0])
+    except ValueError as e:
+        raise HttpError(400, f"bad numeric option: {e}")
+    for name in ("dilation_percent", "min_area_ratio", "budget_ms"):
+        if name in options and not (math.isfinite(options[name]) and options[name] >= 0):
+            raise HttpError(400, f"{name} must be a finite non-negative number")
+    if options.get("budget_ms") == 0:
+        raise HttpError(400, "budget_ms must be positive (omit it for a full analysis)")
+    if "sensitivity" in params:
+        sensitivity = params["sensitivity"][0]
+        if sensitivity not in ("low", "medium", "high"):
+            raise HttpError(400, f"unknown sensitivity: {sensitivity}")
+        options["sensitivity"] = sensitivity
+    if "adaptive" in params:
+        options["adaptive"] = params["adaptive"][0].lower() in ("1", "true", "yes")
+    return options
+
+
+def format_server_timing(timing):
+    order = ("queue", "decode", "analyze", "encode")
+    return ", ".join(f"{name};dur={timing[name] * 1000:.2f}" for name in order if name in timing)
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request. Returns None on a clean EOF."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise HttpError(400, "truncated request")
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, "request headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length must be an integer")
+    if length < 0:
+        raise HttpError(400, "Content-Length must not be negative")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"body exceeds {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    return method.upper(), target, version, headers, body
+
+
+def write_response(writer, status, body=b"", content_type="application/json", headers=None, keep_alive=True):
+    all_headers = {
+        "Content-Type": content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **CORS_HEADERS,
+        **(headers or {}),
+    }
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in all_headers.items())
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+
+def json_body(data):
+    return json.dumps(data).encode("utf-8")
+
+
+class SanitizeServer:
+    def __init__(self, dispatcher, workers, mode, lean=False, tuned_cache=None):
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.mode = mode
+        self.lean = lean
+        self.tuned_cache = tuned_cache
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, target, version, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+                    status, resp_body, content_type, resp_headers = await self.route(method, target, headers, body)
+                except HttpError as e:
+                    status, resp_body, content_type = e.status, json_body({"error": e.message}), "application/json"
+                    resp_headers = {"Retry-After": "1"} if e.status == 503 else {}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                write_response(writer, status, resp_body, content_type, resp_headers, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+
+        if method == "OPTIONS":
+            return 204, b"", "text/plain", {}
+
+        if url.path == "/health":
+            if method != "GET":
+                raise HttpError(405, "use GET")
+            return 200, json_body({
+                "status": "ok",
+                "mode": self.mode,
+                "lean": self.lean,
+                "workers": self.workers,
+                "pending": self.dispatcher.queue.qsize(),
+                "in_flight": self.dispatcher.in_flight,
+            }), "application/json", {}
+
+        if url.path == "/sanitize":
+            if method != "POST":
+                raise HttpError(405, "use POST")
+            return await self.sanitize(url.query, headers, body)
+
+        raise HttpError(404, f"no route for {url.path}")
+
+    async def sanitize(self, query, headers, body):
+        options = parse_options(query, self.tuned_cache)
+        options["lean"] = self.lean
+        content_type = headers.get("content-type", "application/octet-stream").split(";")[0].strip()
+        try:
+            width = int(headers["x-width"]) if "x-width" in headers else None
+            height = int(headers["x-height"]) if "x-height" in headers else None
+        except ValueError:
+            raise HttpError(400, "X-Width / X-Height must be integers")
+
+        future = self.dispatcher.submit((body, content_type, width, height, options))
+        result = await future
+
+        if not result["ok"]:
+            raise HttpError(result["status"], result["error"])
+
+        return 200, result["packed"], "application/octet-stream", {
+            "X-Width": str(result["width"]),
+            "X-Height": str(result["height"]),
+            "X-Intruders": str(result["intruders"]),
+            "X-Batch-Size": str(result["batch_size"]),
+            "X-Stage": result["stage"],
+            "Server-Timing": format_server_timing(result["timing"]),
+        }
+
+
+# ============================================================================
+# Main
+# ============================================================================
+async def serve(args):
+    workers = args.workers or os.cpu_count() or 1
+    # Pay the scipy/skimage import cost before the first request, not during it
+    if args.processes:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+        mode = "process"
+    else:
+        warm_up()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        mode = "thread"
+
+    dispatcher = BatchDispatcher(
+        executor,
+        workers,
+        max_batch=args.max_batch,
+        batch_window=args.batch_window / 1000,
+        max_pending=args.max_pending,
+    )
+    dispatcher.start()
+
+    tuned_cache = load_cache(args.tuned_params) if args.tuned_params else None
+    app = SanitizeServer(dispatcher, workers, mode, lean=args.lean, tuned_cache=tuned_cache)
+    server = await asyncio.start_server(app.handle_connection, args.host, args.port, limit=MAX_HEADER_BYTES)
+    print(f"Sanitize server listening on http://{args.host}:{args.port} ({workers} {mode} workers)")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await dispatcher.stop()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local sanitize analysis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=0, help="pool size (default: CPU count)")
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    parser.add_argument("--max-batch", type=int, default=8, help="max crops per executor call")
+    parser.add_argument("--batch-window", type=float, default=5.0, help="ms to wait for a batch to fill")
+    parser.add_argument("--max-pending", type=int, default=64, help="queued crops before answering 503")
+    parser.add_argument("--lean", action="store_true", help="memory-lean analysis (same masks, lower peak memory)")
+    parser.add_argument("--tuned-params", type=Path, help="auto_tune.py cache served to ?tuned=KEY requests")
+    args = parser.parse_args()
+    if args.tuned_params and not args.tuned_params.exists():
+        parser.error(f"--tuned-params {args.tuned_params} does not exist")
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
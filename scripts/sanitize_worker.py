@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Long-lived sanitize worker speaking JSON lines over stdin/stdout.
+
+Start it once and keep it around: the scipy/skimage import cost is paid at
+startup (warm_up() runs before the "ready" line is printed) instead of on
+every invocation.
+
+Requests, one JSON object per line:
+  {"id": 1, "op": "sanitize", "path": "crop.png", "options": {...}}
+  {"id": 2, "op": "sanitize", "png": "<base64>"}
+  {"id": 3, "op": "sanitize", "rgba": "<base64>", "width": 40, "height": 60}
+  {"id": 4, "op": "ping"}
+  {"id": 5, "op": "shutdown"}
+
+Options are the same as the HTTP server's query params: dilation_percent,
+min_area_ratio, sensitivity, adaptive.
+
+Responses, one JSON object per line, in request order:
+  {"id": 1, "ok": true, "width": 40, "height": 60, "intruders": 2,
+   "mask": "<base64 packbits, row-major, MSB first>" | null,
+   "timing_ms": {"decode": ..., "analyze": ..., "encode": ...}}
+  {"id": 1, "ok": false, "error": "..."}
+
+Anything the algorithms print goes to stderr so stdout stays clean.
+
+Run: python3 -u scripts/sanitize_worker.py [--no-warm]
+"""
+
+import argparse
+import base64
+import json
+import sys
+import time
+
+import numpy as np
+
+from sanitize_algorithms import warm_up
+from sanitize_server import DEFAULT_OPTIONS, analyze_crop, decode_crop
+
+
+def merge_options(overrides):
+    """Validate request options and merge them over DEFAULT_OPTIONS"""
+    options = dict(DEFAULT_OPTIONS)
+    for key, value in (overrides or {}).items():
+        if key not in options:
+            raise ValueError(f"unknown option: {key}")
+        options[key] = value
+    options["dilation_percent"] = float(options["dilation_percent"])
+    options["min_area_ratio"] = float(options["min_area_ratio"])
+    options["adaptive"] = bool(options["adaptive"])
+    if options["sensitivity"] not in ("low", "medium", "high"):
+        raise ValueError(f"unknown sensitivity: {options['sensitivity']}")
+    return options
+
+
+def load_body(request):
+    """Return (body, content_type, width, height) for decode_crop()"""
+    if "path" in request:
+        with open(request["path"], "rb") as f:
+            return f.read(), "image/png", None, None
+    if "png" in request:
+        return base64.b64decode(request["png"]), "image/png", None, None
+    if "rgba" in request:
+        return base64.b64decode(request["rgba"]), "application/octet-stream", request.get("width"), request.get("height")
+    raise ValueError("sanitize request needs one of: path, png, rgba")
+
+
+def handle_sanitize(request):
+    options = merge_options(request.get("options"))
+
+    t0 = time.perf_counter()
+    img_array = decode_crop(*load_body(request))
+    t1 = time.perf_counter()
+    mask, num_intruders = analyze_crop(img_array, options)
+    t2 = time.perf_counter()
+    packed = base64.b64encode(np.packbits(mask, axis=None).tobytes()).decode("ascii") if mask is not None else None
+    t3 = time.perf_counter()
+
+    h, w = img_array.shape[:2]
+    return {
+        "width": w,
+        "height": h,
+        "intruders": num_intruders,
+        "mask": packed,
+        "timing_ms": {
+            "decode": (t1 - t0) * 1000,
+            "analyze": (t2 - t1) * 1000,
+            "encode": (t3 - t2) * 1000,
+        },
+    }
+
+
+def serve(stdin, out):
+    def respond(message):
+        out.write(json.dumps(message) + "\n")
+        out.flush()
+
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request.get("op", "sanitize")
+
+            if op == "ping":
+                respond({"id": request_id, "ok": True})
+            elif op == "shutdown":
+                respond({"id": request_id, "ok": True})
+                break
+            elif op == "sanitize":
+                respond({"id": request_id, "ok": True, **handle_sanitize(request)})
+            else:
+                raise ValueError(f"unknown op: {op}")
+        except Exception as e:
+            respond({"id": request_id, "ok": False, "error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON-lines sanitize worker")
+    parser.add_argument("--no-warm", action="store_true", help="skip warm_up() at startup")
+    args = parser.parse_args()
+
+    # Keep the protocol stream to ourselves; stray prints land on stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    started = time.perf_counter()
+    if not args.no_warm:
+        warm_up()
+    protocol_out.write(json.dumps({"ready": True, "warm_ms": (time.perf_counter() - started) * 1000}) + "\n")
+    protocol_out.flush()
+
+    serve(sys.stdin, protocol_out)
+
+
+if __name__ == "__main__":
+    main()
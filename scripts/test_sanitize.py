@@ -8,23 +8,49 @@ Algorithms tested:
 3. Vertical Projection Profile with Otsu threshold
 4. Edge-aware flood fill from corners
 5. Gradient-based edge detection
+6. Weighted ensemble of all algorithms over a shared context
 
-Run: python3 -u scripts/test_sanitize.py
+The algorithms themselves live in sanitize_algorithms.py; this script only
+runs them over the test images and renders the results.
+
+I/O is pipelined around the analysis loop: a reader pool decodes upcoming
+images while the current one is analyzed, and a writer pool renders, encodes
+and saves the result PNGs. Both sides are bounded (--prefetch images ahead,
+--max-pending-writes queued renders) so memory stays flat on long runs.
+
+Run: python3 -u scripts/test_sanitize.py [--compress-level 1] [--serial]
 """
 
+import argparse
 import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from scipy import ndimage
-from skimage import filters, measure, morphology, segmentation
-from skimage.color import rgb2gray
 import warnings
+
+from sanitize_algorithms import (
+    to_grayscale,
+    detect_text_color,
+    get_binary,
+    algo_column_density,
+    algo_connected_components,
+    algo_projection_profile,
+    algo_flood_fill_corners,
+    algo_row_projection,
+    algo_combined_projection,
+    algo_gradient_edges,
+    algo_ensemble,
+)
+
 warnings.filterwarnings('ignore')
 
 # Output directory
 OUTPUT_DIR = Path("public/sanitize-test/results")
-OUTPUT_DIR.mkdir(exist_ok=True)
 
 # Test images
 TEST_IMAGES = [
@@ -43,637 +69,11 @@ def load_image(path):
     return np.array(img), img
 
 
-def to_grayscale(img_array):
-    """Convert to grayscale using luminance formula"""
-    return 0.299 * img_array[:,:,0] + 0.587 * img_array[:,:,1] + 0.114 * img_array[:,:,2]
-
-
-def detect_text_color(img_array):
-    """
-    Detect if text is dark-on-light or light-on-dark.
-    Returns True if text appears darker than background.
-    """
-    gray = to_grayscale(img_array)
-    # Check corners vs center
-    h, w = gray.shape
-    corner_avg = (gray[0,0] + gray[0,-1] + gray[-1,0] + gray[-1,-1]) / 4
-    center_avg = gray[h//3:2*h//3, w//3:2*w//3].mean()
-    return center_avg < corner_avg  # True if center (text) is darker
-
-
-def get_binary(gray, invert=False):
-    """Convert grayscale to binary using Otsu's threshold"""
-    threshold = filters.threshold_otsu(gray)
-    if invert:
-        return gray > threshold  # Light pixels are foreground
-    return gray < threshold  # Dark pixels are foreground
-
-
-# ============================================================================
-# Algorithm 1: Column Density Valley Detection (current implementation)
-# ============================================================================
-def algo_column_density(img_array, edge_search_percent=30, valley_threshold=0.15, min_valley_width=5):
-    """
-    Detect intruders by finding valleys in column density profile.
-    If we see content at edge, then a valley, the edge content is an intruder.
-    """
-    gray = to_grayscale(img_array)
-    is_dark_text = detect_text_color(img_array)
-    binary = get_binary(gray, invert=not is_dark_text)
-
-    h, w = binary.shape
-
-    # Calculate column density (count of foreground pixels per column)
-    column_density = binary.sum(axis=0)
-    max_density = column_density.max()
-
-    if max_density == 0:
-        return None, None, {"column_density": column_density, "message": "No content detected"}
-
-    valley_threshold_abs = max_density * valley_threshold
-    content_threshold = max_density * 0.3
-    edge_search_width = int(w * edge_search_percent / 100)
-
-    # Search from left
-    left_mask_end = None
-    saw_content = False
-    consecutive_low = 0
-
-    for x in range(edge_search_width):
-        is_content = column_density[x] > content_threshold
-        is_valley = column_density[x] <= valley_threshold_abs
-
-        if is_content:
-            saw_content = True
-            consecutive_low = 0
-        elif is_valley and saw_content:
-            consecutive_low += 1
-            if consecutive_low >= min_valley_width:
-                left_mask_end = x - consecutive_low + 1
-                break
-        else:
-            consecutive_low = 0
-
-    # Search from right
-    right_mask_start = None
-    saw_content = False
-    consecutive_low = 0
-
-    for x in range(w - 1, w - edge_search_width - 1, -1):
-        is_content = column_density[x] > content_threshold
-        is_valley = column_density[x] <= valley_threshold_abs
-
-        if is_content:
-            saw_content = True
-            consecutive_low = 0
-        elif is_valley and saw_content:
-            consecutive_low += 1
-            if consecutive_low >= min_valley_width:
-                right_mask_start = x + consecutive_low
-                break
-        else:
-            consecutive_low = 0
-
-    return left_mask_end, right_mask_start, {
-        "column_density": column_density,
-        "max_density": max_density,
-        "valley_threshold_abs": valley_threshold_abs,
-        "content_threshold": content_threshold,
-    }
-
-
-# ============================================================================
-# Algorithm 2: Connected Component Analysis (Shape-based masking)
-# ============================================================================
-def algo_connected_components(img_array, min_area_ratio=0.005, dilation=0,
-                               dilation_percent=None, adaptive_threshold=False,
-                               sensitivity='medium'):
-    """
-    Find connected components (blobs) and identify intruders by their shape.
-    Returns actual pixel masks for intruding shapes, not just rectangular regions.
-
-    Parameters:
-    - dilation: fixed pixels to expand the mask by (catches anti-aliased edges)
-    - dilation_percent: percentage of image size for dilation (overrides dilation if set)
-                        e.g., 1.0 = 1% of min(width, height)
-    - adaptive_threshold: use adaptive thresholding for better gradient handling
-    - sensitivity: 'low', 'medium', 'high' - how aggressively to detect intruders
-
-    Improvements:
-    - Morphological closing to connect nearby parts (handles letters with gaps)
-    - Better scoring: strongly prefer centered components
-    - Only mask components that touch an edge AND are cut off (partial)
-    - Handle letter counters (holes) by using filled binary
-    """
-    gray = to_grayscale(img_array)
-    is_dark_text = detect_text_color(img_array)
-
-    # Choose thresholding method
-    if adaptive_threshold:
-        # Adaptive thresholding - better for images with gradients/shadows
-        from skimage.filters import threshold_local
-        block_size = max(35, min(gray.shape) // 10)
-        if block_size % 2 == 0:
-            block_size += 1  # Must be odd
-        local_thresh = threshold_local(gray, block_size, offset=10)
-        if is_dark_text:
-            binary = gray < local_thresh
-        else:
-            binary = gray > local_thresh
-    else:
-        binary = get_binary(gray, invert=not is_dark_text)
-
-    h, w = binary.shape
-
-    # Morphological closing to connect nearby parts and fill small gaps
-    # This helps with letters that have thin connections or slight gaps
-    struct = morphology.disk(3)
-    binary_closed = morphology.binary_closing(binary, struct)
-
-    # Fill holes to handle letter counters (like the hole in 'o', 'a', 'e')
-    binary_filled = ndimage.binary_fill_holes(binary_closed)
-
-    # Label connected components on the filled/closed binary
-    labeled, num_features = ndimage.label(binary_filled)
-
-    total_area = h * w
-    center_x = w / 2
-    center_y = h / 2
-
-    components = []
-
-    for i in range(1, num_features + 1):
-        component_mask = labeled == i
-
-        # Use original binary for the actual mask (not filled)
-        # This gives us the true letter shape without filled counters
-        actual_mask = binary & component_mask
-
-        area = actual_mask.sum()
-
-        # Skip tiny noise
-        if area < total_area * min_area_ratio:
-            continue
-
-        # Find bounding box and centroid
-        rows, cols = np.where(component_mask)
-        if len(rows) == 0:
-            continue
-
-        min_row, max_row = rows.min(), rows.max()
-        min_col, max_col = cols.min(), cols.max()
-        bbox_width = max_col - min_col
-        bbox_height = max_row - min_row
-        centroid_x = cols.mean()
-        centroid_y = rows.mean()
-
-        # Check which edges it touches (within 3 pixels)
-        touches_left = min_col <= 3
-        touches_right = max_col >= w - 4
-        touches_top = min_row <= 3
-        touches_bottom = max_row >= h - 4
-
-        # Check if component is "cut off" at the edge (partial letter)
-        # A cut-off component has significant density right at the edge
-        edge_margin = 5
-        cut_off_left = touches_left and actual_mask[:, :edge_margin].sum() > (bbox_height * edge_margin * 0.3)
-        cut_off_right = touches_right and actual_mask[:, -edge_margin:].sum() > (bbox_height * edge_margin * 0.3)
-        cut_off_top = touches_top and actual_mask[:edge_margin, :].sum() > (bbox_width * edge_margin * 0.3)
-        cut_off_bottom = touches_bottom and actual_mask[-edge_margin:, :].sum() > (bbox_width * edge_margin * 0.3)
-
-        is_cut_off = cut_off_left or cut_off_right or cut_off_top or cut_off_bottom
-
-        # Score: higher = more likely to be the main letter (keep)
-        score = 0
-
-        # Centroid distance from center (normalized 0-1) - STRONG weight on centering
-        dist_from_center_x = abs(centroid_x - center_x) / (w / 2)
-        dist_from_center_y = abs(centroid_y - center_y) / (h / 2)
-
-        # Being centered is very important
-        score += (1 - dist_from_center_x) * 50
-        score += (1 - dist_from_center_y) * 30
-
-        # Large area is good but less important than centering
-        area_ratio = area / total_area
-        score += area_ratio * 40
-
-        # Bbox coverage of image (main letter usually spans a good portion)
-        bbox_coverage_x = bbox_width / w
-        bbox_coverage_y = bbox_height / h
-        score += bbox_coverage_x * 20
-        score += bbox_coverage_y * 20
-
-        # Touching only one edge is suspicious (intruder)
-        if touches_left and not touches_right:
-            score -= 40
-        if touches_right and not touches_left:
-            score -= 40
-        if touches_top and not touches_bottom:
-            score -= 20
-        if touches_bottom and not touches_top:
-            score -= 20
-
-        # Being cut off at edge is very suspicious
-        if is_cut_off:
-            score -= 60
-
-        # Touching opposite edges means it spans the box (likely main letter)
-        if touches_left and touches_right:
-            score += 40
-        if touches_top and touches_bottom:
-            score += 30
-
-        components.append({
-            "id": i,
-            "area": area,
-            "area_ratio": area_ratio,
-            "centroid": (centroid_x, centroid_y),
-            "bbox": (min_col, min_row, max_col, max_row),
-            "touches": {"left": touches_left, "right": touches_right, "top": touches_top, "bottom": touches_bottom},
-            "cut_off": {"left": cut_off_left, "right": cut_off_right, "top": cut_off_top, "bottom": cut_off_bottom},
-            "is_cut_off": is_cut_off,
-            "score": score,
-            "mask": actual_mask,  # Use original binary, not filled
-        })
-
-    if not components:
-        return None, {"message": "No components found", "components": []}
-
-    # Find the main letter (highest score)
-    components.sort(key=lambda c: c["score"], reverse=True)
-    main_component = components[0]
-
-    # Sensitivity settings
-    sensitivity_settings = {
-        'low': {'score_ratio': 0.3, 'require_cut_off': True},
-        'medium': {'score_ratio': 0.5, 'require_cut_off': False},
-        'high': {'score_ratio': 0.7, 'require_cut_off': False},
-    }
-    settings = sensitivity_settings.get(sensitivity, sensitivity_settings['medium'])
-
-    # Mark components as intruders if they:
-    # 1. Touch an edge AND are cut off (partial letter)
-    # 2. Have significantly lower score than main
-    intruder_masks = []
-    intruder_components = []
-
-    for comp in components[1:]:  # Skip the main component
-        is_intruder = False
-
-        # Must touch at least one edge
-        touches_any_edge = any(comp["touches"].values())
-
-        if touches_any_edge:
-            # If it's cut off at an edge, it's definitely an intruder
-            if comp["is_cut_off"]:
-                is_intruder = True
-            # Or if score is much lower than main (based on sensitivity)
-            elif not settings['require_cut_off'] and comp["score"] < main_component["score"] * settings['score_ratio']:
-                is_intruder = True
-
-        if is_intruder:
-            intruder_masks.append(comp["mask"])
-            intruder_components.append(comp)
-
-    # Combine all intruder masks
-    if intruder_masks:
-        combined_mask = np.logical_or.reduce(intruder_masks)
-
-        # Calculate actual dilation pixels
-        if dilation_percent is not None:
-            # Use percentage of smaller image dimension
-            actual_dilation = int(min(h, w) * dilation_percent / 100)
-        else:
-            actual_dilation = dilation
-
-        # Apply dilation to catch anti-aliased edges
-        if actual_dilation > 0:
-            struct = morphology.disk(actual_dilation)
-            combined_mask = morphology.binary_dilation(combined_mask, struct)
-    else:
-        combined_mask = None
-        actual_dilation = 0
-
-    return combined_mask, {
-        "components": components,
-        "main_component": main_component,
-        "intruder_components": intruder_components,
-        "num_features": num_features,
-        "type": "shape_mask",
-        "settings": {
-            "dilation": dilation,
-            "dilation_percent": dilation_percent,
-            "actual_dilation_px": actual_dilation if intruder_masks else 0,
-            "adaptive_threshold": adaptive_threshold,
-            "sensitivity": sensitivity,
-        },
-    }
-
-
-# ============================================================================
-# Algorithm 3: Vertical Projection Profile with Adaptive Threshold
-# ============================================================================
-def algo_projection_profile(img_array, smoothing=5, valley_depth_ratio=0.3):
-    """
-    Similar to column density but with:
-    - Smoothing to reduce noise
-    - Adaptive valley detection based on local minima
-    - Derivative-based valley finding
-    """
-    gray = to_grayscale(img_array)
-    is_dark_text = detect_text_color(img_array)
-    binary = get_binary(gray, invert=not is_dark_text)
-
-    h, w = binary.shape
-
-    # Column projection
-    projection = binary.sum(axis=0).astype(float)
-
-    # Smooth the projection
-    if smoothing > 1:
-        kernel = np.ones(smoothing) / smoothing
-        projection_smooth = np.convolve(projection, kernel, mode='same')
-    else:
-        projection_smooth = projection
-
-    # Find local minima (valleys)
-    from scipy.signal import find_peaks
-
-    # Invert to find minima as peaks
-    inverted = projection_smooth.max() - projection_smooth
-    peaks, properties = find_peaks(inverted, prominence=projection_smooth.max() * valley_depth_ratio)
-
-    # Find the deepest valley in left third and right third
-    left_third = w // 3
-    right_two_thirds = 2 * w // 3
-
-    left_valleys = peaks[peaks < left_third]
-    right_valleys = peaks[peaks > right_two_thirds]
-
-    left_mask_end = None
-    right_mask_start = None
-
-    # For left valleys, pick the one closest to center (rightmost valley in left region)
-    if len(left_valleys) > 0:
-        left_mask_end = left_valleys[-1]  # Rightmost valley in left third
-
-    # For right valleys, pick the one closest to center (leftmost valley in right region)
-    if len(right_valleys) > 0:
-        right_mask_start = right_valleys[0]  # Leftmost valley in right third
-
-    return left_mask_end, right_mask_start, {
-        "projection": projection,
-        "projection_smooth": projection_smooth,
-        "valleys": peaks,
-    }
-
-
-# ============================================================================
-# Algorithm 4: Flood Fill from Corners
-# ============================================================================
-def algo_flood_fill_corners(img_array, tolerance=30):
-    """
-    Flood fill from corners to find background, then anything connected
-    to edges but not to center is an intruder.
-    """
-    gray = to_grayscale(img_array)
-    h, w = gray.shape
-
-    # Use skimage's flood fill from corners
-    # Start with a copy
-    mask = np.zeros((h, w), dtype=bool)
-
-    # Get corner colors (assumed background)
-    corners = [
-        (0, 0), (0, w-1), (h-1, 0), (h-1, w-1)
-    ]
-
-    # Flood fill from each corner
-    for corner in corners:
-        try:
-            corner_val = gray[corner]
-            filled = segmentation.flood(gray, corner, tolerance=tolerance)
-            mask |= filled
-        except:
-            pass
-
-    # Invert to get foreground
-    foreground = ~mask
-
-    # Label connected components in foreground
-    labeled, num = ndimage.label(foreground)
-
-    # Find which components touch edges vs which are in center
-    edge_components = set()
-    center_components = set()
-
-    center_region = labeled[h//4:3*h//4, w//4:3*w//4]
-    center_labels = set(np.unique(center_region)) - {0}
-
-    # Check edges
-    edge_labels = set()
-    edge_labels.update(np.unique(labeled[0, :]))  # Top
-    edge_labels.update(np.unique(labeled[-1, :]))  # Bottom
-    edge_labels.update(np.unique(labeled[:, 0]))  # Left
-    edge_labels.update(np.unique(labeled[:, -1]))  # Right
-    edge_labels.discard(0)
-
-    # Components that touch edge but not center are intruders
-    intruder_labels = edge_labels - center_labels
-
-    # Create intruder mask
-    intruder_mask = np.isin(labeled, list(intruder_labels))
-
-    # Find left and right bounds of intruder regions
-    if intruder_mask.any():
-        cols_with_intruders = np.where(intruder_mask.any(axis=0))[0]
-
-        # Left intruders
-        left_intruders = cols_with_intruders[cols_with_intruders < w//3]
-        left_mask_end = left_intruders.max() + 1 if len(left_intruders) > 0 else None
-
-        # Right intruders
-        right_intruders = cols_with_intruders[cols_with_intruders > 2*w//3]
-        right_mask_start = right_intruders.min() if len(right_intruders) > 0 else None
-    else:
-        left_mask_end = None
-        right_mask_start = None
-
-    return left_mask_end, right_mask_start, {
-        "foreground": foreground,
-        "intruder_mask": intruder_mask,
-        "num_components": num,
-    }
-
-
-# ============================================================================
-# Algorithm 5: Row Projection Profile (Horizontal valleys for top/bottom intrusion)
-# ============================================================================
-def algo_row_projection(img_array, smoothing=5, valley_depth_ratio=0.15, edge_search_percent=40):
-    """
-    Similar to column projection but for ROWS - detects horizontal valleys.
-    Finds intrusions from above (ascenders) or below (descenders) that poke
-    into the vertical space of the target letter.
-
-    Returns top_mask_end, bottom_mask_start (row indices)
-    """
-    gray = to_grayscale(img_array)
-    is_dark_text = detect_text_color(img_array)
-    binary = get_binary(gray, invert=not is_dark_text)
-
-    h, w = binary.shape
-
-    # Row projection (sum of foreground pixels per row)
-    row_projection = binary.sum(axis=1).astype(float)
-
-    # Smooth the projection
-    if smoothing > 1:
-        kernel = np.ones(smoothing) / smoothing
-        row_projection_smooth = np.convolve(row_projection, kernel, mode='same')
-    else:
-        row_projection_smooth = row_projection
-
-    max_density = row_projection_smooth.max()
-    if max_density == 0:
-        return None, None, {"row_projection": row_projection, "message": "No content"}
-
-    # Find local minima (valleys) in the row projection
-    from scipy.signal import find_peaks
-
-    # Lower prominence threshold to catch smaller valleys
-    inverted = row_projection_smooth.max() - row_projection_smooth
-    peaks, properties = find_peaks(inverted, prominence=max_density * valley_depth_ratio, distance=10)
-
-    edge_search_height = int(h * edge_search_percent / 100)
-
-    # Find valleys in top region
-    top_valleys = peaks[peaks < edge_search_height]
-    # Find valleys in bottom region
-    bottom_valleys = peaks[peaks > h - edge_search_height]
-
-    top_mask_end = None
-    bottom_mask_start = None
-
-    print(f"      Row projection: max={max_density:.0f}, valleys found: {len(peaks)}")
-    print(f"      Top valleys: {top_valleys.tolist()}, Bottom valleys: {bottom_valleys.tolist()}")
-
-    # For top intrusion: find the deepest valley, mask everything above it
-    if len(top_valleys) > 0:
-        # Pick the valley with the lowest projection value (deepest valley)
-        deepest_top = top_valleys[np.argmin(row_projection_smooth[top_valleys])]
-        # Only mask if there's actual content above the valley
-        content_above = row_projection_smooth[:deepest_top].max() if deepest_top > 0 else 0
-        content_below = row_projection_smooth[deepest_top:].max()
-        valley_depth = row_projection_smooth[deepest_top]
-        print(f"      Top valley at {deepest_top}: content_above={content_above:.0f}, content_below={content_below:.0f}, valley={valley_depth:.0f}")
-        # Mask if: there's content above AND it's less than content below AND valley is deep
-        if content_above > max_density * 0.1 and content_below > content_above * 1.5:
-            top_mask_end = deepest_top
-
-    # For bottom intrusion: find the deepest valley, mask everything below it
-    if len(bottom_valleys) > 0:
-        deepest_bottom = bottom_valleys[np.argmin(row_projection_smooth[bottom_valleys])]
-        content_above = row_projection_smooth[:deepest_bottom].max()
-        content_below = row_projection_smooth[deepest_bottom:].max() if deepest_bottom < h else 0
-        valley_depth = row_projection_smooth[deepest_bottom]
-        print(f"      Bottom valley at {deepest_bottom}: content_above={content_above:.0f}, content_below={content_below:.0f}, valley={valley_depth:.0f}")
-        # Mask if: there's content below AND it's less than content above AND valley is deep
-        if content_below > max_density * 0.1 and content_above > content_below * 1.5:
-            bottom_mask_start = deepest_bottom
-
-    return top_mask_end, bottom_mask_start, {
-        "row_projection": row_projection,
-        "row_projection_smooth": row_projection_smooth,
-        "valleys": peaks,
-        "direction": "horizontal",  # Flag for visualization
-    }
-
-
-# ============================================================================
-# Algorithm 6: Combined Column + Row Projection
-# ============================================================================
-def algo_combined_projection(img_array, smoothing=5, valley_depth_ratio=0.2):
-    """
-    Combines both column (vertical) and row (horizontal) projection analysis
-    to detect intrusions from any edge.
-    """
-    # Get column analysis (left/right)
-    left_mask, right_mask, col_debug = algo_projection_profile(
-        img_array, smoothing=smoothing, valley_depth_ratio=valley_depth_ratio
-    )
-
-    # Get row analysis (top/bottom)
-    top_mask, bottom_mask, row_debug = algo_row_projection(
-        img_array, smoothing=smoothing, valley_depth_ratio=valley_depth_ratio
-    )
-
-    return {
-        "left": left_mask,
-        "right": right_mask,
-        "top": top_mask,
-        "bottom": bottom_mask,
-    }, {
-        "column_density": col_debug.get("projection_smooth", col_debug.get("projection")),
-        "row_projection": row_debug.get("row_projection_smooth", row_debug.get("row_projection")),
-        "direction": "both",
-    }
-
-
-# ============================================================================
-# Algorithm 7: Gradient-based Edge Detection + Column Analysis
-# ============================================================================
-def algo_gradient_edges(img_array, edge_threshold=0.1):
-    """
-    Use Sobel edge detection to find vertical edges (letter boundaries),
-    then look for strong vertical edges that could separate letters.
-    """
-    gray = to_grayscale(img_array) / 255.0
-    h, w = gray.shape
-
-    # Sobel edge detection (vertical edges)
-    sobel_x = filters.sobel_h(gray)  # Horizontal gradient = vertical edges
-
-    # Sum absolute gradient per column
-    edge_strength = np.abs(sobel_x).sum(axis=0)
-
-    # Normalize
-    edge_strength = edge_strength / edge_strength.max() if edge_strength.max() > 0 else edge_strength
-
-    # Find peaks in edge strength (potential letter boundaries)
-    from scipy.signal import find_peaks
-    peaks, _ = find_peaks(edge_strength, height=edge_threshold, distance=10)
-
-    # Look for peaks in left and right thirds
-    left_third = w // 3
-    right_two_thirds = 2 * w // 3
-
-    left_peaks = peaks[peaks < left_third]
-    right_peaks = peaks[peaks > right_two_thirds]
-
-    # Pick the strongest peak in each region
-    left_mask_end = None
-    right_mask_start = None
-
-    if len(left_peaks) > 0:
-        strongest_left = left_peaks[np.argmax(edge_strength[left_peaks])]
-        left_mask_end = strongest_left
-
-    if len(right_peaks) > 0:
-        strongest_right = right_peaks[np.argmax(edge_strength[right_peaks])]
-        right_mask_start = strongest_right
-
-    return left_mask_end, right_mask_start, {
-        "edge_strength": edge_strength,
-        "peaks": peaks,
-    }
-
-
 # ============================================================================
 # Visualization
 # ============================================================================
 def visualize_result(img_array, left_mask, right_mask, algo_name, debug_data, output_path,
-                      top_mask=None, bottom_mask=None, shape_mask=None):
+                      top_mask=None, bottom_mask=None, shape_mask=None, compress_level=None):
     """Create visualization showing original + mask regions"""
     h, w = img_array.shape[:2]
 
@@ -812,13 +212,12 @@ def visualize_result(img_array, left_mask, right_mask, algo_name, debug_data, ou
 
     # Save
     result_rgb = result.convert('RGB') if result.mode == 'RGBA' else result
-    result_rgb.save(output_path)
-    print(f"  Saved: {output_path}")
+    result_rgb.save(output_path, **png_options(compress_level))
 
     return result
 
 
-def create_comparison_image(img_array, results, output_path):
+def create_comparison_image(img_array, results, output_path, compress_level=None):
     """Create side-by-side comparison of all algorithms"""
     h, w = img_array.shape[:2]
 
@@ -888,18 +287,168 @@ def create_comparison_image(img_array, results, output_path):
             draw.text((x_offset + 5, 16), lr_info, fill=(150, 50, 50))
             draw.text((x_offset + 5, 28), tb_info, fill=(50, 50, 150))
 
-    comparison.save(output_path)
-    print(f"  Comparison saved: {output_path}")
+    comparison.save(output_path, **png_options(compress_level))
+
+
+def png_options(compress_level):
+    """PIL save kwargs; None keeps PIL's default zlib level (6)"""
+    return {} if compress_level is None else {"compress_level": compress_level}
+
+
+# ============================================================================
+# Pipelined I/O
+# ============================================================================
+def _load_or_error(loader, path):
+    """loader(path), or the exception it raised"""
+    try:
+        return loader(path)
+    except Exception as e:
+        return e
+
+
+class Prefetcher:
+    """
+    Decode images on a reader pool, keeping at most `depth` loads in flight.
+    Iterating yields (path, loaded) in input order; a failed load is yielded
+    as the exception instead of raising, so one bad file doesn't stop the run.
+    """
+
+    def __init__(self, paths, loader, workers=2, depth=4):
+        self.paths = list(paths)
+        self.loader = loader
+        self.depth = max(depth, 1)
+        self.pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="reader")
+        self.stall = 0.0  # seconds the consumer waited on a load
+
+    def __iter__(self):
+        pending = deque()
+        remaining = iter(self.paths)
+
+        def schedule():
+            path = next(remaining, None)
+            if path is not None:
+                pending.append((path, self.pool.submit(_load_or_error, self.loader, path)))
+
+        try:
+            for _ in range(self.depth):
+                schedule()
+            while pending:
+                path, future = pending.popleft()
+                schedule()  # keep `depth` loads in flight while this one is consumed
+                started = time.perf_counter()
+                loaded = future.result()
+                self.stall += time.perf_counter() - started
+                yield path, loaded
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class BackgroundWriter:
+    """
+    Run render/encode/save jobs on a writer pool. submit() blocks once
+    `max_pending` jobs are queued or running, which bounds the memory held by
+    finished results. Errors are reported, not raised.
+
+    Each job's message (or its error) is queued when it finishes and printed
+    by report() on the caller's thread, so writer threads never print into
+    the middle of the analysis log.
+    """
+
+    def __init__(self, workers=2, max_pending=8):
+        self.pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="writer")
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.stall = 0.0  # seconds the producer waited for a free slot
+        self.errors = []
+        self.messages = queue.SimpleQueue()
+
+    def submit(self, message, fn, *args, **kwargs):
+        started = time.perf_counter()
+        self.slots.acquire()
+        self.stall += time.perf_counter() - started
+        future = self.pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda done: self._done(done, message))
+        return future
+
+    def _done(self, future, message):
+        self.slots.release()
+        error = future.exception()
+        if error is not None:
+            self.errors.append(error)
+            message = f"    WRITE ERROR: {error}"
+        self.messages.put(message)
+
+    def report(self):
+        """Print the messages of finished jobs; call from the logging thread"""
+        while True:
+            try:
+                print(self.messages.get_nowait())
+            except queue.Empty:
+                return
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.report()
+
+
+class InlineWriter:
+    """BackgroundWriter interface that runs jobs on the caller's thread (--serial)"""
+
+    def __init__(self):
+        self.stall = 0.0  # here: all of the write time
+        self.errors = ()
+
+    def submit(self, message, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            self.stall += time.perf_counter() - started
+        print(message)
+        return result
+
+    def report(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class InlineReader:
+    """Prefetcher interface that loads on the caller's thread (--serial)"""
+
+    def __init__(self, paths, loader):
+        self.paths = list(paths)
+        self.loader = loader
+        self.stall = 0.0  # here: all of the load time
+
+    def __iter__(self):
+        for path in self.paths:
+            started = time.perf_counter()
+            loaded = _load_or_error(self.loader, path)
+            self.stall += time.perf_counter() - started
+            yield path, loaded
 
 
 # ============================================================================
 # Main
 # ============================================================================
 def main():
+    parser = argparse.ArgumentParser(description="Run sanitize algorithms over the test screenshots")
+    parser.add_argument("--readers", type=int, default=2, help="decode threads")
+    parser.add_argument("--prefetch", type=int, default=4, help="images decoded ahead of the analysis loop")
+    parser.add_argument("--writers", type=int, default=2, help="render/encode/save threads")
+    parser.add_argument("--max-pending-writes", type=int, default=16, help="queued renders before analysis waits")
+    parser.add_argument("--compress-level", type=int, choices=range(10), default=None, metavar="0-9",
+                        help="PNG zlib level for outputs (default: PIL's 6; 1 is much faster)")
+    parser.add_argument("--serial", action="store_true", help="no I/O threads (load, analyze, save in turn)")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("SANITIZE BOX ALGORITHM TEST")
     print("=" * 60)
 
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
     # Test connected_components with various settings
     algorithms = [
         # No dilation baseline
@@ -910,18 +459,37 @@ def main():
         ("cc_1.5%", lambda img: algo_connected_components(img, dilation_percent=1.5)),
         ("cc_2%", lambda img: algo_connected_components(img, dilation_percent=2.0)),
         ("cc_3%", lambda img: algo_connected_components(img, dilation_percent=3.0)),
+        # All seven algorithms voting over one shared context
+        ("ensemble", lambda img: algo_ensemble(img, cc_options={"dilation_percent": 1.0})),
     ]
 
+    image_paths = []
     for img_path in TEST_IMAGES:
         if not os.path.exists(img_path):
             print(f"\nSkipping {img_path} - not found")
             continue
+        image_paths.append(img_path)
+
+    if args.serial:
+        images, writer = InlineReader(image_paths, load_image), InlineWriter()
+    else:
+        images = Prefetcher(image_paths, load_image, workers=args.readers, depth=args.prefetch)
+        writer = BackgroundWriter(workers=args.writers, max_pending=args.max_pending_writes)
 
+    started = time.perf_counter()
+    analysis_time = 0.0
+
+    for img_path, loaded in images:
+        writer.report()
         print(f"\n{'=' * 60}")
         print(f"Processing: {img_path}")
         print("=" * 60)
 
-        img_array, img_pil = load_image(img_path)
+        if isinstance(loaded, Exception):
+            print(f"  ERROR loading: {loaded}")
+            continue
+        img_array, img_pil = loaded
+        analysis_started = time.perf_counter()
         h, w = img_array.shape[:2]
         print(f"  Size: {w}x{h}")
         print(f"  Text appears: {'dark on light' if detect_text_color(img_array) else 'light on dark'}")
@@ -963,6 +531,13 @@ def main():
                     bottom_mask = masks["bottom"]
                     print(f"    Left: {left_mask}, Right: {right_mask}")
                     print(f"    Top: {top_mask}, Bottom: {bottom_mask}")
+                elif algo_name == "ensemble":
+                    # Returns shape mask (per-pixel vote)
+                    shape_mask, debug = algo_func(img_array)
+                    voted = [name for name, hit in debug.get("voters", {}).items() if hit]
+                    masked = shape_mask.sum() if shape_mask is not None else 0
+                    print(f"    Voters with intruders: {', '.join(voted) or 'none'}")
+                    print(f"    Masked pixels: {masked} ({masked / (h * w) * 100:.1f}%)")
                 elif algo_name == "connected_components":
                     # Returns shape mask (pixel-level)
                     shape_mask, debug = algo_func(img_array)
@@ -980,10 +555,12 @@ def main():
                     print(f"    Left mask end: {left_mask}")
                     print(f"    Right mask start: {right_mask}")
 
-                # Save individual result
+                # Save individual result (rendered and encoded off the analysis thread)
                 output_path = OUTPUT_DIR / f"{img_name}_{algo_name}.png"
-                visualize_result(img_array, left_mask, right_mask, algo_name, debug, output_path,
-                               top_mask=top_mask, bottom_mask=bottom_mask, shape_mask=shape_mask)
+                writer.submit(f"  Saved: {output_path}", visualize_result,
+                              img_array, left_mask, right_mask, algo_name, debug, output_path,
+                              top_mask=top_mask, bottom_mask=bottom_mask, shape_mask=shape_mask,
+                              compress_level=args.compress_level)
 
                 results.append((algo_name, left_mask, right_mask, debug, top_mask, bottom_mask, shape_mask))
 
@@ -995,9 +572,21 @@ def main():
 
         # Create comparison image
         comparison_path = OUTPUT_DIR / f"{img_name}_comparison.png"
-        create_comparison_image(img_array, results, comparison_path)
+        writer.submit(f"  Comparison saved: {comparison_path}", create_comparison_image,
+                      img_array, results, comparison_path, compress_level=args.compress_level)
+        analysis_time += time.perf_counter() - analysis_started
+
+    analysis_end = time.perf_counter()
+    writer.close()
+    total = time.perf_counter() - started
+    read_stall = images.stall
 
     print("\n" + "=" * 60)
+    # Time blocked on a full write queue happened inside the analysis loop
+    print(f"Wall {total:.2f}s: analysis {analysis_time - writer.stall:.2f}s, waited on reads {read_stall:.2f}s, "
+          f"on write queue {writer.stall:.2f}s, write drain {total - (analysis_end - started):.2f}s")
+    if writer.errors:
+        print(f"{len(writer.errors)} output(s) failed to write")
     print("DONE! Results saved to:", OUTPUT_DIR)
     print("=" * 60)
 
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Out-of-core tiled connected-component labeling.
+
+ndimage.label needs the whole binary image (plus an int32 label map) in RAM,
+which runs out of memory on our largest page scans. This labels fixed-size
+tiles independently, optionally in parallel, then stitches labels across tile
+seams with a union-find. The result is identical to a single-shot
+ndimage.label on the full image, numbering included: components are
+numbered by the raster position of their first pixel, just like scipy.
+
+Two passes over the tiles:
+  1. label each tile, keep only its border rows/cols and per-component stats
+     (area, bbox, centroid sums, first raster index)
+  2. (optional) re-label each tile and write global labels through a lookup
+     table into the output, which may be a .npy memmap
+
+Peak memory is a few tile-sized arrays per worker plus the border vectors and
+the per-component tables, independent of page size.
+
+Run:
+  python3 -u scripts/tiled_labeling.py page.png --tile 2048 --out labels.npy
+  python3 -u scripts/tiled_labeling.py page_gray.npy --workers 4 --verify
+"""
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from sanitize_algorithms import filters, ndimage
+
+
+# ============================================================================
+# Tile readers
+# ============================================================================
+class ArrayTileReader:
+    """Tiles from an in-memory (or memmapped) bool array. Thread pools only."""
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.shape = binary.shape
+
+    def read(self, y0, y1, x0, x1):
+        return np.asarray(self.binary[y0:y1, x0:x1], dtype=bool)
+
+
+class NpyTileReader:
+    """
+    Thresholds tiles of a uint8 grayscale .npy file on demand.
+
+    Opens the file as a memmap lazily, so it pickles as a path and works with
+    process pools. threshold/dark_text come from page_threshold() if omitted.
+    """
+
+    def __init__(self, path, threshold=None, dark_text=None):
+        self.path = str(path)
+        self._gray = None
+        self.shape = self.gray.shape
+        if threshold is None or dark_text is None:
+            auto_threshold, auto_dark = page_threshold(self.gray)
+            threshold = auto_threshold if threshold is None else threshold
+            dark_text = auto_dark if dark_text is None else dark_text
+        self.threshold = threshold
+        self.dark_text = dark_text
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = np.load(self.path, mmap_mode="r")
+        return self._gray
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_gray"] = None
+        return state
+
+    def read(self, y0, y1, x0, x1):
+        tile = self.gray[y0:y1, x0:x1]
+        return tile < self.threshold if self.dark_text else tile > self.threshold
+
+
+def page_threshold(gray, band_rows=1024):
+    """
+    Otsu threshold of a uint8 page from a histogram streamed in row bands.
+    Text is assumed to be the minority side, which picks dark_text.
+    Returns (threshold, dark_text).
+    """
+    hist = np.zeros(256, dtype=np.int64)
+    for y in range(0, gray.shape[0], band_rows):
+        hist += np.bincount(np.asarray(gray[y:y + band_rows]).ravel(), minlength=256)[:256]
+
+    threshold = filters.threshold_otsu(hist=(hist, np.arange(256)))
+    below = hist[:int(np.floor(threshold)) + 1].sum()
+    return threshold, below < hist.sum() - below
+
+
+def image_to_gray_npy(image_path, npy_path):
+    """
+    Decode an image once into a uint8 grayscale .npy (1 byte/pixel) so later
+    passes can memmap it. PIL has to decode the whole image here; after this
+    step nothing holds more than a tile.
+    """
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None  # Gigapixel scans are the point
+    gray = np.asarray(Image.open(image_path).convert("L"))
+    out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.uint8, shape=gray.shape)
+    out[:] = gray
+    out.flush()
+    return npy_path
+
+
+# ============================================================================
+# Union-find
+# ============================================================================
+class UnionFind:
+    """Array-backed union-find over ids 0..n-1 (0 = background, never unioned)"""
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Keep the smaller id as root; any choice works, this is deterministic
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+    def roots(self):
+        """Fully compressed root of every id, vectorized"""
+        parent = self.parent
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return parent
+            parent = grand
+
+
+# ============================================================================
+# Tiling
+# ============================================================================
+def _structure(connectivity):
+    return ndimage.generate_binary_structure(2, connectivity)
+
+
+def tile_grid(shape, tile_size):
+    """[(row, col, y0, y1, x0, x1)] covering shape"""
+    h, w = shape
+    return [
+        (r, c, y0, min(y0 + tile_size, h), x0, min(x0 + tile_size, w))
+        for r, y0 in enumerate(range(0, h, tile_size))
+        for c, x0 in enumerate(range(0, w, tile_size))
+    ]
+
+
+def scan_tile(reader, tile, width, connectivity):
+    """Pass 1 for one tile: local labels reduced to borders + per-label stats"""
+    r, c, y0, y1, x0, x1 = tile
+    labeled, n = ndimage.label(reader.read(y0, y1, x0, x1), _structure(connectivity))
+
+    flat = labeled.ravel()
+    rows, cols = np.divmod(np.arange(flat.size), x1 - x0)
+    area = np.bincount(flat, minlength=n + 1)[1:]
+    row_sum = np.bincount(flat, weights=rows + y0, minlength=n + 1)[1:]
+    col_sum = np.bincount(flat, weights=cols + x0, minlength=n + 1)[1:]
+
+    # ndimage numbers labels in raster order, so the first occurrence of each
+    # label is also its smallest global raster index within this tile
+    labels, first = np.unique(flat, return_index=True)
+    first_rows, first_cols = np.divmod(first[labels > 0], x1 - x0)
+    first_index = (first_rows + y0).astype(np.int64) * width + first_cols + x0
+
+    bbox = np.zeros((n, 4), dtype=np.int64)
+    for i, slices in enumerate(ndimage.find_objects(labeled)):
+        bbox[i] = (slices[0].start + y0, slices[1].start + x0, slices[0].stop - 1 + y0, slices[1].stop - 1 + x0)
+
+    return {
+        "tile": tile,
+        "count": n,
+        "top": labeled[0].copy(),
+        "bottom": labeled[-1].copy(),
+        "left": labeled[:, 0].copy(),
+        "right": labeled[:, -1].copy(),
+        "area": area.astype(np.int64),
+        "row_sum": row_sum,
+        "col_sum": col_sum,
+        "first_index": first_index,
+        "bbox": bbox,
+    }
+
+
+def _seam_pairs(a, b, a_offset, b_offset, diagonal):
+    """Global id pairs connected across a seam (a and b are facing border vectors)"""
+    shifts = (0, -1, 1) if diagonal else (0,)
+    pairs = []
+    n = len(a)
+    for shift in shifts:
+        # a[i] touches b[i + shift]
+        lo, hi = max(0, -shift), min(n, n - shift)
+        aa, bb = a[lo:hi], b[lo + shift:hi + shift]
+        hit = (aa > 0) & (bb > 0)
+        if hit.any():
+            pairs.append(np.stack([aa[hit] + a_offset, bb[hit] + b_offset], axis=1))
+    return pairs
+
+
+def stitch(scans, connectivity):
+    """Union components across seams; returns (UnionFind, offsets by (row, col))"""
+    offsets = {}
+    total = 1
+    for scan in scans:
+        r, c = scan["tile"][:2]
+        offsets[(r, c)] = total - 1
+        total += scan["count"]
+
+    by_pos = {scan["tile"][:2]: scan for scan in scans}
+    diagonal = connectivity == 2
+    pairs = []
+    for (r, c), scan in by_pos.items():
+        off = offsets[(r, c)]
+        right = by_pos.get((r, c + 1))
+        if right is not None:
+            pairs += _seam_pairs(scan["right"], right["left"], off, offsets[(r, c + 1)], diagonal)
+        below = by_pos.get((r + 1, c))
+        if below is not None:
+            pairs += _seam_pairs(scan["bottom"], below["top"], off, offsets[(r + 1, c)], diagonal)
+        if diagonal:
+            # Corner pixels touching diagonally across four tiles
+            below_right = by_pos.get((r + 1, c + 1))
+            if below_right is not None and scan["bottom"][-1] and below_right["top"][0]:
+                pairs.append(np.array([[scan["bottom"][-1] + off, below_right["top"][0] + offsets[(r + 1, c + 1)]]]))
+            below_left = by_pos.get((r + 1, c - 1))
+            if below_left is not None and scan["bottom"][0] and below_left["top"][-1]:
+                pairs.append(np.array([[scan["bottom"][0] + off, below_left["top"][-1] + offsets[(r + 1, c - 1)]]]))
+
+    uf = UnionFind(total)
+    if pairs:
+        for a, b in np.unique(np.concatenate(pairs).astype(np.int64), axis=0):
+            uf.union(a, b)
+    return uf, offsets
+
+
+def build_components(scans, uf, offsets):
+    """
+    Merge per-tile stats into one table per global component and number the
+    components in raster order of their first pixel (scipy's numbering).
+    Returns (components dict of arrays, lookup table gid -> final label).
+    """
+    total = len(uf.parent)
+    gid_first = np.full(total, np.iinfo(np.int64).max, dtype=np.int64)
+    gid_area = np.zeros(total, dtype=np.int64)
+    gid_row_sum = np.zeros(total)
+    gid_col_sum = np.zeros(total)
+    gid_bbox = np.zeros((total, 4), dtype=np.int64)
+    for scan in scans:
+        off = offsets[scan["tile"][:2]]
+        ids = slice(off + 1, off + 1 + scan["count"])
+        gid_first[ids] = scan["first_index"]
+        gid_area[ids] = scan["area"]
+        gid_row_sum[ids] = scan["row_sum"]
+        gid_col_sum[ids] = scan["col_sum"]
+        gid_bbox[ids] = scan["bbox"]
+
+    roots = uf.roots()
+    ids = np.arange(1, total)
+    root_of = roots[ids]
+
+    first = np.full(total, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, root_of, gid_first[ids])
+    area = np.bincount(root_of, weights=gid_area[ids], minlength=total).astype(np.int64)
+    row_sum = np.bincount(root_of, weights=gid_row_sum[ids], minlength=total)
+    col_sum = np.bincount(root_of, weights=gid_col_sum[ids], minlength=total)
+    bbox = np.zeros((total, 4), dtype=np.int64)
+    bbox[:, :2] = np.iinfo(np.int64).max
+    np.minimum.at(bbox[:, 0], root_of, gid_bbox[ids, 0])
+    np.minimum.at(bbox[:, 1], root_of, gid_bbox[ids, 1])
+    np.maximum.at(bbox[:, 2], root_of, gid_bbox[ids, 2])
+    np.maximum.at(bbox[:, 3], root_of, gid_bbox[ids, 3])
+
+    unique_roots = np.unique(root_of)
+    order = unique_roots[np.argsort(first[unique_roots], kind="stable")]
+
+    root_label = np.zeros(total, dtype=np.int32)
+    root_label[order] = np.arange(1, len(order) + 1, dtype=np.int32)
+    lut = np.zeros(total, dtype=np.int32)
+    lut[ids] = root_label[root_of]
+
+    components = {
+        "label": np.arange(1, len(order) + 1, dtype=np.int32),
+        "area": area[order],
+        "centroid_row": row_sum[order] / area[order],
+        "centroid_col": col_sum[order] / area[order],
+        "min_row": bbox[order, 0],
+        "min_col": bbox[order, 1],
+        "max_row": bbox[order, 2],
+        "max_col": bbox[order, 3],
+    }
+    return components, lut
+
+
+def write_tile(reader, tile, connectivity, tile_lut, out):
+    """Pass 2 for one tile: re-label and write global labels"""
+    r, c, y0, y1, x0, x1 = tile
+    labeled, _ = ndimage.label(reader.read(y0, y1, x0, x1), _structure(connectivity))
+    out[y0:y1, x0:x1] = tile_lut[labeled]
+
+
+def _tile_lut(lut, offset, count):
+    tile_lut = np.zeros(count + 1, dtype=np.int32)
+    tile_lut[1:] = lut[offset + 1:offset + 1 + count]
+    return tile_lut
+
+
+def label_tiled(reader, tile_size=2048, connectivity=1, workers=1, processes=False,
+                return_labels=True, out_path=None):
+    """
+    Label the binary image behind `reader` tile by tile.
+
+    Parameters:
+    - reader: ArrayTileReader / NpyTileReader (anything with .shape and .read)
+    - connectivity: 1 = 4-connected (ndimage.label default), 2 = 8-connected
+    - workers / processes: parallelism for both passes
+    - return_labels: False skips pass 2 and returns only the component table
+    - out_path: write labels to this .npy memmap instead of an in-memory array
+
+    Returns (labels or None, num_features, components)
+    """
+    h, w = reader.shape
+    tiles = tile_grid((h, w), tile_size)
+
+    pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_cls(max_workers=max(1, workers)) as pool:
+        scans = list(pool.map(scan_tile, [reader] * len(tiles), tiles, [w] * len(tiles), [connectivity] * len(tiles)))
+
+    uf, offsets = stitch(scans, connectivity)
+    components, lut = build_components(scans, uf, offsets)
+    num_features = len(components["label"])
+
+    if not return_labels:
+        return None, num_features, components
+
+    if out_path is not None:
+        labels = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.int32, shape=(h, w))
+    else:
+        labels = np.zeros((h, w), dtype=np.int32)
+
+    # Tiles don't overlap, so threads can write into the shared output directly
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(
+            lambda scan: write_tile(reader, scan["tile"], connectivity,
+                                    _tile_lut(lut, offsets[scan["tile"][:2]], scan["count"]), labels),
+            scans,
+        ))
+
+    if out_path is not None:
+        labels.flush()
+    return labels, num_features, components
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def label_npy(npy_path, args):
+    """Label a grayscale .npy with the command-line options; returns the exit code"""
+    reader = NpyTileReader(npy_path, threshold=args.threshold)
+    print(f"Page {reader.shape[1]}x{reader.shape[0]}, threshold {reader.threshold:.1f}, "
+          f"{'dark' if reader.dark_text else 'light'} text, tile {args.tile}")
+
+    started = time.perf_counter()
+    labels, num_features, components = label_tiled(
+        reader,
+        tile_size=args.tile,
+        connectivity=args.connectivity,
+        workers=args.workers,
+        processes=args.processes,
+        return_labels=args.out is not None or args.verify,
+        out_path=args.out,
+    )
+    print(f"Tiled: {num_features} components in {time.perf_counter() - started:.2f}s")
+    if len(components["area"]):
+        print(f"  Largest component: {components['area'].max()} px")
+
+    if args.verify:
+        started = time.perf_counter()
+        binary = reader.read(0, reader.shape[0], 0, reader.shape[1])
+        expected, expected_n = ndimage.label(binary, _structure(args.connectivity))
+        print(f"Single-shot: {expected_n} components in {time.perf_counter() - started:.2f}s")
+        same = expected_n == num_features and np.array_equal(expected, labels)
+        print("Labels identical" if same else "MISMATCH against ndimage.label")
+        return 0 if same else 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled connected-component labeling for large pages")
+    parser.add_argument("input", type=Path, help="image file or uint8 grayscale .npy")
+    parser.add_argument("--tile", type=int, default=2048, help="tile side (px)")
+    parser.add_argument("--connectivity", type=int, choices=(1, 2), default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--processes", action="store_true", help="use a process pool for pass 1")
+    parser.add_argument("--threshold", type=float, default=None, help="fixed threshold (default: page Otsu)")
+    parser.add_argument("--out", type=Path, default=None, help="write labels to this .npy (memmap)")
+    parser.add_argument("--verify", action="store_true", help="compare against single-shot ndimage.label")
+    parser.add_argument("--work-dir", type=Path, default=None,
+                        help="scratch directory for the decoded grayscale (default: system temp dir)")
+    args = parser.parse_args()
+
+    # Images are decoded to a grayscale .npy in a scratch directory that is
+    # removed afterwards, never next to the input
+    with tempfile.TemporaryDirectory(prefix="tiled-labeling-", dir=args.work_dir) as work_dir:
+        npy_path = args.input
+        if args.input.suffix != ".npy":
+            npy_path = Path(work_dir) / f"{args.input.stem}.gray.npy"
+            print(f"Decoding {args.input.name} -> {npy_path}")
+            image_to_gray_npy(args.input, npy_path)
+        return label_npy(npy_path, args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
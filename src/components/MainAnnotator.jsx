@@ -13,7 +13,7 @@ import CharacterEditModal from './modals/CharacterEditModal';
 import BaselinePickerModal from './modals/BaselinePickerModal';
 import useAnnotatorStore from '../store/useAnnotatorStore';
 import { processAutoSolveRegions, processSelectedLineGroups } from '../utils/autoSolve';
-import { sanitizeBox } from '../utils/sanitizeBox';
+import { sanitizeBoxPreferRemote } from '../utils/sanitizeBox';
 import { useAutoSave } from '../hooks/useAutoSave';
 
 export default function MainAnnotator() {
@@ -199,20 +199,23 @@ export default function MainAnnotator() {
     const currentBoxCount = useAnnotatorStore.getState().boxes.length;
     newBoxes.forEach((box) => addBox(box));
 
-    // Auto-sanitize each new box
+    // Auto-sanitize each new box (on the analysis server when it's running)
     if (image) {
-      const updatedBoxes = useAnnotatorStore.getState().boxes;
-      for (let i = currentBoxCount; i < updatedBoxes.length; i++) {
-        const box = updatedBoxes[i];
-        try {
-          const result = sanitizeBox(image, box);
-          if (result.hasChanges) {
-            setBoxEraseMask(i, result.eraseMask);
+      const addedBoxes = useAnnotatorStore.getState().boxes.slice(currentBoxCount);
+      (async () => {
+        for (const box of addedBoxes) {
+          try {
+            const result = await sanitizeBoxPreferRemote(image, box);
+            // Boxes can change while a result is pending; only update this box if it's still there
+            const index = useAnnotatorStore.getState().boxes.indexOf(box);
+            if (result.hasChanges && index !== -1) {
+              setBoxEraseMask(index, result.eraseMask);
+            }
+          } catch (err) {
+            console.warn(`⚠️ Failed to sanitize box for '${box.char}':`, err);
           }
-        } catch (err) {
-          console.warn(`⚠️ Failed to sanitize box for '${box.char}':`, err);
         }
-      }
+      })();
     }
 
     // Add baselines (only if no baselines exist yet)
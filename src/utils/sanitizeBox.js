@@ -252,19 +252,12 @@ function dilateMask(mask, width, height, radius) {
 }
 
 /**
- * Main analysis function using connected components
+ * Extract the pixels under a box via an offscreen canvas
  * @param {HTMLImageElement} image - Source image
  * @param {Object} box - Box with x, y, width, height
- * @param {Object} options - Configuration options
- * @returns {Object} { intruderMask, hasIntruders, components, debugData }
+ * @returns {ImageData}
  */
-export function analyzeBoxForIntruders(image, box, options = {}) {
-  const {
-    dilationPercent = 2.5,  // Percentage of min dimension for dilation
-    minAreaRatio = 0.0005,   // Minimum component area to consider
-  } = options;
-
-  // Create offscreen canvas to extract pixel data
+function getBoxImageData(image, box) {
   const canvas = document.createElement('canvas');
   canvas.width = box.width;
   canvas.height = box.height;
@@ -277,8 +270,23 @@ export function analyzeBoxForIntruders(image, box, options = {}) {
     0, 0, box.width, box.height
   );
 
-  // Get pixel data
-  const imageData = ctx.getImageData(0, 0, box.width, box.height);
+  return ctx.getImageData(0, 0, box.width, box.height);
+}
+
+/**
+ * Main analysis function using connected components
+ * @param {HTMLImageElement} image - Source image
+ * @param {Object} box - Box with x, y, width, height
+ * @param {Object} options - Configuration options
+ * @returns {Object} { intruderMask, hasIntruders, components, debugData }
+ */
+export function analyzeBoxForIntruders(image, box, options = {}) {
+  const {
+    dilationPercent = 2.5,  // Percentage of min dimension for dilation
+    minAreaRatio = 0.0005,   // Minimum component area to consider
+  } = options;
+
+  const imageData = getBoxImageData(image, box);
   const { data, width, height } = imageData;
 
   // Convert to grayscale
@@ -574,3 +582,117 @@ export function getIntruderMaskImageData(analysis) {
 
   return imageData;
 }
+
+const SANITIZE_SERVER_URL = 'http://127.0.0.1:8765';
+// How long a /health answer (either way) is trusted before asking again
+const HEALTH_RECHECK_MS = 30000;
+// serverUrl -> { checkedAt, available: Promise<boolean> }
+const serverHealth = new Map();
+
+/**
+ * Whether the local analysis server answers /health (cached per URL)
+ * @param {Object} options - serverUrl, healthTimeoutMs
+ * @returns {Promise<boolean>}
+ */
+export function isSanitizeServerAvailable(options = {}) {
+  const { serverUrl = SANITIZE_SERVER_URL, healthTimeoutMs = 500 } = options;
+  const cached = serverHealth.get(serverUrl);
+  if (cached && Date.now() - cached.checkedAt < HEALTH_RECHECK_MS) {
+    return cached.available;
+  }
+
+  const available = fetch(`${serverUrl}/health`, { signal: AbortSignal.timeout(healthTimeoutMs) })
+    .then((response) => response.ok)
+    .catch(() => false);
+  serverHealth.set(serverUrl, { checkedAt: Date.now(), available });
+  return available;
+}
+
+/**
+ * Sanitize a box using the local analysis server (scripts/sanitize_server.py)
+ * Keeps the pixel work off the main thread. Falls back to the in-browser
+ * sanitizeBox() if the server is unreachable, slow or returns an error.
+ *
+ * The server runs the Python algo_connected_components() (Otsu threshold,
+ * skimage morphology), not analyzeBoxForIntruders(), with the same
+ * dilationPercent / minAreaRatio defaults. Masks are close to the local ones
+ * but not pixel-identical.
+ * @param {HTMLImageElement} image - Source image
+ * @param {Object} box - Box with x, y, width, height
+ * @param {Object} options - Configuration options (same as sanitizeBox, plus serverUrl/timeoutMs)
+ * @returns {Promise<Object>} { eraseMask, analysis, hasChanges }
+ */
+export async function sanitizeBoxRemote(image, box, options = {}) {
+  const {
+    serverUrl = SANITIZE_SERVER_URL,
+    timeoutMs = 2000,
+    dilationPercent = 2.5,
+    minAreaRatio = 0.0005,
+  } = options;
+
+  try {
+    const imageData = getBoxImageData(image, box);
+    const { width, height } = imageData;
+    const params = new URLSearchParams({
+      dilation_percent: dilationPercent,
+      min_area_ratio: minAreaRatio,
+    });
+
+    const response = await fetch(`${serverUrl}/sanitize?${params}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'X-Width': String(width),
+        'X-Height': String(height),
+      },
+      body: imageData.data,
+      signal: AbortSignal.timeout(timeoutMs),
+    });
+    if (!response.ok) throw new Error(`Sanitize server returned ${response.status}`);
+
+    const numIntruders = parseInt(response.headers.get('X-Intruders') || '0', 10);
+    let intruderMask = null;
+
+    if (numIntruders > 0) {
+      // Unpack 8 pixels per byte, MSB first
+      const packed = new Uint8Array(await response.arrayBuffer());
+      intruderMask = new Uint8Array(width * height);
+      for (let i = 0; i < intruderMask.length; i++) {
+        intruderMask[i] = (packed[i >> 3] >> (7 - (i & 7))) & 1;
+      }
+    }
+
+    const analysis = {
+      intruderMask,
+      hasIntruders: intruderMask !== null,
+      debugData: { width, height, serverTiming: response.headers.get('Server-Timing') },
+    };
+    const eraseMask = generateEraseMask(intruderMask, width, height, box.x, box.y);
+
+    return {
+      eraseMask,
+      analysis,
+      hasChanges: eraseMask !== null,
+    };
+  } catch (err) {
+    console.warn('⚠️ Sanitize server unavailable, analyzing locally:', err.message);
+    // Don't keep sending crops to a server that just failed
+    serverHealth.set(serverUrl, { checkedAt: Date.now(), available: Promise.resolve(false) });
+    return sanitizeBox(image, box, options);
+  }
+}
+
+/**
+ * Sanitize on the analysis server when its /health answers, otherwise
+ * locally with sanitizeBox()
+ * @param {HTMLImageElement} image - Source image
+ * @param {Object} box - Box with x, y, width, height
+ * @param {Object} options - Configuration options (as for sanitizeBoxRemote)
+ * @returns {Promise<Object>} { eraseMask, analysis, hasChanges }
+ */
+export async function sanitizeBoxPreferRemote(image, box, options = {}) {
+  if (await isSanitizeServerAvailable(options)) {
+    return sanitizeBoxRemote(image, box, options);
+  }
+  return sanitizeBox(image, box, options);
+}